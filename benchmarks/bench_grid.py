@@ -0,0 +1,118 @@
+#Benchmark of the face grid (magiccore.spatial) against going through every
+#face, on the demo models and on synthetic models of growing size.
+#
+#   python benchmarks/bench_grid.py --sizes 10000 100000 -o grid.json
+#
+#The queries are points close to the surface (a fingertip on the model) and
+#points anywhere in the bounding box of the model. Every answer of the grid is
+#checked against the brute force one, and the benchmark stops if one differs.
+#"batched" is the time per point of a single nearestMany call on all of them
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+sys.path.insert(0, HERE)
+
+import magiccore
+from magiccore.spatial import tableFaceGrid, triangleDistance
+from synthetic import makeSyntheticModel
+import fixtures
+
+#the nearest face going through all of them, the baseline
+def bruteNearest(grid, point):
+    distance = triangleDistance(point, grid.triangles)
+    face = int(np.argmin(distance))
+    return face, grid.labels[grid.faceLabel[face]], float(distance[face])
+
+#points within `noise` of random points of random faces, and points anywhere in
+#the bounding box of the model (grown by a fifth)
+def queryPoints(triangles, count, seed=0):
+    rng = np.random.RandomState(seed)
+    faces = rng.randint(0, len(triangles), count)
+    uv = rng.rand(count, 2)
+    flip = uv.sum(axis=1) > 1
+    uv[flip] = 1 - uv[flip]
+    corners = triangles[faces]
+    surface = (corners[:, 0] + uv[:, :1] * (corners[:, 1] - corners[:, 0]) +
+               uv[:, 1:] * (corners[:, 2] - corners[:, 0]))
+    lower = triangles.min(axis=(0, 1))
+    upper = triangles.max(axis=(0, 1))
+    extent = upper - lower
+    surface += rng.randn(count, 3) * 0.01 * extent.max()
+    box = lower - 0.1 * extent + rng.rand(count, 3) * 1.2 * extent
+    return {'surface': surface, 'box': box}
+
+def timeQueries(nearest, points):
+    start = time.perf_counter()
+    results = [nearest(point) for point in points]
+    return (time.perf_counter() - start) / len(points), results
+
+def benchModel(name, buffers, count):
+    reader = magiccore.blenderReader(buffers)
+    start = time.perf_counter()
+    grid = tableFaceGrid(reader.faces)
+    build = time.perf_counter() - start
+
+    result = {'name': name, 'faces': len(grid), 'cells': int(grid.dims.prod()),
+              'build_seconds': build, 'queries': {}}
+    for kind, points in queryPoints(grid.triangles, count).items():
+        gridTime, gridResults = timeQueries(grid.nearest, points)
+        ### all the points in one nearestMany call
+        start = time.perf_counter()
+        manyResults = list(zip(*grid.nearestMany(points)))
+        manyTime = (time.perf_counter() - start) / len(points)
+        if manyResults != gridResults:
+            raise AssertionError("%s: nearestMany differs from nearest" % name)
+        ### the brute force is slow on the big models, fewer points are enough
+        bruteCount = max(1, min(len(points), int(2e6 // max(len(grid), 1))))
+        bruteTime, bruteResults = timeQueries(lambda point: bruteNearest(grid, point), points[:bruteCount])
+        for got, want in zip(gridResults, bruteResults):
+            if got[0] != want[0] or abs(got[2] - want[2]) > 1e-9:
+                raise AssertionError("%s: the grid found face %d at %r, the brute force face %d at %r" %
+                                     (name, got[0], got[2], want[0], want[2]))
+        result['queries'][kind] = {'grid_us': gridTime * 1e6, 'many_us': manyTime * 1e6,
+                                   'brute_us': bruteTime * 1e6, 'speedup': bruteTime / max(gridTime, 1e-12)}
+    return result
+
+def printResult(result):
+    line = "%-18s %8d faces  build %.3fs" % (result['name'], result['faces'], result['build_seconds'])
+    for kind, times in sorted(result['queries'].items()):
+        line += "  %s %.1fus, batched %.1fus (brute %.1fus, x%.1f)" % (kind, times['grid_us'], times['many_us'],
+                                                                       times['brute_us'], times['speedup'])
+    print(line)
+
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark the face grid against the brute force search")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10000, 100000],
+                        help="triangle counts of the synthetic models")
+    parser.add_argument("--queries", type=int, default=1000, help="points of each kind per model")
+    parser.add_argument("-o", "--output", help="save the results as json")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parseArguments(argv)
+    models = fixtures.fixtureModels()
+    models += [("synthetic-" + str(size), None) for size in args.sizes]
+
+    results = []
+    for name, buffers in models:
+        if buffers is None:
+            buffers = makeSyntheticModel(int(name.split("-")[1]))
+        result = benchModel(name, buffers, args.queries)
+        printResult(result)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({'numpy': np.__version__, 'results': results}, f, indent=4)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+#Benchmark of the export pipeline, stage by stage, on synthetic models of
+#growing size and on the demo models.
+#
+#   python benchmarks/bench_pipeline.py --sizes small -o results.json
+#   python benchmarks/bench_pipeline.py --sizes 1000 50000 --compare results.json
+#
+#Every model is run `--repeat` times and the best time of each stage is kept.
+#Peak memory is measured with tracemalloc in one more run, so it doesn't slow
+#down the timed ones. The regression checks of fixtures.py run first and the
+#benchmark stops if one of them fails
+
+import argparse
+import json
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+sys.path.insert(0, HERE)
+
+import magiccore
+from magiccore.aggregates import tableMeasures
+from synthetic import makeSyntheticModel
+import fixtures
+
+SIZES = {
+    'small': [1000, 10000, 100000],
+    'full': [1000, 10000, 100000, 500000, 1000000, 2000000]
+}
+STAGES = ["build", "load", "transform", "table", "marked", "unmarked", "related", "areas", "write"]
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+#stages of the benchmark and the stageTimer stages they are read from
+READER_STAGES = {
+    'load': "load",
+    'transform': "transformation matrix",
+    'table': "face table",
+    'marked': "marked faces",
+    'unmarked': "unmarked faces",
+    'related': "related faces"
+}
+
+#one run of the pipeline: mesh buffers -> pickle -> reader -> processed file
+def runOnce(buffers, workDir):
+    pickleName = os.path.join(workDir, "model")
+    processedName = os.path.join(workDir, "model.json")
+
+    timer = magiccore.stageTimer()
+    with timer.stage("build"):
+        data = magiccore.buildBlenderData(buffers)
+        with open(pickleName, "wb") as f:
+            pickle.dump(data, f, protocol=2)
+    del data
+
+    reader = magiccore.blenderReader(pickleName, timer)
+    with timer.stage("areas"):
+        measures = tableMeasures(reader.faces)
+    with timer.stage("write"):
+        magiccore.writeProcessedFile(processedName, reader, measures=measures)
+
+    times = {stage: timer.seconds(READER_STAGES.get(stage, stage)) for stage in STAGES}
+    return times, len(reader.allFaces)
+
+def peakMemory(buffers, workDir):
+    tracemalloc.start()
+    try:
+        runOnce(buffers, workDir)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def benchModel(name, buffers, repeat, workDir):
+    best = {}
+    for _ in range(repeat):
+        times, faces = runOnce(buffers, workDir)
+        for stage in times:
+            best[stage] = min(times[stage], best.get(stage, float('inf')))
+    best['total'] = sum(best[stage] for stage in STAGES)
+    return {
+        'name': name,
+        'faces': faces,
+        'times': best,
+        'tracemalloc_peak': peakMemory(buffers, workDir)
+    }
+
+def gitCommit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=HERE,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def maxRss():
+    if resource is None:
+        return None
+    #kilobytes on linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+def parseSizes(values):
+    sizes = []
+    for value in values:
+        sizes.extend(SIZES[value] if value in SIZES else [int(value)])
+    return sizes
+
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark the magic export pipeline")
+    parser.add_argument("--sizes", nargs="+", default=["small"],
+                        help="triangle counts of the synthetic models, or small/full")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per model, the best one is kept")
+    parser.add_argument("-o", "--output", help="save the results as json")
+    parser.add_argument("--compare", help="results json of an earlier run to compare with")
+    parser.add_argument("--skip-checks", action="store_true", help="don't run the regression checks")
+    return parser.parse_args(argv)
+
+def printResult(result, old=None):
+    times = result['times']
+    line = "%-18s %8d faces" % (result['name'], result['faces'])
+    for stage in STAGES + ['total']:
+        line += "  %s %.3fs" % (stage, times[stage])
+    line += "  peak %.1fMB" % (result['tracemalloc_peak'] / 1048576.0)
+    print(line)
+    if old is not None:
+        print("%-18s %8s        total %.3fs -> %.3fs (x%.2f)" % (
+            "", "", old['times']['total'], times['total'], old['times']['total'] / max(times['total'], 1e-9)))
+
+def main(argv=None):
+    args = parseArguments(argv)
+
+    if not args.skip_checks:
+        failed = False
+        for name, check in fixtures.FIXTURES:
+            errors = check()
+            print(name + ": " + ("ok" if not errors else "; ".join(errors)))
+            failed = failed or bool(errors)
+        if failed:
+            return 1
+
+    old = {}
+    if args.compare:
+        with open(args.compare) as f:
+            old = {result['name']: result for result in json.load(f)['results']}
+
+    models = fixtures.fixtureModels()
+    models += [("synthetic-" + str(size), None) for size in parseSizes(args.sizes)]
+
+    results = []
+    workDir = tempfile.mkdtemp(prefix="magicbench")
+    try:
+        for name, buffers in models:
+            if buffers is None:
+                buffers = makeSyntheticModel(int(name.split("-")[1]))
+            result = benchModel(name, buffers, args.repeat, workDir)
+            printResult(result, old.get(name))
+            results.append(result)
+    finally:
+        for fileName in os.listdir(workDir):
+            os.remove(os.path.join(workDir, fileName))
+        os.rmdir(workDir)
+
+    report = {
+        'commit': gitCommit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'max_rss': maxRss(),
+        'results': results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+#Regression checks on the demo models, run by bench_pipeline.py before timing.
+#
+#demo/cell.json is a raw export: its processed faces are checked against the
+#per-vertex solve_point reference and the set based nearFaces of the first exporter.
+#demo/plane.json is a processed file: a raw model is rebuilt from it (with the
+#scaffold placed where the transformation is the identity) and exporting it again
+#has to give back the same faces
+
+import json
+import os
+
+import numpy as np
+
+import magiccore
+from magiccore.scaffold import TRACKER_UNIT_SIZE, TRACKER_POINTS
+
+DEMO = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "demo")
+CELL = os.path.join(DEMO, "cell.json")
+PLANE = os.path.join(DEMO, "plane.json")
+
+#build the reader and the processed data of mesh buffers
+def convert(buffers):
+    reader = magiccore.blenderReader(magiccore.buildBlenderData(buffers))
+    return reader, magiccore.buildProcessedData(reader)
+
+def nearFaces(record):
+    return sorted(record['nearFaces'].values())
+
+def checkCell():
+    buffers = magiccore.readModelFile(CELL)
+    reader, processed = convert(buffers)
+    errors = []
+
+    ### geometry, against the one point at a time reference
+    for face in reader.allFaces:
+        reference = [magiccore.solve_point(pt, reader.transMtx) for pt in face.verts]
+        if not np.allclose(face.vertsConverted, reference, rtol=0, atol=1e-9):
+            errors.append("face " + str(face.blender_index) + " verts differ from solve_point")
+            break
+
+    ### nearFaces, against the sets of faces sharing a vertex
+    vertices = buffers['vertices'].tolist()
+    loopStart = buffers['loop_start'].tolist()
+    loopTotal = buffers['loop_total'].tolist()
+    faceVerts = [vertices[s:s + t] for s, t in zip(loopStart, loopTotal)]
+    pointMap = {}
+    for f, verts in enumerate(faceVerts):
+        for v in verts:
+            pointMap.setdefault(v, set()).add(f)
+    newIndex = {int(face.blender_index): i for i, face in enumerate(reader.allFaces)}
+    for i, face in enumerate(reader.allFaces):
+        related = set()
+        for v in faceVerts[int(face.blender_index)]:
+            related |= pointMap[v]
+        expected = sorted(newIndex[f] for f in related if f in newIndex)
+        if nearFaces(processed['faces']['face' + str(i)]) != expected:
+            errors.append("face" + str(i) + " nearFaces differ from the vertex sets")
+            break
+
+    if len(processed['faces']) != len(reader.allFaces):
+        errors.append("processed file has " + str(len(processed['faces'])) + " faces")
+    return errors
+
+#raw model whose export gives back a processed file, with the scaffold points
+#on the real Tracker points so the transformation is the identity
+def rawModelFromProcessed(processed):
+    faces = [processed['faces']['face' + str(i)] for i in range(len(processed['faces']))]
+    corners = ('vert1', 'vert2', 'vert3')
+    points = np.array([[face['verts'][c][axis] for c in corners for axis in 'xyz'] for face in faces])
+    co, loops = np.unique(points.reshape(-1, 3), axis=0, return_inverse=True)
+
+    areas = {}
+    areaIndex = np.zeros(len(faces), dtype=np.int32)
+    for f, face in enumerate(faces):
+        if not face['marked']:
+            continue
+        color = face['color']
+        key = (face['label'], face['content'], color['r'], color['g'], color['b'])
+        if key not in areas:
+            areas[key] = len(areas)
+        areaIndex[f] = areas[key] + 1
+
+    tracker = {name: [x * TRACKER_UNIT_SIZE for x in TRACKER_POINTS[name]] for name in TRACKER_POINTS}
+    return {
+        'co': co,
+        'normal': np.array([[face['normal'][axis] for axis in 'xyz'] for face in faces]),
+        'loop_start': np.arange(0, 3 * len(faces), 3),
+        'loop_total': np.full(len(faces), 3),
+        'vertices': loops.ravel(),
+        'area_index': areaIndex,
+        'materials': {},
+        'areas': {str(i): {'area_index': i + 1, 'area_label': key[0], 'area_content': key[1],
+                           'area_gesture': 'Select',
+                           'area_color': [key[2] / 255.0, key[3] / 255.0, key[4] / 255.0, 1.0]}
+                  for key, i in areas.items()},
+        'xz': [tracker['A'], tracker['B'], tracker['C']],
+        'yz': [tracker['B'], tracker['C'], tracker['D']],
+        'modelname': processed['modelName'],
+        'modeldescription': processed['modelIntro']
+    }
+
+def checkPlane():
+    with open(PLANE) as f:
+        expected = json.load(f)
+    processed = convert(rawModelFromProcessed(expected))[1]
+    errors = []
+    if len(processed['faces']) != len(expected['faces']):
+        return ["plane has " + str(len(processed['faces'])) + " faces instead of " + str(len(expected['faces']))]
+    for key, want in expected['faces'].items():
+        got = processed['faces'][key]
+        gotVerts = [[got['verts'][c][axis] for axis in 'xyz'] for c in sorted(got['verts'])]
+        wantVerts = [[want['verts'][c][axis] for axis in 'xyz'] for c in sorted(want['verts'])]
+        gotNormal = [got['normal'][axis] for axis in 'xyz']
+        wantNormal = [want['normal'][axis] for axis in 'xyz']
+        if (got['marked'] != want['marked'] or nearFaces(got) != nearFaces(want)
+                or not np.allclose(gotVerts, wantVerts, rtol=0, atol=1e-9)
+                or not np.allclose(gotNormal, wantNormal, rtol=0, atol=1e-9)):
+            errors.append(key + " differs from demo/plane.json")
+            break
+        ### unmarked faces were called m_nolabel by older exporters
+        if want['marked'] and (got['label'], got['content']) != (want['label'], want['content']):
+            errors.append(key + " label differs from demo/plane.json")
+            break
+    return errors
+
+FIXTURES = [("demo/cell.json", checkCell), ("demo/plane.json", checkPlane)]
+
+def fixtureModels():
+    with open(PLANE) as f:
+        plane = rawModelFromProcessed(json.load(f))
+    return [("demo/cell.json", magiccore.readModelFile(CELL)), ("demo/plane.json", plane)]
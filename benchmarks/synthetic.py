@@ -0,0 +1,71 @@
+#Synthetic labelled models for the benchmarks: a bumpy surface of any size,
+#merged with the tracker scaffold of makeScaffold and painted with random areas.
+#The models are mesh buffers, the same as magiccore.readRawData returns
+
+import math
+
+import numpy as np
+
+from magiccore import SCAFFOLD_VERTICES, SCAFFOLD_FACES, SCAFFOLD_XZ_FACE, SCAFFOLD_YZ_FACE
+
+#a surface of about `triangles` triangles, plus the 156 of the scaffold, with
+#`areas` labelled areas grown around random centers (about `labelled` of the faces)
+def makeSyntheticModel(triangles, areas=8, labelled=0.3, seed=0):
+    rng = np.random.RandomState(seed)
+
+    ### surface: a height field over a side x side grid, 2 triangles per cell
+    side = max(int(math.ceil(math.sqrt(triangles / 2.0))) + 1, 2)
+    u, v = np.meshgrid(np.linspace(-20.0, 20.0, side), np.linspace(-20.0, 20.0, side), indexing='ij')
+    height = 2.0 * np.sin(u / 3.0) * np.cos(v / 4.0) + 0.5 * rng.rand(side, side)
+    co = np.stack([u.ravel(), v.ravel(), height.ravel() + 20.0], axis=1)
+
+    cell = (np.arange(side - 1)[:, None] * side + np.arange(side - 1)[None, :]).ravel()
+    tris = np.concatenate([np.stack([cell, cell + side, cell + 1], axis=1),
+                           np.stack([cell + 1, cell + side, cell + side + 1], axis=1)])
+    tris = tris[rng.permutation(len(tris))[:max(triangles, 1)]]
+
+    ### scaffold, merged into the same object like mergeObjects does
+    scaffold = np.array(SCAFFOLD_VERTICES)
+    scaffoldFaces = np.array(SCAFFOLD_FACES) + len(co)
+    co = np.concatenate([co, scaffold]).astype(np.float32)
+    faces = np.concatenate([tris, scaffoldFaces])
+
+    ### labelled areas, faces close to one of the area centers
+    centroids = co[faces].mean(axis=1)
+    areaIndex = np.zeros(len(faces), dtype=np.int32)
+    radius = 40.0 * math.sqrt(labelled / (math.pi * max(areas, 1)))
+    centers = centroids[rng.randint(0, len(tris), size=areas)] if areas else np.empty((0, 3))
+    for a in range(areas)[::-1]:
+        near = np.linalg.norm(centroids[:, :2] - centers[a, :2], axis=1) < radius
+        near[len(tris):] = False
+        areaIndex[near] = a + 1
+
+    edges1 = co[faces[:, 1]] - co[faces[:, 0]]
+    edges2 = co[faces[:, 2]] - co[faces[:, 0]]
+    normal = np.cross(edges1, edges2)
+    normal /= np.maximum(np.linalg.norm(normal, axis=1), 1e-12)[:, None]
+
+    areasInfo = {}
+    for a in range(areas):
+        color = rng.rand(3).tolist()
+        areasInfo[str(a)] = {'area_index': a + 1,
+                             'area_label': 'Area ' + str(a),
+                             'area_content': 'Content of area ' + str(a),
+                             'area_gesture': 'Select',
+                             'area_color': color + [1.0]}
+
+    scaffoldPoints = lambda face: co[faces[len(tris) + face]].astype(np.float64).tolist()
+    return {
+        'co': co,
+        'normal': normal.astype(np.float32),
+        'loop_start': np.arange(0, 3 * len(faces), 3, dtype=np.int32),
+        'loop_total': np.full(len(faces), 3, dtype=np.int32),
+        'vertices': faces.ravel().astype(np.int32),
+        'area_index': areaIndex,
+        'materials': {'0': {'name': 'mainBody', 'diffuse': 1.0, 'color': [1.0, 1.0, 1.0]}},
+        'areas': areasInfo,
+        'xz': scaffoldPoints(SCAFFOLD_XZ_FACE),
+        'yz': scaffoldPoints(SCAFFOLD_YZ_FACE),
+        'modelname': 'synthetic-' + str(triangles),
+        'modeldescription': 'Synthetic benchmark model'
+    }
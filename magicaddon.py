@@ -1,18 +1,20 @@
 import bpy
 from bpy.props import *
 import bmesh
-import pickle
-import math
 import mathutils
-import json
-import requests
-from collections import OrderedDict
-from scipy.spatial import distance
-import threading
-import time
-import gzip, zlib
+import os
 import numpy as np
-from io import BytesIO
+
+### The add-on is a thin layer over the magiccore package (next to this file).
+### magiccore does the conversion to Talkit++ and doesn't depend on blender,
+### here we only read and write blender data
+from magiccore import (readRawData, readModelFile, buildExportBuffers, exportJob,
+                       stageTimer, REPORT_SUFFIX,
+                       labelKey, labelRegistry, planCompaction, classifySlots,
+                       decimateBuffers, parseLevels,
+                       SCAFFOLD_VERTICES, SCAFFOLD_FACES,
+                       SCAFFOLD_XZ_FACE, SCAFFOLD_YZ_FACE)
+from magiccore.online import onlineFetchJob
 
 ###############################################################################################
 ####    We define the addon information in this structure:            #########################
@@ -34,231 +36,6 @@ bl_info = \
         "category" : "Development",
 }
 
-def download_file(url):
-    local_filename = url.split('/')[-1]
-    # NOTE the stream=True parameter below
-    with requests.get(url, stream=True) as r:
-        r.raise_for_status()
-        with open(local_filename, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=8192): 
-                if chunk: # filter out keep-alive new chunks
-                    f.write(chunk)
-                    # f.flush()
-    return local_filename
-
-def writeFile(fileName,data):
-    with open(fileName + ".json", 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-            
-def writeFilePickle(fileName,newdata):
-    pickle.dump(newdata, open(fileName, "wb"),
-            protocol=2)
-    
-
-#get transformation matrix from the Blender coordinates to the Tracker coordinates
-def solve_affine( p1, p2, p3, p4, s1, s2, s3, s4 ):
-    x = np.transpose(np.matrix([p1,p2,p3,p4]))
-    y = np.transpose(np.matrix([s1,s2,s3,s4]))
-    x = np.vstack((x,[1,1,1,1]))
-    y = np.vstack((y,[1,1,1,1]))
-    mtx = y * x.I
-    # return function that takes input x and transforms it
-    # don't need to return the 4th row as it is
-    return mtx
-
-#enter a point X in Blender coordinates, and transformation matrix to get its Tracker coordinates
-def solve_point(x, trans):
-    result= (trans*np.vstack((np.matrix(x).reshape(3,1),1)))[0:3,:].tolist()
-    return [result[0][0],result[1][0],result[2][0]]
-
-#enter a normal X in Blender coordinates, and transformation matrix to get its Tracker coordinates
-def solve_normal(x, trans):
-    result= (trans*np.vstack((np.matrix(x).reshape(3,1),0)))[0:3,:].tolist()
-    return [result[0][0],result[1][0],result[2][0]]
-
-#for initialize the transformation matrix
-#calculate the euclidean distance between pt1 and pt2
-def calDistance(pt1,pt2):
-    return distance.euclidean(pt1,pt2)
-
-#for initialize the transformation matrix
-#scale a list with a value (scale)
-def calScaledList(scale,list):
-    return  [x * scale for x in list]
-
-def faceptsCompare(faceA,faceB):
-    for ptA in faceA:
-        for ptB in faceB:
-            if ptA == ptB:
-                return True
-
-    return False
-#blenderFace object
-#store information for a face
-class blenderFace:
-    def __init__(self, rawFace, mtx):
-        #for marked face, it has more information
-        #with the len == 4
-        if len(rawFace)==4:
-            #makred face
-            
-            self.marked=True
-            self.blender_index = rawFace[0][0]
-            self.area_id = rawFace[0][4]
-            self.label = rawFace[0][1]
-            self.content = rawFace[0][2]
-            self.gesture = rawFace[0][3]
-            self.blender_color = [x * 255 for x in rawFace[1]]
-            self.normal = rawFace[3]
-            self.verts = rawFace[2]
-            self.vertsConverted = []
-            self.vertsConverted_2d = []
-            self.relatedFaces = []
-            
-            for eachPt in self.verts:
-                self.vertsConverted.append(solve_point(eachPt, mtx))
-            self.normalConverted= solve_normal(self.normal, mtx)
-        else:
-            #unmarked face
-            self.marked = False
-            self.verts = rawFace[0]
-            self.normal = rawFace[1]
-            self.blender_index = rawFace[2]
-
-            self.label = "unmarked"
-            self.content = "null"
-            self.gesture = "null"
-            self.vertsConverted = []
-            self.vertsConverted_2d = []
-            self.relatedFaces = []
-            for eachPt in self.verts:
-                self.vertsConverted.append(solve_point(eachPt, mtx))
-            self.normalConverted = solve_normal(self.normal, mtx)
-
-#blenderPoint object
-#store information for a point
-class blenderPoint:
-    def __init__(self, coordinates, faceIndex, mtx):
-        self.vert = coordinates[:]
-        self.faceIndex = [faceIndex]
-        self.vertsConverted = solve_point(self.vert, mtx)
-
-    def addFace(self, faceIndex):
-        self.faceIndex.append(faceIndex)
-
-#read blender pickle file and save them as blenderFace or blenderPoint
-class blenderReader:
-    #initialize the reader with the pickle file address
-    def __init__(self,fileAddress):
-        import datetime
-        currentDT = datetime.datetime.now()
-        print ("load file" + str(currentDT))
-        file = open(fileAddress, "rb")
-        #blenderData is encoded as [(xy,yz),(marked face),(unmarked face), (name, introduction)]
-        self.data = pickle.load(file)
-        self.blenderData = self.data[0]
-        file.close()
-        print ("finish loading" + str(datetime.datetime.now()))
-        #variables for finding the transformation matrix
-        
-        
-        
-        self.vertsXZ = self.blenderData[0][0][:]
-        self.vertsYZ = self.blenderData[0][1][:]
-        self.generalInfo = self.blenderData[3]
-        #print self.generalInfo
-        #self.unitSize = 14.0/30.0
-        self.unitSize = 14.0 / 30.0
-        print ("start tranformation matrix" + str(datetime.datetime.now()))
-        self.transMtx = self.initialTrans() #no need to check this one
-        print ("start marked faces" + str(datetime.datetime.now()))
-        self.markedFaces = self.initialMarked()
-        print ("start unmarked faces" + str(datetime.datetime.now()))
-        self.unmarkedFaces = self.initialUnmarked()
-        self.allFaces = self.markedFaces[:]+self.unmarkedFaces[:]
-        print ("start related faces" + str(datetime.datetime.now()))
-        self.findrelatedFaces()
-        print ("finish related faces"+ str(datetime.datetime.now()))
-        #self.allPoints = self.getAllpoints()
-
-    def initialTrans(self):
-        #identify four key points from the data
-        #find the unique one (A) in xz face
-        for vertXZ in self.vertsXZ:
-            if vertXZ not in self.vertsYZ:
-                self.A=vertXZ[:]
-
-        #find the unique one (D) in yz face
-        for vertYZ in self.vertsYZ:
-            if vertYZ not in self.vertsXZ:
-                self.D=vertYZ[:]
-
-        #find the B and C point
-        
-        TempResult=[]
-        for element in self.vertsXZ:
-                if element in self.vertsYZ:
-                    TempResult.append(element)
-        dis1=calDistance(TempResult[0],self.A)
-        dis2=calDistance(TempResult[1],self.A)
-        if dis1 > dis2:
-            self.B=TempResult[1][:]
-            self.C=TempResult[0][:]
-        else:
-            self.C=TempResult[1][:]
-            self.B=TempResult[0][:]
-
-        #print self.A, self.B, self.C, self.D
-
-        #find the real coordinates of these points
-        self.ptC=calScaledList(self.unitSize,[-5.04229,0,-8.4463])
-        self.ptB=calScaledList(self.unitSize,[-5.04229,0,-8.4463+2.04945])
-        self.ptA=calScaledList(self.unitSize,[-5.04229+4.03073,0,-8.4463+2.04945])
-        self.ptD=calScaledList(self.unitSize,[-5.04229,4.98983,-8.4463])
-
-        mtx = solve_affine(self.A, self.B, self.C, self.D, self.ptA, self.ptB, self.ptC, self.ptD)
-        return mtx
-
-    def initialMarked(self):
-        markedFaces=[]
-        #Marked face, self.blenderData[1], is encoded as:
-        #[[(blender_index, label, content, gesture), blender_color, verts, normal]...]
-        for face in self.blenderData[1]:
-            
-            markedFaces.append(blenderFace(face, self.transMtx))
-
-        return markedFaces
-
-    def initialUnmarked(self):
-        unmarkedFaces=[]
-        #Marked face, self.blenderData[1], is encoded as:
-        #[[faceVerts, faceNormal]...]
-        for face in self.blenderData[2]:
-            if len(face[0]) == 3:
-                unmarkedFaces.append(blenderFace(face, self.transMtx))
-        return unmarkedFaces
-
-    def findrelatedFaces(self):
-       faceMap = self.data[1]
-       pointMap = self.data[2]
-       relatedFaces = {}
-       oldIdxToNewIdx = {}
-       for face in faceMap:
-           if face not in relatedFaces:
-               relatedFaces[face] = set()
-           for point in faceMap.get(face):
-               for fIndex in pointMap.get(point):
-                   relatedFaces.get(face).add(fIndex)
-
-       for faceIdx in range(len(self.allFaces)):
-           oldIdxToNewIdx[self.allFaces[faceIdx].blender_index] = faceIdx
-
-       for faceIdx in range(len(self.allFaces)):
-           faceOldIndex = self.allFaces[faceIdx].blender_index
-           tempSet = relatedFaces.get(str(faceOldIndex))
-           for faceR in tempSet:
-              self.allFaces[faceIdx].relatedFaces.append(oldIdxToNewIdx[faceR])
-
 class cls_AreaData(bpy.types.PropertyGroup):
     bl_options = {'REGISTER', 'UNDO'}
     # The properties for this class which is referenced as an 'entry' below.
@@ -401,93 +178,9 @@ def mergeObjects(self,context):
 
 def makeScaffold(self,context):
     
-    ### Define Scaffold 82 Vertices
+    ### The Scaffold geometry (82 vertices and 156 faces) is in magiccore
     
-    Vertices = \
-          [
-            mathutils.Vector((-29.99028968811035, -6.8105974197387695, -9.081909229280427e-05)),
-            mathutils.Vector((-29.99028968811035, -6.8105974197387695, 8.446209907531738)), 
-            mathutils.Vector((-29.99028968811035, 10.22175121307373, 8.446209907531738)), 
-            mathutils.Vector((-29.99028968811035, 10.22175121307373, -9.081909229280427e-05)),
-            mathutils.Vector((-19.942604064941406, -6.8105974197387695, 8.446209907531738)), 
-            mathutils.Vector((-19.942604064941406, 10.22175121307373, 8.446209907531738)), 
-            mathutils.Vector((-19.942604064941406, -6.8105974197387695, -9.081909229280427e-05)), 
-            mathutils.Vector((-19.942604064941406, 10.22175121307373, -9.081909229280427e-05)), 
-            mathutils.Vector((-25.95956802368164, 35.02724838256836, 4.396630764007568)), 
-            mathutils.Vector((-27.95969009399414, 35.02724838256836, 2.3965096473693848)), 
-            mathutils.Vector((-27.95969009399414, 35.02724838256836, 4.396630764007568)), 
-            mathutils.Vector((-21.946422576904297, 35.02724838256836, 2.3965096473693848)), 
-            mathutils.Vector((-23.894927978515625, 35.02724838256836, 4.396630764007568)), 
-            mathutils.Vector((-21.946422576904297, 35.02724838256836, 4.396630764007568)), 
-            mathutils.Vector((-25.95956802368164, 35.02724838256836, 6.396751880645752)), 
-            mathutils.Vector((-23.894927978515625, 35.02724838256836, 6.396751880645752)), 
-            mathutils.Vector((-29.99028968811035, 35.02724838256836, 8.446209907531738)), 
-            mathutils.Vector((-29.99028968811035, 35.02724838256836, 6.396751880645752)), 
-            mathutils.Vector((-24.948001861572266, 35.02724838256836, 8.446209907531738)), 
-            mathutils.Vector((-19.90571403503418, 35.02724838256836, 8.446209907531738)), 
-            mathutils.Vector((-19.90571403503418, 35.02724838256836, 6.396751880645752)), 
-            mathutils.Vector((-29.99028968811035, 15.067978858947754, 8.446209907531738)), 
-            mathutils.Vector((-29.99028968811035, 10.078160285949707, 8.446209907531738)), 
-            mathutils.Vector((-24.948001861572266, 10.078160285949707, 8.446209907531738)), 
-            mathutils.Vector((-29.99028968811035, 20.057796478271484, 8.446209907531738)), 
-            mathutils.Vector((-29.99028968811035, 25.04761505126953, 8.446209907531738)), 
-            mathutils.Vector((-29.99028968811035, 30.037431716918945, 8.446209907531738)), 
-            mathutils.Vector((-19.90571403503418, 15.067978858947754, 8.446209907531738)), 
-            mathutils.Vector((-19.90571403503418, 20.057796478271484, 8.446209907531738)), 
-            mathutils.Vector((-19.90571403503418, 25.04761505126953, 8.446209907531738)), 
-            mathutils.Vector((-19.90571403503418, 30.037431716918945, 8.446209907531738)), 
-            mathutils.Vector((-19.90571403503418, 10.078160285949707, 8.446209907531738)), 
-            mathutils.Vector((-19.90571403503418, 15.067978858947754, 6.396751880645752)), 
-            mathutils.Vector((-19.90571403503418, 10.078160285949707, 6.396751880645752)), 
-            mathutils.Vector((-23.894927978515625, 10.078160285949707, 6.396751880645752)), 
-            mathutils.Vector((-23.894927978515625, 15.067978858947754, 6.396751880645752)), 
-            mathutils.Vector((-19.90571403503418, 20.057796478271484, 6.396751880645752)),
-            mathutils.Vector((-23.894927978515625, 20.057796478271484, 6.396751880645752)),
-            mathutils.Vector((-19.90571403503418, 30.037431716918945, 6.396751880645752)),
-            mathutils.Vector((-19.90571403503418, 25.04761505126953, 6.396751880645752)), 
-            mathutils.Vector((-23.894927978515625, 25.04761505126953, 6.396751880645752)),
-            mathutils.Vector((-23.894927978515625, 30.037431716918945, 6.396751880645752)),
-            mathutils.Vector((-29.99028968811035, 15.067978858947754, 6.396751880645752)),
-            mathutils.Vector((-29.99028968811035, 10.078160285949707, 6.396751880645752)),
-            mathutils.Vector((-29.99028968811035, 20.057796478271484, 6.396751880645752)), 
-            mathutils.Vector((-29.99028968811035, 30.037431716918945, 6.396751880645752)), 
-            mathutils.Vector((-29.99028968811035, 25.04761505126953, 6.396751880645752)), 
-            mathutils.Vector((-25.95956802368164, 15.067978858947754, 6.396751880645752)), 
-            mathutils.Vector((-25.95956802368164, 10.078160285949707, 6.396751880645752)), 
-            mathutils.Vector((-25.95956802368164, 20.057796478271484, 6.396751880645752)), 
-            mathutils.Vector((-25.95956802368164, 30.037431716918945, 6.396751880645752)), 
-            mathutils.Vector((-25.95956802368164, 25.04761505126953, 6.396751880645752)), 
-            mathutils.Vector((-25.95956802368164, 15.067978858947754, 4.396630764007568)), 
-            mathutils.Vector((-25.95956802368164, 10.078160285949707, 4.396630764007568)), 
-            mathutils.Vector((-25.95956802368164, 20.057796478271484, 4.396630764007568)), 
-            mathutils.Vector((-25.95956802368164, 30.037431716918945, 4.396630764007568)), 
-            mathutils.Vector((-25.95956802368164, 25.04761505126953, 4.396630764007568)), 
-            mathutils.Vector((-27.95969009399414, 15.067978858947754, 4.396630764007568)), 
-            mathutils.Vector((-27.95969009399414, 10.078160285949707, 4.396630764007568)), 
-            mathutils.Vector((-27.95969009399414, 20.057796478271484, 4.396630764007568)), 
-            mathutils.Vector((-27.95969009399414, 30.037431716918945, 4.396630764007568)), 
-            mathutils.Vector((-27.95969009399414, 25.04761505126953, 4.396630764007568)), 
-            mathutils.Vector((-27.95969009399414, 15.067978858947754, 2.3965096473693848)), 
-            mathutils.Vector((-27.95969009399414, 10.078160285949707, 2.3965096473693848)), 
-            mathutils.Vector((-27.95969009399414, 20.057796478271484, 2.3965096473693848)), 
-            mathutils.Vector((-27.95969009399414, 30.037431716918945, 2.3965096473693848)), 
-            mathutils.Vector((-27.95969009399414, 25.04761505126953, 2.3965096473693848)), 
-            mathutils.Vector((-21.946422576904297, 15.067978858947754, 2.3965096473693848)), 
-            mathutils.Vector((-21.946422576904297, 10.078160285949707, 2.3965096473693848)), 
-            mathutils.Vector((-21.946422576904297, 20.057796478271484, 2.3965096473693848)), 
-            mathutils.Vector((-21.946422576904297, 30.037431716918945, 2.3965096473693848)), 
-            mathutils.Vector((-21.946422576904297, 25.04761505126953, 2.3965096473693848)), 
-            mathutils.Vector((-21.946422576904297, 15.067978858947754, 4.396630764007568)), 
-            mathutils.Vector((-21.946422576904297, 10.078160285949707, 4.396630764007568)), 
-            mathutils.Vector((-21.946422576904297, 20.057796478271484, 4.396630764007568)), 
-            mathutils.Vector((-21.946422576904297, 30.037431716918945, 4.396630764007568)), 
-            mathutils.Vector((-21.946422576904297, 25.04761505126953, 4.396630764007568)), 
-            mathutils.Vector((-23.894927978515625, 15.067978858947754, 4.396630764007568)), 
-            mathutils.Vector((-23.894927978515625, 10.078160285949707, 4.396630764007568)), 
-            mathutils.Vector((-23.894927978515625, 20.057796478271484, 4.396630764007568)), 
-            mathutils.Vector((-23.894927978515625, 30.037431716918945, 4.396630764007568)),
-            mathutils.Vector((-23.894927978515625, 25.04761505126953, 4.396630764007568))
-          ]
+    Vertices = [mathutils.Vector(v) for v in SCAFFOLD_VERTICES]
           
     ### Define the mesh we are adding as "Scaffold"
     ### If there is already an item called "Scaffold", it will
@@ -505,7 +198,7 @@ def makeScaffold(self,context):
         (
             Vertices,
             [],
-            [[23,48,43],[0, 1, 2], [0, 2, 3], [1, 4, 5], [1, 5, 2], [4,6,7], [4,7,5], [6,0,3], [6,3,7], [1,0,6], [6,4,1], [2,7,3], [7,2,5], [8,9,10], [11,9,8], [11,8,12], [13,11,12], [12,8,14], [12,14,15], [18,14,16], [19,20,15], [15,18,19], [18,15,14], [21,22,23], [24,21,23], [24,18,25], [26,18,16], [18,26,25], [24,23,18], [27,28,23], [18,23,28], [18,28,29], [30,18,29], [18,30,19], [31,27,23], [32,33,34], [32,34,35], [36,32,35], [36,35,37], [38,39,40], [38,40,41], [20,38,41], [20,41,15], [39,36,37], [39,37,40], [42,43,22], [21,44,42],[42,22,21], [44,21,24], [45,46,25], [45,25,26], [17,45,26], [46,44,24], [46,24,25], [27,31,33], [27,33,32], [28,27,32], [28,32,36], [30,29,39], [30,39,38], [19,30,38], [19,38,20], [29,28,36], [29,36,39], [47,48,43], [47,43,42], [49,47,42], [49,42,44], [50,51,46], [50,46,45], [14,50,45], [14,45,17], [51,49,44], [51,44,46], [52,53,48], [52,48,47], [54,52,47], [54,47,49], [55,56,51], [55,51,50], [8,55,50], [8,50,14], [56,54,49], [56,49,51], [57,58,53], [57,53,52], [59,57,52], [59,52,54], [60,61,56], [60,56,55], [10,60,55], [10,55,8], [61,59,54], [61,54,56], [62,63,58], [62,58,57], [64,62,57], [64,57,59], [65,66,61], [65,61,60], [9,65,60], [9,60,10], [66,64,59], [66,59,61], [67,68,63], [67,63,62], [69,67,62], [69,62,64], [70,71,66], [70,66,65], [11,70,65], [11,65,9], [71,69,64], [71,64,66], [72,73,68], [72,68,67], [74,72,67], [74,67,69], [75,76,71], [75,71,70], [13,75,70], [13,70,11], [76,74,69], [76,69,71], [77,78,73], [77,73,72], [79,77,72], [79,72,74], [80,81,76], [80,76,75], [12,80,75], [12,75,13], [81,74,76], [35,34,78], [35,78,77], [37,35,77], [37,77,79], [41,40,81], [81,74,79],[41,81,80], [15,41,80], [15,80,12], [40,37,79], [40,79,81], [58,63,53], [63,68,78], [63,78,53], [43,23,22], [48,53,78], [48,78,34], [73,78,68], [31,23,34], [34,23,48], [34,33,31],[16,14,17],[16,26,17]]
+            SCAFFOLD_FACES
         )
     NewMesh.update()
         
@@ -566,8 +259,8 @@ def makeScaffold(self,context):
     ### We add the materials xzFace and yzFace to 2 specific faces in
     ### the scaffold to have a point of reference.
     
-    bm.faces[155].material_index = 2
-    bm.faces[154].material_index = 1
+    bm.faces[SCAFFOLD_YZ_FACE].material_index = 2
+    bm.faces[SCAFFOLD_XZ_FACE].material_index = 1
         
     bpy.ops.mesh.select_all(action='SELECT')
     bpy.ops.mesh.normals_make_consistent(inside=False)
@@ -606,6 +299,8 @@ class ToolsPanel(bpy.types.Panel):
         ###Input areas and labels for users
         box.prop(context.scene, "export_model")
         box.prop(context.scene, "export_model_file")
+        box.prop(context.scene, "decimate_faces")
+        box.prop(context.scene, "decimate_error")
         
         ### Buttons that call for the functionalities
         box.operator("magic.marker", text="Add tracker scaffold").operation = "add"
@@ -635,6 +330,7 @@ class ToolsPanel(bpy.types.Panel):
         ### Buttons that call for the functionalities
         box.operator("magic.hotarea", text="confirm").operation = "add"
         box.operator("magic.hotarea", text="Delete selected area").operation = "clean"
+        box.operator("magic.hotarea", text="Merge duplicate labels").operation = "compact"
 
         ### We add an empty whitespace that separates the sections
         layout.separator()
@@ -650,9 +346,22 @@ class ToolsPanel(bpy.types.Panel):
         box.prop(context.scene, "inputIntroduction_model")
         box.prop(context.scene, "export_path")
         box.prop(context.scene, "import_path")
+        box.prop(context.scene, "export_raw_json")
+        box.prop(context.scene, "export_pickle")
+        box.prop(context.scene, "export_binary")
+        box.prop(context.scene, "export_incremental")
+        box.prop(context.scene, "export_face_grid")
+        box.prop(context.scene, "export_lods")
+        box.prop(context.scene, "export_profile")
         
         ### Buttons that call for the functionalities
-        box.operator("magic.export", text="export")
+        job = MAGIC_export.currentJob
+        if job is None:
+            box.operator("magic.export", text="export")
+        else:
+            ### An export is running in the background
+            box.label("Exporting: %s (%d%%)" % (job.stage, job.progress * 100), icon="TIME")
+            box.operator("magic.export_cancel", text="cancel export")
         box.operator("magic.import", text="import")
         
         layout.separator()
@@ -693,8 +402,15 @@ class MAGIC_marker(bpy.types.Operator):
                                       message='You are missing the directory path or the name of the file you are trying to export')
 
                 
-            bpy.ops.export_mesh.stl(filepath=path + filename + '.stl')
-            print("save stl " + str(time.ctime(int(time.time()))))
+            timer = stageTimer(sceneProfile(context.scene))
+            with timer.stage("saving stl"):
+                bpy.ops.export_mesh.stl(filepath=path + filename + '.stl')
+            timer.countFile(path + filename + '.stl')
+            timer.stop()
+            self.report({'INFO'}, "Saved " + path + filename + ".stl in " + timer.summary())
+            ### With a profile on, the timings are saved next to the stl
+            if timer.modes:
+                timer.writeReport(path + filename + REPORT_SUFFIX)
             
             
             
@@ -714,14 +430,54 @@ class MAGIC_marker(bpy.types.Operator):
                                       message='Please select one object to decimate')
                 return {'FINISHED'}
             bpy.context.scene.objects.active = selection[0]
-
-            mod = selection[0].modifiers.new(name='decimate', type='DECIMATE')
-            mod.ratio = 0.1
-            bpy.ops.object.modifier_apply(apply_as="DATA", modifier="decimate")
+            decimateObject(self, context, selection[0])
 
 
         return {'FINISHED'}
 
+### Decimates the object to the face count or the error bound of the panel.
+### The labelled areas keep their outline and the xz and yz faces of the
+### scaffold stay as they are (see magiccore.decimate), so this also works
+### after adding the scaffold. The mesh is replaced by the triangles of the
+### decimated one, with the same material slots
+
+def decimateObject(self, context, ob):
+    targetFaces = context.scene.decimate_faces if context.scene.decimate_faces > 0 else None
+    maxError = context.scene.decimate_error if context.scene.decimate_error > 0 else None
+    if targetFaces is None and maxError is None:
+        bpy.ops.error.message('INVOKE_DEFAULT',
+                              type="Error",
+                              message='Set the number of faces or the maximum error to decimate to')
+        return
+    editmode = False
+    if ob.mode == 'EDIT':
+        editmode = True
+        bpy.ops.object.mode_set()
+
+    mesh = ob.data
+    buffers = readMeshBuffers(mesh)
+    materialIndex = buffers['material_index']
+    slotCount = int(materialIndex.max()) + 1 if len(materialIndex) else 0
+    _, xzFace, yzFace = classifySlots([slot.name for slot in ob.material_slots],
+                                      [slot.material.name if slot.material is not None else None
+                                       for slot in ob.material_slots], slotCount)
+    decimated = decimateBuffers(buffers, targetFaces, maxError, (xzFace | yzFace)[materialIndex])
+
+    newMesh = bpy.data.meshes.new(mesh.name)
+    newMesh.from_pydata(decimated['co'].tolist(), [], decimated['vertices'].reshape(-1, 3).tolist())
+    for material in mesh.materials:
+        newMesh.materials.append(material)
+    newMesh.polygons.foreach_set("material_index", decimated['material_index'])
+    newMesh.update()
+    ob.data = newMesh
+    if mesh.users == 0:
+        bpy.data.meshes.remove(mesh)
+    self.report({'INFO'}, "Decimated from %d to %d faces, the vertices moved %.4f at most" %
+                (len(buffers['loop_total']), len(decimated['loop_total']), decimated['error']))
+
+    if editmode:
+        bpy.ops.object.mode_set(mode='EDIT')
+
 ###############################################################################################
 ####    MAGIC_onlineimport operator class                              ########################
 ####          #######################
@@ -745,131 +501,29 @@ class MAGIC_onlineimport(bpy.types.Operator):
         ## we get the id of the model
         modelid = context.scene.model_id
         
-        ## we make the request with the id
-        req = requests.get('https://sensables.org/api/models/' + modelid)
-        
-        
-        str_decoded = req.content.decode()
+        ## we make the request with the id, in a worker thread so blender
+        ## stays responsive, modal() imports the model once it's there
+        self._job = onlineFetchJob(modelid)
+        self._job.start()
 
-        jsonform = json.loads(str_decoded)
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.2, context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
 
-        firstdata = jsonform['Body']['data']
-        
-        ba = bytearray(firstdata)
-        
-        newData = zlib.decompress(bytes(ba), 15+32)
+    def modal(self, context, event):
+        if event.type != 'TIMER' or not self._job.finished:
+            return {'PASS_THROUGH'}
 
-        
-        newDat = json.loads(newData)
+        context.window_manager.event_timer_remove(self._timer)
+        if self._job.error is not None:
+            bpy.ops.error.message('INVOKE_DEFAULT',
+                                  type="Error",
+                                  message='Could not load the model: ' + self._job.error)
+            return {'CANCELLED'}
 
-        
-        
-        ## Copy pasted import method
-        data = json.loads(newDat)
-
-        ## Add each vertex to a list - Done
-        Vertices = []
-        i=0
-        for p in data['vertices']:
-            p = data['vertices'][str(i)]
-            vector = mathutils.Vector((p))
-            Vertices.append(vector)
-            i+=1
-        
-        
-        ## Add each face to a list - Done
-        Faces = []
-        i=0
-        for f in data['faces']:
-            f = data['faces'][str(i)]['vertices']
-            Faces.append(f)
-            i+=1
-        
-        ## Use file name to add the new mesh
-        NewMesh = bpy.data.meshes.new("modelmesh")
-        
-        ### We define how the mesh will be built
-        
-        ## Use both lists to build the model
-        NewMesh.from_pydata \
-            (
-                Vertices,
-                [],
-                Faces
-            )
-        NewMesh.update()
-        
-        context = bpy.context
-        ## Use file name again to link it
-        NewObj = bpy.data.objects.new("whatever", NewMesh)
-        
-        ### linking the new object to the scene
-        context.scene.objects.link(NewObj)
-        
-        ### We select the object to add the materials to the face, and also the areas.
-        context.scene.objects.active = NewObj
-        
-        ob = bpy.context.object 
-                        
-        current_mode = bpy.context.object.mode
-        
-        ### Check in which mode we are to handle errors
-        if current_mode != 'EDIT' :
-            bpy.ops.object.editmode_toggle()
-        
-        ### Object data
-        mesh = ob.data
-        
-        ### Here we start adding the materials
-        
-        ##material = makeMaterial(name=p.name, diffuse=p.color, alpha=p.diffuse)
-        ##mesh.materials.append(material)
-        i=0
-        
-        for p in data['materials']:
-            ## Change all of this to makeMaterial when doing in main component
-            currentData = data['materials'][str(i)]
-            material = makeMaterial(name=currentData['name'], diffuse=currentData['color'], alpha=currentData['diffuse'])
-            mesh.materials.append(material)
-            i+=1
-            
-        ### Here we start adding the areas
-        i=0
-        for p in data['areas']:
-            currentData = data['areas'][str(i)]
-            ob.area_list.add()
-            ob.area_list[-1].area_index = currentData['area_index']
-            ob.area_list[-1].area_label = currentData['area_label']
-            ob.area_list[-1].area_content = currentData['area_content']
-            ob.area_list[-1].area_gesture = currentData['area_gesture']
-            ob.area_list[-1].area_color = currentData['area_color']
-            i+=1
-        
-        ### Here we paint all the faces depending on their index    
-        mesh = ob.data
-        
-        if bpy.context.object.mode != 'EDIT' :
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.remove_doubles(threshold=0.0001)
-            
-        bm = bmesh.from_edit_mesh(mesh)
-        if hasattr(bm.faces, "ensure_lookup_table"): 
-            bm.faces.ensure_lookup_table()
-        
-        ### We add the materials xzFace and yzFace to 2 specific faces in
-        ### the scaffold to have a point of reference.
-        i=0
-        for f in data['faces']:
-            area_index = data['faces'][str(i)]['area_index']
-            bm.faces[i].material_index = area_index
-            i+=1
-            
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.normals_make_consistent(inside=False)
-        
-            
-            
-        bpy.ops.object.editmode_toggle()
+        importModel(bpy.context, self._job.buffers, "modelmesh", "whatever")
+        self.report({'INFO'}, "Imported model " + self._job.modelid + " (" + self._job.stage + ")")
         return {'FINISHED'}
         
         
@@ -906,19 +560,21 @@ class MAGIC_hotarea(bpy.types.Operator):
             self.add(context)
         if self.operation == "clean":
             self.clean(context)
+        if self.operation == "compact":
+            self.compact(context)
 
         return {'FINISHED'}
     
     
     ### We define the clean function as removing all the areas of the object
+    ### that have a selected face. The selection and the material indices are
+    ### read in bulk, so the cost is one pass over the faces, whatever the
+    ### number of selected faces and areas
     
     def clean(self, context):
         
         ob = bpy.context.active_object
         me = ob.data
-        selfaces =[]
-        delmaterials =[]
-        delareas =[]
         #check for edit mode
         editmode = False
         
@@ -926,55 +582,33 @@ class MAGIC_hotarea(bpy.types.Operator):
             editmode =True
             #the following sets mode to object by default
             bpy.ops.object.mode_set()
-        for f in me.polygons:
-            if f.select:
-                selfaces.append(f)
-        # for f in selfaces:
-            # hashSet for material_index
-            
-        for f in selfaces:
-            i = 0
-            for a in ob.area_list:
-                if f.material_index == a.area_index:
-                    if f.material_index not in delmaterials:
-                        delmaterials.append(f.material_index)
-                        delareas.append(i)
-                        delareas.sort()
-                        i = i + 1
-                    else:
-                        i = i + 1
-                else:
-                    i = i + 1
-                
-        for f in me.polygons:
-            if f.material_index in delmaterials:
-                
-                f.material_index = 0
-        
-        delareas.reverse()
-    
-        q = 0       
-        for j in delareas:
-            
-            ob.area_list[delareas[q]].area_index = 0
-            q = q + 1
-        
+
+        faceCount = len(me.polygons)
+        selected = np.empty(faceCount, dtype=bool)
+        me.polygons.foreach_get("select", selected)
+        materialIndex = np.empty(faceCount, dtype=np.int32)
+        me.polygons.foreach_get("material_index", materialIndex)
+
+        ### the first area of each material index, like the old scan found it
+        areaOfMaterial = {}
+        for i, a in enumerate(ob.area_list):
+            areaOfMaterial.setdefault(a.area_index, i)
+
+        selectedMaterials = set(np.unique(materialIndex[selected]).tolist())
+        delmaterials = [m for m in selectedMaterials if m in areaOfMaterial]
+
+        if len(delmaterials) > 0:
+            ### every face of a deleted area goes back to the main body
+            materialIndex[np.isin(materialIndex, delmaterials)] = 0
+            me.polygons.foreach_set("material_index", materialIndex)
+            me.update()
+            for m in delmaterials:
+                ob.area_list[areaOfMaterial[m]].area_index = 0
                
         #done editing, restore edit mode if needed
         if editmode:
             bpy.ops.object.mode_set(mode = 'EDIT')
             
-        #selection = bpy.context.selected_objects
-        #obj = selection[0]
-        #for eachareaIndex in range(len(obj.area_list)):
-        #    print("clean", eachareaIndex)
-        #    obj.area_list.remove(0)
-        #mesh = obj.data
-        #mesh_editmode = bmesh.from_edit_mesh(mesh)
-        #for f in mesh_editmode.faces:
-        #    if not f.material_index == 1 and not f.material_index == 2:
-        #        f.material_index = 0
-        #print(obj.area_list)
         
 
     def add(self, context):
@@ -1003,45 +637,175 @@ class MAGIC_hotarea(bpy.types.Operator):
                                   message='Please select at least one polygon')
             return {'FINISHED'}
         
-        ### We create a material with the color the user selected
+        ### A label that is already on the model (same name and color) keeps
+        ### its material and area, only its description and gesture are updated.
+        ### Otherwise we create a material with the color the user selected
         ### to add the new label
-        material = makeMaterial(name=label, diffuse=color[:3], alpha=color[3])
-        # create a mesh for the body
-        if len(mesh.materials) <= 0:
-            mesh.materials.append(makeMaterial(name="mainbody", diffuse=[1, 1, 1], alpha=1.0))
+        registry = labelRegistry([(a.area_index, labelKey(a.area_label, a.area_color))
+                                  for a in obj.area_list])
+        position = registry.get(labelKey(label, color))
+
+        if position is not None:
+            area = obj.area_list[position]
+            newMaterialIndex = area.area_index
+            area.area_content = content
+            area.area_gesture = gesture
+        else:
+            material = makeMaterial(name=label, diffuse=color[:3], alpha=color[3])
+            # create a mesh for the body
+            if len(mesh.materials) <= 0:
+                mesh.materials.append(makeMaterial(name="mainbody", diffuse=[1, 1, 1], alpha=1.0))
 
-        mesh.materials.append(material)
-        current_areas = []
-        
-        for a in obj.area_list:
-            current_areas.append(a.area_index)
-           
-        
-        
-        newMaterialIndex = len(mesh.materials) - 1
-    
-        
+            mesh.materials.append(material)
+            newMaterialIndex = len(mesh.materials) - 1
+
+            ### Add a new area to the area list of the model
+            obj.area_list.add()
+            obj.area_list[-1].area_index = newMaterialIndex
+            obj.area_list[-1].area_label = label
+            obj.area_list[-1].area_content = content
+            obj.area_list[-1].area_gesture = gesture
+            obj.area_list[-1].area_color = color
+
+        ### and the selected faces to the area
         for f in selected_faces:
-            
-            if newMaterialIndex in current_areas:
-                f.material_index = newMaterialIndex  
-            else:
-                    ### If the selected face is in an area the already exists in the model
-                    ### we add it to the area
-                obj.area_list.add()
-                current_areas.append(newMaterialIndex)
-                
-                f.material_index = newMaterialIndex
-                obj.area_list[-1].area_index = newMaterialIndex
-                obj.area_list[-1].area_label = label
-                obj.area_list[-1].area_content = content
-                obj.area_list[-1].area_gesture = gesture
-                obj.area_list[-1].area_color = color
-            ### Add a new area and the face to the area list of the model
-                    
-        
-        
+            f.material_index = newMaterialIndex
+
+    ### Merges the areas with the same label and color (left by labelling
+    ### sessions before the labels were reused) into one material slot, and
+    ### removes the slots of deleted areas. The faces are remapped in bulk
+
+    def compact(self, context):
+        ob = bpy.context.active_object
+        me = ob.data
+        editmode = False
+        if ob.mode == 'EDIT':
+            editmode = True
+            bpy.ops.object.mode_set()
+
+        faceCount = len(me.polygons)
+        materialIndex = np.empty(faceCount, dtype=np.int32)
+        me.polygons.foreach_get("material_index", materialIndex)
+        areaKeys = [(a.area_index, labelKey(a.area_label, a.area_color)) for a in ob.area_list]
+        slotNames = [mat.name if mat is not None else None for mat in me.materials]
+
+        try:
+            lookup, removedAreas, removedSlots = planCompaction(areaKeys, slotNames, materialIndex)
+        except ValueError as e:
+            bpy.ops.error.message('INVOKE_DEFAULT',
+                                  type="Error",
+                                  message=str(e))
+            removedAreas = []
+            removedSlots = []
+
+        if len(removedAreas) > 0 or len(removedSlots) > 0:
+            me.polygons.foreach_set("material_index", lookup[materialIndex])
+            ### from the last one, so the positions and slots still to remove don't move
+            for position in reversed(removedAreas):
+                ob.area_list.remove(position)
+            for slot in reversed(removedSlots):
+                me.materials.pop(index=slot, update_data=False)
+            for a in ob.area_list:
+                if a.area_index > 0:
+                    a.area_index = int(lookup[a.area_index])
+            me.update()
+            self.report({'INFO'}, "Removed %d areas and %d material slots" % (len(removedAreas), len(removedSlots)))
+
+        if editmode:
+            bpy.ops.object.mode_set(mode = 'EDIT')
+
+
+###############################################################################################
+####    Mesh extraction used by the export                            #########################
+####    Reads each mesh attribute into a NumPy buffer with a single   #########################
+####    foreach_get, instead of one attribute access per vertex/face  #########################
+###############################################################################################
 
+def readMeshBuffers(mesh):
+    vertCount = len(mesh.vertices)
+    faceCount = len(mesh.polygons)
+    loopCount = len(mesh.loops)
+
+    co = np.empty(vertCount * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    normal = np.empty(faceCount * 3, dtype=np.float32)
+    mesh.polygons.foreach_get("normal", normal)
+    loopStart = np.empty(faceCount, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", loopStart)
+    loopTotal = np.empty(faceCount, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loopTotal)
+    materialIndex = np.empty(faceCount, dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", materialIndex)
+
+    ### polygon.vertices can't be read in bulk, but the loops hold the
+    ### same vertex indices face after face (from loop_start to loop_total)
+    vertices = np.empty(loopCount, dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", vertices)
+
+    return {
+        'co': co.reshape(vertCount, 3),
+        'normal': normal.reshape(faceCount, 3),
+        'loop_start': loopStart,
+        'loop_total': loopTotal,
+        'material_index': materialIndex,
+        'vertices': vertices
+    }
+
+#the profile chosen in the panel, None leaves it to the MAGIC_PROFILE environment variable
+def sceneProfile(scene):
+    if scene.export_profile == 'NONE':
+        return None
+    return scene.export_profile
+
+#snapshot everything the export needs from a labelled object: the mesh buffers
+#plus area_index, areas, materials, the xz/yz scaffold points and the model info.
+#The result doesn't reference blender data, so it can go to another thread or process
+def snapshotExport(obj, modelName, modelIntro):
+    mesh = obj.data
+
+    ## Obtaining vertices and faces data
+    ## remember to leave edit mode so 
+    ## changes reflect on the data <-- very important
+    buffers = readMeshBuffers(mesh)
+
+    ## Areas information, dictionary with the 
+    ## 5 values that compose an area data structure
+    j=0
+    Areas = {}
+    for a in obj.area_list:
+        Areas[j] = {}
+        Areas[j].update({'area_index': a.area_index})
+        Areas[j].update({'area_label': a.area_label})
+        Areas[j].update({'area_gesture': a.area_gesture})
+        Areas[j].update({'area_content':a.area_content})
+        color = [0,0,0,0]
+        color[0] = a.area_color[0]
+        color[1] = a.area_color[1]
+        color[2] = a.area_color[2]
+        color[3] = a.area_color[3]
+
+        Areas[j].update({'area_color':color})
+        j+=1
+
+    ## Storing all the materials to avoid problems for now
+    j=0
+    Materials = {}
+    for mat in mesh.materials:
+        Materials[j] = {}
+        Materials[j].update({'name':mat.name})
+        Materials[j].update({'diffuse':mat.diffuse_intensity})
+        color = [0,0,0]
+        color[0] = mat.diffuse_color[0]
+        color[1] = mat.diffuse_color[1]
+        color[2] = mat.diffuse_color[2]
+        Materials[j].update({'color':color})
+        j+=1
+
+    slotNames = [slot.name for slot in obj.material_slots]
+    materialNames = [slot.material.name if slot.material is not None else None
+                     for slot in obj.material_slots]
+    return buildExportBuffers(buffers, slotNames, materialNames, Areas, Materials,
+                              modelName, modelIntro)
 
 ###############################################################################################
 ####    MAGIC_export operator class                                    ########################
@@ -1053,302 +817,173 @@ class MAGIC_export(bpy.types.Operator):
     bl_idname = "magic.export"
     bl_label = "export"
 
+    ### The export running in the background, if any (one at a time)
+    currentJob = None
+
     def execute(self, context):
+        if MAGIC_export.currentJob is not None:
+            bpy.ops.error.message('INVOKE_DEFAULT',
+                                  type="Error",
+                                  message='An export is already running, wait for it or cancel it first')
+            return {'CANCELLED'}
+
+        try:
+            levels = parseLevels(context.scene.export_lods)
+        except ValueError as e:
+            bpy.ops.error.message('INVOKE_DEFAULT',
+                                  type="Error",
+                                  message=str(e))
+            return {'CANCELLED'}
+
         fileName = context.scene.export_path + context.scene.inputName_model
         
         
-        data = {}
         obj = bpy.context.active_object  # particular object by name
-        mesh = obj.data
-        
-        
+        buffers = snapshotExport(obj, context.scene.inputName_model,
+                                 context.scene.inputIntroduction_model)
+        
+        ### The raw json (used by the import), the binary model and the pickle
+        ### are side outputs, the processed file is built straight from the
+        ### snapshot in memory. Everything from here runs in a worker thread
+        ### so blender stays responsive, and modal() reports the progress
+        options = {'raw_json': context.scene.export_raw_json,
+                   'binary': context.scene.export_binary,
+                   'pickle': context.scene.export_pickle,
+                   'incremental': context.scene.export_incremental,
+                   'face_grid': context.scene.export_face_grid,
+                   'lods': levels,
+                   'profile': sceneProfile(context.scene)}
+        job = exportJob(fileName, buffers, options)
+        MAGIC_export.currentJob = job
+        job.start()
 
-        ## Obtaining vertices data
-        i = 0
-        Vertices = {}
-
-        for vert in mesh.vertices:
-            Vertices[i] = [vert.co.x,vert.co.y,vert.co.z]
-            i+=1
-   
-        ## Obtaining faces data
-        ## remember to leave edit mode so 
-        ## changes reflect on the data <-- very important
-        j=0
-        Faces = {}
-
-        for face in mesh.polygons:
-            currentFace = []
-            currentNormal = []
-            Faces[j] = {}
-            
-            for val in face.normal:
-                currentNormal.append(val)
-            for vert in face.vertices:
-                currentFace.append(vert)
-                
-            Faces[j].update({'vertices':currentFace})
-            Faces[j].update({'normal':currentNormal})
-            j+=1
-
-        j=0
-        for face in mesh.polygons:
-            if obj.material_slots[face.material_index].name.startswith('mainBody'):
-                Faces[j].update({'area_index':0})
-            else :   
-                Faces[j].update({'area_index':face.material_index})
-            j+=1
-        ## Areas information, dictionary with the 
-        ## 5 values that compose an area data structure
-        j=0
-        Areas = {}
-        for a in obj.area_list:
-            Areas[j] = {}
-            Areas[j].update({'area_index': a.area_index})
-            Areas[j].update({'area_label': a.area_label})
-            Areas[j].update({'area_gesture': a.area_gesture})
-            Areas[j].update({'area_content':a.area_content})
-            color = [0,0,0,0]
-            color[0] = a.area_color[0]
-            color[1] = a.area_color[1]
-            color[2] = a.area_color[2]
-            color[3] = a.area_color[3]
-    
-            Areas[j].update({'area_color':color})
-            j+=1
-
-        ## Storing all the materials to avoid problems for now
-        j=0
-        Materials = {}
-        for mat in mesh.materials:
-            Materials[j] = {}
-            Materials[j].update({'name':mat.name})
-            Materials[j].update({'diffuse':mat.diffuse_intensity})
-            color = [0,0,0]
-            color[0] = mat.diffuse_color[0]
-            color[1] = mat.diffuse_color[1]
-            color[2] = mat.diffuse_color[2]
-            Materials[j].update({'color':color})
-            j+=1
-    
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.2, context.window)
+        wm.progress_begin(0, 100)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
 
-        
-        
+    def modal(self, context, event):
+        job = MAGIC_export.currentJob
+        if event.type == 'ESC':
+            job.cancel()
 
-        ### Find the verts for xyz surfaces to store in the json file
-        xz = []
-        yz = []
-        for polygon in mesh.polygons:
-            mat = obj.material_slots[polygon.material_index].material.name
-            if mat is not None:
-                if mat.startswith("xzFace"):
-                    verts_in_xzFace = polygon.vertices[:]
-                    for vert in verts_in_xzFace:
-                        xz.append(list(obj.data.vertices[vert].co))
-                if mat.startswith("yzFace"):
-                    verts_in_yzFace = polygon.vertices[:]
-                    for vert in verts_in_yzFace:
-                        yz.append(list(obj.data.vertices[vert].co))
-        
-        
-        ## Storing data
-        data['vertices'] = Vertices
-        data['faces'] = Faces
-        data['materials'] = Materials
-        data['areas'] = Areas
-        data['xz'] = xz
-        data['yz'] = yz
-        data['modelname'] = context.scene.inputName_model
-        data['modeldescription'] = context.scene.inputIntroduction_model
-        
-        thread = threading.Thread(target= writeFile(fileName,data))
-        thread.start()
-
-        # wait here for the result to be available before continuing
-        thread.join()
-        with open(fileName + ".json", encoding='utf8') as json_file:
-            dataprocess = json.load(json_file, object_pairs_hook=OrderedDict)
-
-        blenderData = []
-        xyz = []
-        marked = []
-        unmarked = []
-        vertices = []
-        areas = []
-        modelInfo = []
-        faceMap = {}
-        pointMap = {}
-        
-        modelInfo.append(context.scene.inputName_model)
-        modelInfo.append(context.scene.inputIntroduction_model)
-        
-        xyz.append(data["xz"])
-        xyz.append(data["yz"])
-        
-        blenderData.append(xyz)
-        
-        
-        areas = [dataprocess['areas']]
-        
-        vertices = [dataprocess['vertices']]
-        
-        faces = dataprocess['faces']
-        
-        for f in faces:
-            if faces[f]['area_index'] == 0:
-                currentface = []
-                currentvertices = []
-                currentverticesindexes = []
-                currentnormal = []
-        
-                for v in faces[f]['vertices']:
-                    currentvertices.append(vertices[0][str(v)])
-                    currentverticesindexes.append(str(v))
-                for v in faces[f]['normal']:
-                    currentnormal.append(v)
-        
-                faceMap[f] = currentverticesindexes
-                currentface.append(currentvertices)
-                currentface.append(currentnormal)
-                currentface.append(f)
-                unmarked.append(currentface)
-            else:
-                currentface = []
-                generalinfo = []
-                color = []
-                currentvertices = []
-                currentverticesindexes = []
-                currentnormal = []
-                areaindex = faces[f]['area_index'] - 1
-                for v in faces[f]['vertices']:
-                    currentverticesindexes.append(str(v))
-                generalinfo.append(f)
-        
-                generalinfo.append(areas[0][str(areaindex)]['area_label'])
-                generalinfo.append(areas[0][str(areaindex)]['area_content'])
-                generalinfo.append(areas[0][str(areaindex)]['area_gesture'])
-                generalinfo.append(str(areaindex))
-        
-                color.append(areas[0][str(areaindex)]['area_color'])
-        
-                for v in faces[f]['vertices']:
-                    currentvertices.append(vertices[0][str(v)])
-                for v in faces[f]['normal']:
-                    currentnormal.append(v)
-                faceMap[f] = currentverticesindexes
-                currentface.append(generalinfo)
-        
-        
-                currentface.append(color[0])
-                currentface.append(currentvertices)
-                currentface.append(currentnormal)
-                
-                marked.append(currentface)
-        
-        blenderData.append(marked)
-        blenderData.append(unmarked)
-        blenderData.append(modelInfo)
-        
-        
-        
-        for faceIndex in iter(faceMap):
-            for pointIndex in faceMap.get(faceIndex):
-                if pointIndex not in pointMap:
-                    pointMap[pointIndex] = set()
-                pointMap.get(pointIndex).add(faceIndex)
-        
-        
-        
-        newdata = [blenderData, faceMap, pointMap]
-        
-        thread = threading.Thread(target= writeFilePickle(fileName,newdata))
-        thread.start()
-        
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
 
-        # wait here for the result to be available before continuing
-        thread.join()
-        
-        INPUTFILEADDRESS = fileName
-        OUTPUTFILEADDRESS = fileName + "processed.json"
-        
-        modelData = blenderReader(INPUTFILEADDRESS)
-        
-        FaceDict={}
-        index = 0
-        tempcount = 0
-        
-        for eachFaceIndex in range(len(modelData.allFaces)):
-            eachFace = modelData.allFaces[eachFaceIndex]
-            templist = {}
-            templist['marked'] = eachFace.marked
-            if(eachFace.marked == True):
-                templist['area_id'] = eachFace.area_id
-            if eachFace.marked:
-                templist['index'] = eachFaceIndex
-                
-                templist['color'] = {"r":eachFace.blender_color[0],
-                                  "g":eachFace.blender_color[1],
-                                  "b": eachFace.blender_color[2]}
-        
-                tempcount = tempcount +1
-            else:
-                templist['index'] = eachFaceIndex
-        
-                templist['color'] = "null"
-        
-            if eachFace.label == "Body":
-                eachFace.label = "m_body"
-        
-            if eachFace.label == "Jet engine":
-                eachFace.label = "m_jet"
-        
-            if eachFace.label == "Cockpit":
-                eachFace.label = "m_cockpit"
-        
-            if eachFace.label == "unmarked":
-                eachFace.label = "nolabel"
-                eachFace.content = "please activate an element with label"
-        
-            templist['label'] = eachFace.label
-            templist['content'] = eachFace.content
-            templist['normal'] = {"x":eachFace.normalConverted[0],
-                                  "y":eachFace.normalConverted[1],
-                                  "z": eachFace.normalConverted[2]}
-            templist['verts'] = dict(vert1={'x': eachFace.vertsConverted[0][0],
-                                            'y': eachFace.vertsConverted[0][1],
-                                            'z': eachFace.vertsConverted[0][2]
-                                            },
-                                     vert2={'x': eachFace.vertsConverted[1][0],
-                                            'y': eachFace.vertsConverted[1][1],
-                                            'z': eachFace.vertsConverted[1][2]
-                                                      },
-                                     vert3={'x': eachFace.vertsConverted[2][0],
-                                            'y': eachFace.vertsConverted[2][1],
-                                            'z': eachFace.vertsConverted[2][2]
-                                                                })
-        
-        
-            tempIndexes = {}
-            count = 0
-            for eachNearFace in eachFace.relatedFaces:
-                tempIndexes[str(count)] = eachNearFace
-                count = count + 1
-        
-            templist['nearFaces'] = tempIndexes
-            FaceDict['face'+str(index)]= templist
-            index = index +1
-        
-        ExportData = {
-            'modelName': modelData.generalInfo[0],
-            'modelIntro' : modelData.generalInfo[1],
-            'faces' : FaceDict
-        }
-        
-        with open(OUTPUTFILEADDRESS, 'w') as outfile:
-            json.dump(ExportData, outfile)
+        wm = context.window_manager
+        wm.progress_update(int(job.progress * 100))
+        for area in context.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+        if not job.finished:
+            return {'PASS_THROUGH'}
+
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        MAGIC_export.currentJob = None
+        if job.cancelled:
+            self.report({'WARNING'}, "Export cancelled")
+            return {'CANCELLED'}
+        if job.error is not None:
+            bpy.ops.error.message('INVOKE_DEFAULT',
+                                  type="Error",
+                                  message='The export failed: ' + job.error)
+            return {'CANCELLED'}
+        self.report({'INFO'}, "Exported " + job.fileName + "processed.json in " + job.timer.summary())
+        return {'FINISHED'}
+
+### Cancels the export running in the background (the panel shows it instead
+### of the export button while the export runs)
 
+class MAGIC_exportcancel(bpy.types.Operator):
+    bl_idname = "magic.export_cancel"
+    bl_label = "cancel export"
+
+    def execute(self, context):
+        if MAGIC_export.currentJob is not None:
+            MAGIC_export.currentJob.cancel()
         return {'FINISHED'}
+
+###############################################################################################
+####    Mesh construction used by both imports                        #########################
+####    Fills the mesh with vertices.add/loops.add/polygons.add and   #########################
+####    foreach_set from the flat arrays of readRawData               #########################
+###############################################################################################
+
+def buildMesh(name, buffers):
+    co = buffers['co']
+    vertices = buffers['vertices']
+    loopTotal = buffers['loop_total']
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(co))
+    mesh.loops.add(len(vertices))
+    mesh.polygons.add(len(loopTotal))
+
+    mesh.vertices.foreach_set("co", co.ravel())
+    mesh.loops.foreach_set("vertex_index", vertices)
+    mesh.polygons.foreach_set("loop_start", buffers['loop_start'])
+    mesh.polygons.foreach_set("loop_total", loopTotal)
+    ### Faces are painted with the material of their area in the same pass
+    mesh.polygons.foreach_set("material_index", buffers['area_index'])
+
+    mesh.update(calc_edges=True)
+    return mesh
+
+### The stages are timed with timer (a stageTimer) if given
+
+def importModel(context, buffers, meshName, objectName, timer=None):
+    if timer is None:
+        timer = stageTimer()
+    with timer.stage("building mesh"):
+        NewMesh = buildMesh(meshName, buffers)
+    timer.count('vertices', len(buffers['co']))
+    timer.count('polygons', len(buffers['loop_total']))
+    timer.count('areas', len(buffers['areas']))
+
+    NewObj = bpy.data.objects.new(objectName, NewMesh)
+    
+    ### linking the new object to the scene
+    context.scene.objects.link(NewObj)
+    
+    ### We select the object to add the materials and also the areas.
+    context.scene.objects.active = NewObj
+    
+    ob = NewObj
+    mesh = ob.data
+
+    ### Here we start adding the materials
+    materials = buffers['materials']
+    for i in range(len(materials)):
+        currentData = materials[str(i)]
+        material = makeMaterial(name=currentData['name'], diffuse=currentData['color'], alpha=currentData['diffuse'])
+        mesh.materials.append(material)
+        
+    ### Here we start adding the areas
+    areas = buffers['areas']
+    for i in range(len(areas)):
+        currentData = areas[str(i)]
+        ob.area_list.add()
+        ob.area_list[-1].area_index = currentData['area_index']
+        ob.area_list[-1].area_label = currentData['area_label']
+        ob.area_list[-1].area_content = currentData['area_content']
+        ob.area_list[-1].area_gesture = currentData['area_gesture']
+        ob.area_list[-1].area_color = currentData['area_color']
     
+    ### Check in which mode we are to handle errors
+    with timer.stage("cleaning mesh"):
+        if ob.mode != 'EDIT' :
+            bpy.ops.object.mode_set(mode='EDIT')
+            bpy.ops.mesh.remove_doubles(threshold=0.0001)
+            
+        bpy.ops.mesh.select_all(action='SELECT')
+        bpy.ops.mesh.normals_make_consistent(inside=False)
+        
+        bpy.ops.object.editmode_toggle()
+    return ob
+
 ###############################################################################################
 ####    MAGIC_import operator class                                    ########################
 ####    In this class we define the functions used to import the model #######################
@@ -1363,111 +998,22 @@ class MAGIC_import(bpy.types.Operator):
         
         ## SUPER SPECIAL NOTE ABOUT tracker scaffold, need to select the model after the scaffold, so materials store properly.
         ## Import file - Done
-        with open(context.scene.import_path) as json_file:  
-            data = json.load(json_file, object_pairs_hook=OrderedDict)
-        
-        ## Add each vertex to a list - Done
-        Vertices = []
-        i=0
-        for p in data['vertices']:
-            p = data['vertices'][str(i)]
-            vector = mathutils.Vector((p))
-            Vertices.append(vector)
-            i+=1
-        
-        
-        ## Add each face to a list - Done
-        Faces = []
-        i=0
-        for f in data['faces']:
-            f = data['faces'][str(i)]['vertices']
-            Faces.append(f)
-            i+=1
-        
-        ## Use file name to add the new mesh
-        NewMesh = bpy.data.meshes.new("newModel")
-        
-        ### We define how the mesh will be built
-        
-        ## Use both lists to build the model
-        NewMesh.from_pydata \
-            (
-                Vertices,
-                [],
-                Faces
-            )
-        NewMesh.update()
-        
-        context = bpy.context
-        ## Use file name again to link it
-        NewObj = bpy.data.objects.new("newModel", NewMesh)
-        
-        ### linking the new object to the scene
-        context.scene.objects.link(NewObj)
-        
-        ### We select the object to add the materials to the face, and also the areas.
-        context.scene.objects.active = NewObj
-        
-        ob = bpy.context.object 
-                        
-        current_mode = bpy.context.object.mode
-        
-        ### Check in which mode we are to handle errors
-        if current_mode != 'EDIT' :
-            bpy.ops.object.editmode_toggle()
-        
-        ### Object data
-        mesh = ob.data
-        
-        ### Here we start adding the materials
-        
-        ##material = makeMaterial(name=p.name, diffuse=p.color, alpha=p.diffuse)
-        ##mesh.materials.append(material)
-        i=0
-        for p in data['materials']:
-            ## Change all of this to makeMaterial when doing in main component
-            currentData = data['materials'][str(i)]
-            material = makeMaterial(name=currentData['name'], diffuse=currentData['color'], alpha=currentData['diffuse'])
-            mesh.materials.append(material)
-            i+=1
-            
-        ### Here we start adding the areas
-        i=0
-        for p in data['areas']:
-            currentData = data['areas'][str(i)]
-            ob.area_list.add()
-            ob.area_list[-1].area_index = currentData['area_index']
-            ob.area_list[-1].area_label = currentData['area_label']
-            ob.area_list[-1].area_content = currentData['area_content']
-            ob.area_list[-1].area_gesture = currentData['area_gesture']
-            ob.area_list[-1].area_color = currentData['area_color']
-            i+=1
-        
-        ### Here we paint all the faces depending on their index    
-        mesh = ob.data
-        
-        if bpy.context.object.mode != 'EDIT' :
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.remove_doubles(threshold=0.0001)
-            
-        bm = bmesh.from_edit_mesh(mesh)
-        if hasattr(bm.faces, "ensure_lookup_table"): 
-            bm.faces.ensure_lookup_table()
-        
-        ### We add the materials xzFace and yzFace to 2 specific faces in
-        ### the scaffold to have a point of reference.
-        i=0
-        for f in data['faces']:
-            area_index = data['faces'][str(i)]['area_index']
-            bm.faces[i].material_index = area_index
-            i+=1
-            
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.normals_make_consistent(inside=False)
+        timer = stageTimer(sceneProfile(context.scene))
+        try:
+            with timer.stage("reading model"):
+                buffers = readModelFile(context.scene.import_path)
+        except ValueError as e:
+            bpy.ops.error.message('INVOKE_DEFAULT',
+                                  type="Error",
+                                  message=str(e))
+            return {'FINISHED'}
         
-            
-        bpy.ops.mesh.sel
-        bpy.ops.object.editmode_toggle()   
+        importModel(bpy.context, buffers, "newModel", "newModel", timer)
+        timer.stop()
+        self.report({'INFO'}, "Imported " + context.scene.import_path + " in " + timer.summary())
+        ### With a profile on, the timings are saved next to the imported file
+        if timer.modes:
+            timer.writeReport(os.path.splitext(context.scene.import_path)[0] + REPORT_SUFFIX)
 
         return {'FINISHED'}
 
@@ -1543,6 +1089,49 @@ def register():
             description="Define the file address to import the model",
             subtype='FILE_PATH'
         )
+    bpy.types.Scene.export_raw_json = bpy.props.BoolProperty \
+            (
+            name="Save raw JSON",
+            default=True,
+            description="Also save the raw model json, used to import and relabel the model"
+        )
+    bpy.types.Scene.export_pickle = bpy.props.BoolProperty \
+            (
+            name="Save pickle",
+            default=False,
+            description="Also save the intermediate pickle file of the export"
+        )
+    bpy.types.Scene.export_binary = bpy.props.BoolProperty \
+            (
+            name="Save binary model",
+            default=False,
+            description="Also save the model as a compact .magicbin file, which the import can read"
+        )
+    bpy.types.Scene.export_incremental = bpy.props.BoolProperty \
+            (
+            name="Incremental export",
+            default=True,
+            description="Keep a cache next to the processed file, so exporting again after changing only labels rewrites just the faces that changed"
+        )
+    bpy.types.Scene.export_face_grid = bpy.props.BoolProperty \
+            (
+            name="Save face index",
+            default=True,
+            description="Also save a spatial index of the faces (<name>grid.npz), so Talkit++ finds the face under a fingertip without going through all of them"
+        )
+    bpy.types.Scene.export_lods = bpy.props.StringProperty \
+            (
+            name="Levels of detail",
+            default="",
+            description="Face counts of smaller versions of the model to save next to the processed file (<name>lod1processed.json...), like 20000, 5000"
+        )
+    bpy.types.Scene.export_profile = bpy.props.EnumProperty(
+        items=[('NONE', 'No profile', "Only time the stages (the MAGIC_PROFILE environment variable still applies)", 0),
+               ('cprofile', 'cProfile', "Profile the calls, saved as a .prof file next to the export", 1),
+               ('tracemalloc', 'tracemalloc', "Record the memory used by every stage", 2),
+               ('all', 'cProfile and tracemalloc', "Both profiles", 3)],
+        name="Profile",
+        description="Profile to save with the timings.json report of the export")
     bpy.types.Scene.model_id = bpy.props.StringProperty \
             (
             name="Model ID",
@@ -1566,6 +1155,22 @@ def register():
             subtype='FILE_NAME'
         )
 
+    bpy.types.Scene.decimate_faces = bpy.props.IntProperty \
+            (
+            name="Faces",
+            default=0,
+            min=0,
+            description="Number of faces to decimate the model to (0 to only use the maximum error)"
+        )
+
+    bpy.types.Scene.decimate_error = bpy.props.FloatProperty \
+            (
+            name="Maximum error",
+            default=0.0,
+            min=0.0,
+            description="How far the decimation may move a vertex (0 to only use the number of faces)"
+        )
+
     bpy.types.Object.area_list = bpy.props.CollectionProperty(type=cls_AreaData)
 
 
@@ -1579,7 +1184,16 @@ def unregister():
     del bpy.types.Scene.inputGesture_hotarea
     del bpy.types.Scene.export_path
     del bpy.types.Scene.import_path
+    del bpy.types.Scene.export_raw_json
+    del bpy.types.Scene.export_pickle
+    del bpy.types.Scene.export_binary
+    del bpy.types.Scene.export_incremental
+    del bpy.types.Scene.export_face_grid
+    del bpy.types.Scene.export_lods
+    del bpy.types.Scene.export_profile
     del bpy.types.Scene.model_id
+    del bpy.types.Scene.decimate_faces
+    del bpy.types.Scene.decimate_error
     del bpy.types.Object.area_list
 
 
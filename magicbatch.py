@@ -0,0 +1,16 @@
+#Headless batch exporter for Magic Maker models, see magiccore/batch.py
+#
+#   python magicbatch.py models/ -o processed/ -j 8
+#   blender --background --python magicbatch.py -- models/ -o processed/ -j 8
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from magiccore.batch import main
+
+if __name__ == "__main__":
+    ### blender passes its own arguments first, ours come after "--"
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    sys.exit(main(argv))
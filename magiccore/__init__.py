@@ -0,0 +1,27 @@
+#Core of the Magic Maker add-on: the conversion from the exported Blender
+#model to the processed Talkit++ file. It only needs NumPy, so it runs
+#inside Blender (magicaddon.py is a thin layer over it), outside of it
+#(magicbatch.py) or on a server:
+#
+#   import magiccore
+#   buffers = magiccore.readModelFile("demo/cell.json")
+#   magiccore.runExport("cell", buffers, {}, lambda stage, progress: None)
+#
+#magiccore.online (online models) also needs requests
+
+from .scaffold import SCAFFOLD_VERTICES, SCAFFOLD_FACES, SCAFFOLD_XZ_FACE, SCAFFOLD_YZ_FACE
+from .transform import solve_affine, solve_point, solve_normal, solve_points, solve_normals
+from .calibration import scaffoldCalibration, calibrate, rememberCalibration, matchScaffoldPoints
+from .adjacency import buildFaceAdjacency, relateFaces, faceMapToLoops
+from .reader import faceTable, blenderFace, blenderPoint, blenderReader, buildBlenderData
+from .mesh import buildExportBuffers, classifySlots, fanTriangles, triangulateBuffers
+from .labels import labelKey, labelRegistry, planCompaction
+from .formats import (writeFile, writeFilePickle, buildRawData, readRawData,
+                      writeBinaryFile, readBinaryFile, openBinaryFile, readModelFile, BINARY_EXTENSION)
+from .aggregates import faceMeasures, areaAggregates, areaSection
+from .processed import iterProcessedFaces, buildProcessedData, writeProcessedFile
+from .instrument import stageTimer, profileModes, PROFILE_ENV, REPORT_SUFFIX
+from .incremental import geometryKey, readExportCache, writeExportCache, rewriteProcessedFile, CACHE_SUFFIX
+from .spatial import faceGrid, buildFaceGrid, readFaceGrid, pointTriangleDistance, GRID_SUFFIX
+from .decimate import decimateBuffers, levelsOfDetail, scaffoldFaces, parseLevels
+from .pipeline import ExportCancelled, runExport, exportJob
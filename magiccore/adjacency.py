@@ -0,0 +1,72 @@
+#Face adjacency of a mesh, used for the nearFaces of the processed file
+
+import numpy as np
+
+#build the vertex to face and the face to face adjacency of a mesh in CSR form
+#(offsets + indices), from the face vertex indices (vertices, loopStart, loopTotal).
+#The faces of vertex v are vertexFaces[vertexOffsets[v]:vertexOffsets[v+1]], and
+#the related faces of face f (every face sharing a vertex with f, f included,
+#in increasing order) are faceFaces[faceOffsets[f]:faceOffsets[f+1]]
+def buildFaceAdjacency(vertices, loopStart, loopTotal, vertexCount=None):
+    vertices = np.asarray(vertices, dtype=np.int64)
+    loopTotal = np.asarray(loopTotal, dtype=np.int64)
+    faceCount = len(loopTotal)
+    if vertexCount is None:
+        vertexCount = int(vertices.max()) + 1 if len(vertices) else 0
+
+    #face of every loop, face f owns the loops loopStart[f] .. loopStart[f]+loopTotal[f]-1
+    loopFace = np.empty(len(vertices), dtype=np.int64)
+    loopFace[np.repeat(np.asarray(loopStart, dtype=np.int64), loopTotal) +
+             _rangeInGroups(loopTotal)] = np.repeat(np.arange(faceCount, dtype=np.int64), loopTotal)
+
+    #vertex to face, loops sorted by vertex
+    order = np.argsort(vertices, kind='stable')
+    vertexFaces = loopFace[order]
+    vertexOffsets = np.zeros(vertexCount + 1, dtype=np.int64)
+    np.cumsum(np.bincount(vertices, minlength=vertexCount), out=vertexOffsets[1:])
+
+    #face to face, every loop of a face pulls in all the faces of its vertex
+    counts = vertexOffsets[vertices + 1] - vertexOffsets[vertices]
+    pairFace = np.repeat(loopFace, counts)
+    pairOther = vertexFaces[np.repeat(vertexOffsets[vertices], counts) + _rangeInGroups(counts)]
+    pairs = np.unique(pairFace * faceCount + pairOther)
+
+    faceFaces = pairs % max(faceCount, 1)
+    faceOffsets = np.zeros(faceCount + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pairs // max(faceCount, 1), minlength=faceCount), out=faceOffsets[1:])
+    return vertexOffsets, vertexFaces, faceOffsets, faceFaces
+
+#the related faces of the faces in order (indices of the whole mesh of faceCount
+#faces), from the faceOffsets/faceFaces of buildFaceAdjacency: the faces of order
+#sharing a vertex with each one, as positions in order, in increasing order.
+#Faces not in order are left out. Returns (offsets, related) in CSR form
+def relateFaces(order, faceOffsets, faceFaces, faceCount):
+    order = np.asarray(order, dtype=np.int64)
+    newIndex = np.full(faceCount, -1, dtype=np.int64)
+    newIndex[order] = np.arange(len(order))
+    starts = faceOffsets[order]
+    counts = faceOffsets[order + 1] - starts
+    ### the adjacency of the faces of order, one after the other
+    related = newIndex[faceFaces[np.repeat(starts, counts) + _rangeInGroups(counts)]]
+    position = np.repeat(np.arange(len(order)), counts)
+    keep = related >= 0
+    related = related[keep]
+    position = position[keep]
+    sort = np.lexsort((related, position))
+    offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(position, minlength=len(order)), out=offsets[1:])
+    return offsets, related[sort]
+
+#[0, 1, .., n0-1, 0, 1, .., n1-1, ...] for a list of group sizes
+def _rangeInGroups(counts):
+    ends = np.cumsum(counts)
+    return np.arange(ends[-1] if len(ends) else 0, dtype=np.int64) - np.repeat(ends - counts, counts)
+
+#turn the faceMap of an old pickle ({face: [vertex, ...]}) into face vertex arrays
+def faceMapToLoops(faceMap):
+    faceList = [faceMap[str(f)] for f in range(len(faceMap))]
+    loopTotal = np.array([len(face) for face in faceList], dtype=np.int64)
+    loopStart = np.zeros(len(faceList), dtype=np.int64)
+    np.cumsum(loopTotal[:-1], out=loopStart[1:])
+    vertices = np.array([int(v) for face in faceList for v in face], dtype=np.int64)
+    return {'vertices': vertices, 'loop_start': loopStart, 'loop_total': loopTotal}
@@ -0,0 +1,115 @@
+#Per-area aggregates of the processed file: the faces of every area, its
+#bounding box, centroid, surface area and average normal in Tracker
+#coordinates, written as the "areas" section so the tools reading the file
+#don't have to regroup every face record. They are computed from a few
+#measures of every face (faceMeasures), which the incremental export keeps in
+#its cache to compute the aggregates again when only the labels change
+
+import numpy as np
+
+from .mesh import fanTriangles
+
+#the measures of every face of the processed file, from its points (the
+#verts of face i are points[pointOffsets[i]:pointOffsets[i+1]], at least 3 of
+#them) and normals:
+#  surface   the area of the face (fan triangulated from its first vert)
+#  centroid  the centroid of its surface (of its verts if it has no surface)
+#  lower, upper  its bounding box
+#  normal    its normal
+def faceMeasures(points, pointOffsets, normals):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    pointOffsets = np.asarray(pointOffsets, dtype=np.int64)
+    faceCount = len(pointOffsets) - 1
+    counts = np.diff(pointOffsets)
+    if faceCount == 0:
+        empty = np.zeros((0, 3))
+        return {'surface': np.zeros(0), 'centroid': empty, 'lower': empty, 'upper': empty, 'normal': empty}
+
+    ### the fan triangles (first, k, k + 1) of every face
+    corners, fanFace = fanTriangles(pointOffsets[:-1], counts)
+    a, b, c = points[corners[:, 0]], points[corners[:, 1]], points[corners[:, 2]]
+    cross = np.cross(b - a, c - a)
+    fanSurface = 0.5 * np.sqrt(np.einsum('kj,kj->k', cross, cross))
+    surface = np.bincount(fanFace, fanSurface, minlength=faceCount)
+    weighted = np.stack([np.bincount(fanFace, fanSurface * (a[:, j] + b[:, j] + c[:, j]) / 3.0, minlength=faceCount)
+                         for j in range(3)], axis=1)
+
+    starts = pointOffsets[:-1]
+    vertexMean = np.add.reduceat(points, starts, axis=0) / counts[:, None]
+    lower = np.minimum.reduceat(points, starts, axis=0)
+    upper = np.maximum.reduceat(points, starts, axis=0)
+    flat = surface > 0
+    centroid = np.where(flat[:, None], weighted / np.where(flat, surface, 1.0)[:, None], vertexMean)
+    return {'surface': surface, 'centroid': centroid, 'lower': lower, 'upper': upper,
+            'normal': np.asarray(normals, dtype=np.float64).reshape(-1, 3)}
+
+#the measures of the faces of a faceTable, in Tracker coordinates
+def tableMeasures(faces):
+    return faceMeasures(faces.verts_converted, faces.point_offsets, faces.normal_converted)
+
+#the measures of the faces rows (an index array) of measures
+def selectMeasures(measures, rows):
+    return {name: values[rows] for name, values in measures.items()}
+
+#aggregate the measures of the faces by area. areaIds is the area position of
+#every face (-1 for an unmarked face). Returns the positions of the areas with
+#faces and, for each of them, its faces (face indices, increasing), bounding box,
+#surface-weighted centroid, total surface and surface-weighted unit normal
+def areaAggregates(measures, areaIds):
+    areaIds = np.asarray(areaIds, dtype=np.int64)
+    marked = np.flatnonzero(areaIds >= 0)
+    ### the marked faces grouped by area, each group in increasing face order
+    faces = marked[np.argsort(areaIds[marked], kind='stable')]
+    groupIds = areaIds[faces]
+    if len(faces) == 0:
+        empty = np.zeros((0, 3))
+        return {'positions': np.zeros(0, dtype=np.int64), 'faces': [], 'lower': empty, 'upper': empty,
+                'centroid': empty, 'surface': np.zeros(0), 'normal': empty}
+    starts = np.flatnonzero(np.r_[True, groupIds[1:] != groupIds[:-1]])
+
+    counts = np.diff(np.r_[starts, len(faces)])
+    group = np.repeat(np.arange(len(starts)), counts)
+    surface = measures['surface'][faces]
+    totalSurface = np.add.reduceat(surface, starts)
+    ### the faces of an area without surface all weigh the same
+    flat = totalSurface > 0
+    weight = np.where(flat[group], surface, 1.0)[:, None]
+    centroid = (np.add.reduceat(measures['centroid'][faces] * weight, starts, axis=0) /
+                np.add.reduceat(weight, starts, axis=0))
+    normal = np.add.reduceat(measures['normal'][faces] * weight, starts, axis=0)
+    length = np.sqrt(np.einsum('kj,kj->k', normal, normal))
+    normal = normal / np.where(length > 0, length, 1.0)[:, None]
+
+    return {'positions': groupIds[starts],
+            'faces': np.split(faces, starts[1:]),
+            'lower': np.minimum.reduceat(measures['lower'][faces], starts, axis=0),
+            'upper': np.maximum.reduceat(measures['upper'][faces], starts, axis=0),
+            'centroid': centroid,
+            'surface': totalSurface,
+            'normal': normal}
+
+def _point(values):
+    return {"x": values[0], "y": values[1], "z": values[2]}
+
+#the "areas" section of the processed file: {area_id: record} for every area
+#with faces, in the order of the areas. areaRecords is the (area_id, color,
+#label, content) the face records of the area at each position show
+def areaSection(measures, areaIds, areaRecords):
+    aggregates = areaAggregates(measures, areaIds)
+    lower = aggregates['lower'].tolist()
+    upper = aggregates['upper'].tolist()
+    centroid = aggregates['centroid'].tolist()
+    surface = aggregates['surface'].tolist()
+    normal = aggregates['normal'].tolist()
+    section = {}
+    for k, position in enumerate(aggregates['positions'].tolist()):
+        areaId, color, label, content = areaRecords[position]
+        section[areaId] = {'label': label,
+                           'content': content,
+                           'color': dict(color),
+                           'faces': aggregates['faces'][k].tolist(),
+                           'bounds': {'min': _point(lower[k]), 'max': _point(upper[k])},
+                           'centroid': _point(centroid[k]),
+                           'surface_area': surface[k],
+                           'normal': _point(normal[k])}
+    return section
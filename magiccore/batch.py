@@ -0,0 +1,183 @@
+#Batch exporter, converts a whole directory of models to processed Talkit++ files
+#in a process pool, with per-model timing and an error summary:
+#
+#   python magicbatch.py models/ -o processed/ -j 8
+#   blender --background --python magicbatch.py -- models/ -o processed/ -j 8
+#
+#Raw export json files and .magicbin files are converted by any python with NumPy.
+#.blend files need blender: they are opened and snapshotted one by one on the main
+#process (with the add-on's snapshotExport) and only the conversion goes to the pool
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from .formats import readModelFile, BINARY_EXTENSION
+from .instrument import stageTimer, profileModes, REPORT_SUFFIX
+from .pipeline import runExport
+
+PROCESSED_SUFFIX = "processed.json"
+MODEL_EXTENSIONS = (".json", BINARY_EXTENSION, ".blend")
+
+#expand the directories of paths into the model files they hold (processed
+#files and timing reports written by an earlier run are skipped)
+def findModels(paths):
+    models = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                full = os.path.join(path, name)
+                if (os.path.isfile(full) and name.endswith(MODEL_EXTENSIONS)
+                        and not name.endswith((PROCESSED_SUFFIX, REPORT_SUFFIX))):
+                    models.append(full)
+        else:
+            models.append(path)
+    return models
+
+#convert one model (a model file, or the buffers of a snapshot) to fileName + "processed.json".
+#Returns the seconds spent in each stage, runs in the pool workers
+def convertModel(source, fileName, options):
+    timer = stageTimer(options.get('profile'))
+    with timer.stage("load"):
+        buffers = readModelFile(source) if isinstance(source, str) else source
+    if not buffers['modelname']:
+        buffers['modelname'] = os.path.basename(fileName)
+
+    runExport(fileName, buffers, options, lambda stage, progress: None, timer)
+    timings = OrderedDict((record['name'], record['seconds'])
+                          for record in timer.stages if "/" not in record['name'])
+    timings['total'] = timer.total()
+    return timings
+
+#the side outputs of options that would write over the model file itself, a
+#raw json (or .magicbin) export of a model saved where the model is
+def overwrittenBy(model, fileName, options):
+    outputs = []
+    if options.get('raw_json'):
+        outputs.append(("--raw-json", fileName + ".json"))
+    if options.get('binary'):
+        outputs.append(("--binary", fileName + BINARY_EXTENSION))
+    model = os.path.realpath(model)
+    return [flag for flag, output in outputs if os.path.realpath(output) == model]
+
+#open a .blend file in blender and snapshot its labelled object
+def snapshotBlend(path):
+    import bpy
+    import magicaddon
+    if not hasattr(bpy.types.Object, "area_list"):
+        magicaddon.register()
+    bpy.ops.wm.open_mainfile(filepath=path)
+    scene = bpy.context.scene
+    obj = scene.objects.active
+    if obj is None or obj.type != 'MESH':
+        labelled = [ob for ob in scene.objects if ob.type == 'MESH' and len(ob.area_list) > 0]
+        if len(labelled) != 1:
+            raise ValueError("can't tell which object to export, make the labelled object active")
+        obj = labelled[0]
+    modelName = os.path.splitext(os.path.basename(path))[0]
+    if scene.inputName_model and scene.inputName_model != "Enter Name":
+        modelName = scene.inputName_model
+    return magicaddon.snapshotExport(obj, modelName, scene.inputIntroduction_model)
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(prog="magicbatch",
+                                     description="Convert Magic Maker models to processed Talkit++ files")
+    parser.add_argument("paths", nargs="+",
+                        help="model files (raw export .json, .magicbin or .blend) or directories of them")
+    parser.add_argument("-o", "--output", default=None,
+                        help="directory for the processed files (default: next to each model)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--raw-json", action="store_true",
+                        help="also save the raw json of each model (raw json models need -o, "
+                             "the model itself is never written over)")
+    parser.add_argument("--binary", action="store_true",
+                        help="also save a .magicbin of each model (.magicbin models need -o)")
+    parser.add_argument("--pickle", action="store_true", help="also save the pickle of each model")
+    parser.add_argument("--incremental", action="store_true",
+                        help="keep a cache next to each processed file, a model converted again with the "
+                             "same geometry only has the faces whose labels changed rewritten")
+    parser.add_argument("--face-grid", action="store_true",
+                        help="also save the spatial index of the faces of each model (<name>grid.npz)")
+    parser.add_argument("--lods", nargs="+", type=int, default=[],
+                        help="also save each model decimated to these face counts (<name>lod1processed.json...)")
+    parser.add_argument("--report", default=None, help="write the timings and errors to this json file")
+    parser.add_argument("--profile", default=None,
+                        help="profile each model with cprofile, tracemalloc or both (cprofile,tracemalloc), "
+                             "the results go to the timings.json written next to each processed file")
+    args = parser.parse_args(argv)
+    try:
+        profileModes(args.profile)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+def main(argv=None):
+    args = parseArguments(argv)
+    options = {'raw_json': args.raw_json, 'binary': args.binary, 'pickle': args.pickle,
+               'incremental': args.incremental, 'face_grid': args.face_grid,
+               'lods': args.lods, 'profile': args.profile}
+    models = findModels(args.paths)
+    if args.output is not None:
+        os.makedirs(args.output, exist_ok=True)
+
+    results = OrderedDict()
+    batchStart = time.perf_counter()
+    if "bpy" in sys.modules:
+        ### the workers are plain python, not blender
+        import bpy
+        multiprocessing.set_executable(bpy.app.binary_path_python)
+
+    with ProcessPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+        futures = OrderedDict()
+        for model in models:
+            outputDir = args.output if args.output is not None else os.path.dirname(model)
+            fileName = os.path.join(outputDir, os.path.splitext(os.path.basename(model))[0])
+            try:
+                overwritten = overwrittenBy(model, fileName, options)
+                if overwritten:
+                    raise ValueError(" and ".join(overwritten) + " would write over the model, "
+                                     "save the outputs in another directory with -o")
+                source = model
+                if model.endswith(".blend"):
+                    if "bpy" not in sys.modules:
+                        raise ValueError(".blend files need blender, run this with blender --background --python")
+                    source = snapshotBlend(model)
+                futures[model] = pool.submit(convertModel, source, fileName, options)
+            except Exception as e:
+                results[model] = {'status': 'error', 'error': str(e), 'traceback': traceback.format_exc()}
+
+        for model, future in futures.items():
+            try:
+                results[model] = {'status': 'ok', 'timings': future.result()}
+            except Exception as e:
+                results[model] = {'status': 'error', 'error': str(e), 'traceback': traceback.format_exc()}
+            printResult(model, results[model])
+
+    failed = [model for model in results if results[model]['status'] != 'ok']
+    print("%d models converted, %d failed, %.2fs" %
+          (len(results) - len(failed), len(failed), time.perf_counter() - batchStart))
+    for model in failed:
+        print("  " + model + ": " + results[model]['error'])
+
+    if args.report is not None:
+        with open(args.report, 'w') as f:
+            json.dump(results, f, indent=4)
+    return 1 if failed else 0
+
+def printResult(model, result):
+    if result['status'] != 'ok':
+        print("FAILED " + model + ": " + result['error'])
+        return
+    timings = result['timings']
+    stages = ", ".join("%s %.3fs" % (stage, seconds) for stage, seconds in timings.items() if stage != 'total')
+    print("ok     %s  %.3fs  (%s)" % (model, timings['total'], stages))
+
+if __name__ == "__main__":
+    sys.exit(main())
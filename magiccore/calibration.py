@@ -0,0 +1,110 @@
+#Calibration of the scaffold: the affine transformation from the Blender
+#coordinates to the Tracker coordinates, found from the points of the xz and
+#yz reference faces (see scaffold.TRACKER_POINTS). The points are matched with
+#a tolerance, so a scaffold whose coordinates went through a float conversion
+#still calibrates, and the calibration of a scaffold is computed once per
+#process (every export of a Blender session, every model of a batch worker).
+#The calibration is saved in the exports (toDict) so the tools reading them can
+#use the matrix as it is, and an export read back skips the calibration
+
+import numpy as np
+
+from .scaffold import TRACKER_UNIT_SIZE, TRACKER_POINTS
+from .transform import solve_affine, solve_points, calScaledList
+
+#points closer than this (relative to the size of the reference faces) are the same point
+MATCH_TOLERANCE = 1e-5
+
+#the calibrations already computed, by calibrationKey
+_calibrations = {}
+
+#find the reference points A, B, C and D from the points of the xz and yz faces:
+#A is only in the xz face, D only in the yz face, B and C are in both (B is the
+#one closer to A). Raises ValueError if the faces don't share exactly two points
+def matchScaffoldPoints(vertsXZ, vertsYZ, tolerance=MATCH_TOLERANCE):
+    xz = np.asarray(vertsXZ, dtype=np.float64).reshape(-1, 3)
+    yz = np.asarray(vertsYZ, dtype=np.float64).reshape(-1, 3)
+    if len(xz) == 0 or len(yz) == 0:
+        raise ValueError("the model has no xz or yz reference face, add the tracker scaffold before exporting")
+    points = np.vstack((xz, yz))
+    size = max(float(np.ptp(points, axis=0).max()), 1.0)
+    shared = np.linalg.norm(xz[:, None, :] - yz[None, :, :], axis=2) <= tolerance * size
+
+    inXZ = np.flatnonzero(~shared.any(axis=1))
+    inYZ = np.flatnonzero(~shared.any(axis=0))
+    inBoth = np.flatnonzero(shared.any(axis=1))
+    if len(inBoth) != 2 or len(inXZ) != 1 or len(inYZ) != 1:
+        raise ValueError("the xz and yz reference faces should share 2 points and have 1 of their own, "
+                         "they share %d (is the scaffold deformed?)" % len(inBoth))
+    A = xz[inXZ[0]]
+    D = yz[inYZ[0]]
+    first, second = xz[inBoth[0]], xz[inBoth[1]]
+    if np.linalg.norm(first - A) > np.linalg.norm(second - A):
+        first, second = second, first
+    return A.tolist(), first.tolist(), second.tolist(), D.tolist()
+
+class scaffoldCalibration:
+    def __init__(self, A, B, C, D, unitSize=TRACKER_UNIT_SIZE, matrix=None):
+        #reference points in the Blender coordinates
+        self.A, self.B, self.C, self.D = A, B, C, D
+        self.unitSize = unitSize
+        #and in the Tracker coordinates
+        self.ptA = calScaledList(unitSize, TRACKER_POINTS['A'])
+        self.ptB = calScaledList(unitSize, TRACKER_POINTS['B'])
+        self.ptC = calScaledList(unitSize, TRACKER_POINTS['C'])
+        self.ptD = calScaledList(unitSize, TRACKER_POINTS['D'])
+        if matrix is None:
+            matrix = solve_affine(A, B, C, D, self.ptA, self.ptB, self.ptC, self.ptD)
+        self.matrix = np.matrix(matrix, dtype=np.float64)
+
+    #the calibration as saved in the exports
+    def toDict(self):
+        return {'points': {'A': self.A, 'B': self.B, 'C': self.C, 'D': self.D},
+                'unit_size': self.unitSize,
+                'matrix': self.matrix.tolist()}
+
+    @classmethod
+    def fromDict(cls, data):
+        points = data['points']
+        return cls(points['A'], points['B'], points['C'], points['D'],
+                   data.get('unit_size', TRACKER_UNIT_SIZE), data['matrix'])
+
+def calibrationKey(vertsXZ, vertsYZ, unitSize):
+    return (tuple(round(c, 5) for pt in vertsXZ for c in pt),
+            tuple(round(c, 5) for pt in vertsYZ for c in pt),
+            unitSize)
+
+#the calibration of the scaffold with these xz and yz faces, computed once
+def calibrate(vertsXZ, vertsYZ, unitSize=TRACKER_UNIT_SIZE):
+    key = calibrationKey(vertsXZ, vertsYZ, unitSize)
+    calibration = _calibrations.get(key)
+    if calibration is None:
+        calibration = scaffoldCalibration(*matchScaffoldPoints(vertsXZ, vertsYZ), unitSize=unitSize)
+        _calibrations[key] = calibration
+    return calibration
+
+#reuse the calibration saved in an export for its xz and yz faces. It is checked
+#against the points of the faces first, and its matrix has to take them to the
+#Tracker points, a calibration that doesn't match them (the file was edited by
+#hand...) is ignored and calibrate computes it again. Returns the calibration or None
+def rememberCalibration(data, vertsXZ, vertsYZ, unitSize=TRACKER_UNIT_SIZE):
+    key = calibrationKey(vertsXZ, vertsYZ, unitSize)
+    if not data or key in _calibrations:
+        return _calibrations.get(key)
+    try:
+        stored = scaffoldCalibration.fromDict(data)
+        points = matchScaffoldPoints(vertsXZ, vertsYZ)
+    except (KeyError, TypeError, ValueError):
+        return None
+    if stored.unitSize != unitSize or stored.matrix.shape != (4, 4):
+        return None
+    if not np.allclose(points, [stored.A, stored.B, stored.C, stored.D], rtol=0, atol=1e-6):
+        return None
+    ### an affine matrix that takes A, B, C and D where calibrate would
+    mapped = solve_points([stored.A, stored.B, stored.C, stored.D], stored.matrix)
+    expected = np.array([stored.ptA, stored.ptB, stored.ptC, stored.ptD], dtype=np.float64)
+    if (not np.all(np.isfinite(stored.matrix)) or not np.array_equal(stored.matrix[3], [[0, 0, 0, 1]]) or
+            not np.allclose(mapped, expected, rtol=0, atol=1e-9 * max(float(np.abs(expected).max()), 1.0))):
+        return None
+    _calibrations[key] = stored
+    return stored
@@ -0,0 +1,243 @@
+#Label-preserving decimation of mesh buffers by vertex clustering: the vertices
+#are snapped to a grid of cubic cells and the vertices of a cell merged into
+#their mean, the triangles that collapse are dropped. It keeps:
+#
+#  - the areas: vertices are only merged with vertices of the same area
+#    (material), and the vertices on the border of two areas aren't moved, so
+#    every area keeps its outline
+#  - the scaffold: the vertices of the xz and yz reference faces aren't moved,
+#    so the decimated model calibrates like the original
+#
+#The cell size comes from a face budget (targetFaces) or an error bound (how far
+#a vertex may move, maxError). Every face of the original gets the decimated
+#face it went into ('parent'), and levelsOfDetail chains the levels so each one
+#maps to the next coarser one
+
+import numpy as np
+
+from .mesh import triangulateBuffers
+from .reader import faceOrder
+
+#cell size rounds of the face budget search
+SEARCH_STEPS = 24
+#how far a face count may be under the budget when the search stops
+BUDGET_SLACK = 0.02
+#the smallest cell, a fraction of the size of the model (the cells of a model
+#and the areas are numbered with 64 bits integers)
+SMALLEST_CELL = 1 << 16
+
+#the faces of the xz and yz reference faces of the scaffold in mesh buffers:
+#the faces whose verts are all points of buffers['xz'] or buffers['yz']
+def scaffoldFaces(buffers):
+    co = np.asarray(buffers['co'], dtype=np.float64)
+    points = np.asarray(list(buffers.get('xz', [])) + list(buffers.get('yz', [])), dtype=np.float64).reshape(-1, 3)
+    onScaffold = np.zeros(len(co), dtype=bool)
+    for point in points:
+        onScaffold |= np.all(co == point, axis=1)
+    loops = onScaffold[np.asarray(buffers['vertices'])]
+    loopStart = np.asarray(buffers['loop_start'], dtype=np.int64)
+    ### a face is on the scaffold if none of its loops is off it
+    offLoops = np.add.reduceat((~loops).astype(np.int64), loopStart) if len(loopStart) else np.zeros(0)
+    return (offLoops == 0) & (np.asarray(buffers['loop_total']) > 0)
+
+#the area of every face, what the decimation keeps apart
+def _faceRegions(buffers):
+    if 'material_index' in buffers:
+        return np.asarray(buffers['material_index'], dtype=np.int64)
+    return np.asarray(buffers['area_index'], dtype=np.int64)
+
+class _clustering:
+    #triangles (T,3) vertex indices of co, region of every triangle, locked vertices
+    def __init__(self, co, triangles, region, locked):
+        self.co = co
+        self.triangles = triangles
+        self.region = region
+        used = np.zeros(len(co), dtype=bool)
+        used[triangles.ravel()] = True
+        ### the vertices on the border of two areas don't move
+        corners = triangles.ravel()
+        cornerRegion = np.repeat(region, 3)
+        lowest = np.full(len(co), np.iinfo(np.int64).max)
+        highest = np.full(len(co), np.iinfo(np.int64).min)
+        np.minimum.at(lowest, corners, cornerRegion)
+        np.maximum.at(highest, corners, cornerRegion)
+        self.fixed = locked | (used & (lowest != highest))
+        self.free = np.flatnonzero(used & ~self.fixed)
+        self.freeRegion = lowest[self.free]
+        self.regionCount = int(region.max()) + 1 if len(region) else 1
+        self.lower = co[used].min(axis=0) if used.any() else np.zeros(3)
+        self.extent = max(float((co[used].max(axis=0) - self.lower).max()), 1e-9) if used.any() else 1.0
+
+    #the cluster of every vertex for a cell size, and the number of clusters
+    def clusters(self, cellSize):
+        cellSize = max(cellSize, self.extent / SMALLEST_CELL)
+        dims = int(np.floor(self.extent / cellSize)) + 1
+        cell = np.floor((self.co[self.free] - self.lower) / cellSize).astype(np.int64)
+        key = ((cell[:, 0] * dims + cell[:, 1]) * dims + cell[:, 2]) * self.regionCount + self.freeRegion
+        ### fixed vertices are clusters of their own
+        cluster = np.full(len(self.co), -1, dtype=np.int64)
+        fixed = np.flatnonzero(self.fixed)
+        cluster[fixed] = np.arange(len(fixed))
+        unique, inverse = np.unique(key, return_inverse=True)
+        cluster[self.free] = len(fixed) + inverse.ravel()
+        return cluster, len(fixed) + len(unique)
+
+    #the decimated triangles for a cell size: (faces, parent) where faces are
+    #the kept triangles (indices into triangles) and parent the decimated face
+    #of every triangle (-1 if it collapsed to nothing near a face of its area)
+    def collapse(self, cluster):
+        merged = cluster[self.triangles]
+        alive = (merged[:, 0] != merged[:, 1]) & (merged[:, 1] != merged[:, 2]) & (merged[:, 0] != merged[:, 2])
+        ### triangles merged onto the same vertices and area are one face
+        ordered = np.sort(merged, axis=1)
+        rows = np.column_stack((ordered, self.region))
+        alive = np.flatnonzero(alive)
+        _, first, inverse = np.unique(rows[alive], axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.ravel()
+        ### the faces in the order of their first triangle
+        rank = np.argsort(np.argsort(first, kind='stable'), kind='stable')
+        faces = alive[np.sort(first)]
+        parent = np.full(len(self.triangles), -1, dtype=np.int64)
+        parent[alive] = rank[inverse]
+
+        ### a collapsed triangle goes to a face of its area on one of its vertices
+        dead = np.flatnonzero(parent < 0)
+        if len(dead) and len(faces):
+            faceKeys = (merged[faces] * self.regionCount + self.region[faces][:, None]).ravel()
+            keyFaces = np.repeat(np.arange(len(faces)), 3)
+            order = np.argsort(faceKeys, kind='stable')
+            faceKeys = faceKeys[order]
+            keyFaces = keyFaces[order]
+            for corner in range(3):
+                left = dead[parent[dead] < 0]
+                if len(left) == 0:
+                    break
+                keys = merged[left, corner] * self.regionCount + self.region[left]
+                found = np.minimum(np.searchsorted(faceKeys, keys), len(faceKeys) - 1)
+                hit = faceKeys[found] == keys
+                parent[left[hit]] = keyFaces[found[hit]]
+        return faces, parent
+
+    #(cluster, clusterCount, faces, parent) for a cell size
+    def decimate(self, cellSize):
+        cluster, clusterCount = self.clusters(cellSize)
+        return (cluster, clusterCount) + self.collapse(cluster)
+
+    #the decimated vertices: the mean of every cluster, the fixed vertices where they are
+    def positions(self, cluster, clusterCount):
+        used = cluster >= 0
+        counts = np.bincount(cluster[used], minlength=clusterCount).astype(np.float64)
+        co = np.stack([np.bincount(cluster[used], self.co[used, j], minlength=clusterCount)
+                       for j in range(3)], axis=1) / np.maximum(counts, 1)[:, None]
+        fixed = np.flatnonzero(self.fixed)
+        co[cluster[fixed]] = self.co[fixed]
+        return co
+
+#decimate mesh buffers to at most targetFaces triangles (as close to it as the
+#search gets), or with vertices moving at most maxError (both: the budget,
+#moving the vertices at most maxError, or 1/65536 of the size of the model if
+#that is more). The buffers are triangulated first. lockedFaces (a boolean array of the faces) are kept as
+#they are, by default the xz and yz faces of the scaffold.
+#Returns new buffers of triangles with 'parent', the decimated face of every
+#face of the original buffers (-1 for a face that collapsed away from its area),
+#and 'error', how far the vertices moved at most
+def decimateBuffers(buffers, targetFaces=None, maxError=None, lockedFaces=None):
+    if targetFaces is None and maxError is None:
+        raise ValueError("give a target face count or an error bound to decimate")
+    if lockedFaces is None:
+        lockedFaces = scaffoldFaces(buffers)
+    triangulated = triangulateBuffers(buffers)
+    polygon = triangulated.get('polygon', np.arange(len(triangulated['loop_total'])))
+    co = np.asarray(triangulated['co'], dtype=np.float64)
+    triangles = np.asarray(triangulated['vertices'], dtype=np.int64).reshape(-1, 3)
+    region = _faceRegions(triangulated)
+
+    locked = np.zeros(len(co), dtype=bool)
+    locked[triangles[np.asarray(lockedFaces, dtype=bool)[polygon]].ravel()] = True
+    clustering = _clustering(co, triangles, region, locked)
+
+    ### a vertex moves less than the diagonal of its cell
+    limit = maxError / np.sqrt(3.0) if maxError is not None else clustering.extent
+    smallest = clustering.extent / SMALLEST_CELL
+    if targetFaces is None:
+        result = clustering.decimate(limit)
+    else:
+        ### the smallest cell that leaves at most targetFaces faces, the faces
+        ### get fewer as the cells get larger
+        result = clustering.decimate(limit)
+        if len(result[2]) <= targetFaces:
+            low, high = np.log(smallest), np.log(limit)
+            for step in range(SEARCH_STEPS):
+                if len(result[2]) >= targetFaces * (1.0 - BUDGET_SLACK):
+                    break
+                middle = clustering.decimate(np.exp((low + high) / 2.0))
+                if len(middle[2]) <= targetFaces:
+                    result = middle
+                    high = (low + high) / 2.0
+                else:
+                    low = (low + high) / 2.0
+    cluster, clusterCount, faces, parent = result
+
+    positions = clustering.positions(cluster, clusterCount)
+    corners = cluster[triangles[faces]]
+    ### only the vertices of the kept faces
+    usedClusters, vertices = np.unique(corners.ravel(), return_inverse=True)
+    moved = positions[cluster[clustering.free]] - co[clustering.free]
+    error = float(np.sqrt((moved ** 2).sum(axis=1).max())) if len(moved) else 0.0
+
+    points = positions[usedClusters][vertices.reshape(-1, 3)]
+    normal = np.cross(points[:, 1] - points[:, 0], points[:, 2] - points[:, 0])
+    length = np.sqrt(np.einsum('kj,kj->k', normal, normal))
+    ### a face that became flat keeps the normal of its first triangle
+    normal = np.where((length > 0)[:, None], normal / np.where(length > 0, length, 1.0)[:, None],
+                      np.asarray(triangulated['normal'], dtype=np.float64)[faces])
+
+    decimated = dict(buffers)
+    decimated.pop('polygon', None)
+    decimated['co'] = positions[usedClusters].astype(np.asarray(buffers['co']).dtype)
+    decimated['vertices'] = vertices.ravel().astype(np.asarray(buffers['vertices']).dtype)
+    decimated['loop_start'] = np.arange(0, 3 * len(faces), 3, dtype=np.asarray(buffers['loop_start']).dtype)
+    decimated['loop_total'] = np.full(len(faces), 3, dtype=np.asarray(buffers['loop_total']).dtype)
+    decimated['normal'] = normal.astype(np.asarray(buffers['normal']).dtype)
+    for name in ('material_index', 'area_index'):
+        if name in triangulated:
+            decimated[name] = np.asarray(triangulated[name])[faces]
+    ### the parent of a polygon is the one of its first triangle that was kept
+    polygonParent = np.full(len(buffers['loop_total']), -1, dtype=np.int64)
+    alive = parent >= 0
+    polygonParent[polygon[alive][::-1]] = parent[alive][::-1]
+    decimated['parent'] = polygonParent
+    decimated['error'] = error
+    return decimated
+
+#the levels of detail of mesh buffers, one per face budget (from the finest to
+#the coarsest), each decimated from the previous one. Level k's 'parent' maps
+#the faces of level k - 1 (the buffers for the first one) to its faces
+def levelsOfDetail(buffers, targets, lockedFaces=None):
+    levels = []
+    for target in sorted(targets, reverse=True):
+        buffers = decimateBuffers(buffers, targetFaces=target, lockedFaces=lockedFaces)
+        lockedFaces = None
+        levels.append(buffers)
+    return levels
+
+#the face budgets of the levels of detail from a text like "20000, 5000".
+#Raises ValueError if one isn't a positive number
+def parseLevels(text):
+    levels = []
+    for part in text.replace(',', ' ').split():
+        if not part.isdigit() or int(part) <= 0:
+            raise ValueError("the levels of detail should be face counts, like 20000, 5000 (not %r)" % part)
+        levels.append(int(part))
+    return levels
+
+#the parent faces of a level as faces of the processed files: the face of the
+#processed file of coarser that every face of the processed file of finer went
+#into (-1 for a face that collapsed away from its area)
+def processedParents(finer, coarser):
+    finerOrder = faceOrder(finer['area_index'], finer['loop_total'])
+    coarserOrder = faceOrder(coarser['area_index'], coarser['loop_total'])
+    position = np.full(len(coarser['loop_total']) + 1, -1, dtype=np.int64)
+    position[coarserOrder] = np.arange(len(coarserOrder))
+    ### parent -1 reads the last entry, which stays -1
+    return position[coarser['parent'][finerOrder]]
@@ -0,0 +1,223 @@
+#Files written and read by the export and the import: the raw json,
+#the pickle and the binary model (.magicbin)
+
+import contextlib
+import json
+import mmap
+import pickle
+import struct
+from collections import OrderedDict
+import numpy as np
+
+from .calibration import calibrate
+
+def writeFile(fileName,data):
+    with open(fileName + ".json", 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+            
+def writeFilePickle(fileName,newdata):
+    pickle.dump(newdata, open(fileName, "wb"),
+            protocol=2)
+    
+
+###############################################################################################
+####    Binary model format (.magicbin)                               #########################
+####    8 bytes magic, uint32 version, uint32 header size, a json     #########################
+####    header (model info, areas, materials, xz/yz points and the    #########################
+####    array table) and then the raw arrays, each aligned to 64 bytes #######################
+###############################################################################################
+
+BINARY_MAGIC = b'MAGICBIN'
+BINARY_VERSION = 1
+BINARY_EXTENSION = ".magicbin"
+BINARY_ALIGNMENT = 64
+BINARY_ARRAYS = [('co', '<f4'), ('normal', '<f4'), ('loop_total', '<i4'),
+                 ('vertices', '<i4'), ('area_index', '<i4')]
+BINARY_PREAMBLE = struct.Struct('<8sII')
+
+def writeBinaryFile(fileName, buffers):
+    arrays = [np.ascontiguousarray(buffers[name], dtype=dtype) for name, dtype in BINARY_ARRAYS]
+
+    table = {}
+    offset = 0
+    for (name, dtype), array in zip(BINARY_ARRAYS, arrays):
+        table[name] = {'dtype': dtype, 'shape': list(array.shape), 'offset': offset}
+        offset += -(-array.nbytes // BINARY_ALIGNMENT) * BINARY_ALIGNMENT
+
+    header = {
+        'modelname': buffers['modelname'],
+        'modeldescription': buffers['modeldescription'],
+        'areas': buffers['areas'],
+        'materials': buffers['materials'],
+        'xz': buffers['xz'],
+        'yz': buffers['yz'],
+        'calibration': exportCalibration(buffers),
+        'arrays': table
+    }
+    headerBytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    ### the arrays start on an aligned offset after the header
+    dataStart = BINARY_PREAMBLE.size + len(headerBytes)
+    dataStart = -(-dataStart // BINARY_ALIGNMENT) * BINARY_ALIGNMENT
+    headerBytes += b' ' * (dataStart - BINARY_PREAMBLE.size - len(headerBytes))
+
+    with open(fileName + BINARY_EXTENSION, 'wb') as f:
+        f.write(BINARY_PREAMBLE.pack(BINARY_MAGIC, BINARY_VERSION, len(headerBytes)))
+        f.write(headerBytes)
+        for (name, dtype), array in zip(BINARY_ARRAYS, arrays):
+            f.seek(dataStart + table[name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(dataStart + offset)
+
+def _readBinaryHeader(f, fileAddress):
+    magic, version, headerSize = BINARY_PREAMBLE.unpack(f.read(BINARY_PREAMBLE.size))
+    if magic != BINARY_MAGIC:
+        raise ValueError(fileAddress + " is not a magic binary model")
+    if version > BINARY_VERSION:
+        raise ValueError(fileAddress + " uses binary format version " + str(version) +
+                         ", this add-on reads up to version " + str(BINARY_VERSION))
+    header = json.loads(f.read(headerSize).decode('utf-8'))
+    return header, BINARY_PREAMBLE.size + headerSize
+
+#the buffers of a .magicbin header, readArray(dtype, offset, shape) gives the
+#array stored at offset (from the start of the file)
+def _binaryBuffers(header, dataStart, readArray):
+    buffers = {}
+    for name, info in header['arrays'].items():
+        shape = tuple(info['shape'])
+        if 0 in shape:
+            buffers[name] = np.empty(shape, dtype=info['dtype'])
+        else:
+            buffers[name] = readArray(np.dtype(info['dtype']), dataStart + info['offset'], shape)
+
+    loopTotal = buffers['loop_total']
+    loopStart = np.zeros(len(loopTotal), dtype=np.int32)
+    np.cumsum(loopTotal[:-1], out=loopStart[1:])
+    buffers['loop_start'] = loopStart
+
+    for key in ['modelname', 'modeldescription', 'areas', 'materials', 'xz', 'yz']:
+        buffers[key] = header[key]
+    if header.get('calibration'):
+        buffers['calibration'] = header['calibration']
+    return buffers
+
+#read a .magicbin file. The arrays are read straight into memory, nothing is
+#parsed, and the file is closed when this returns (so the export can write it
+#again). Returns the same buffers as readRawData
+def readBinaryFile(fileAddress):
+    with open(fileAddress, 'rb') as f:
+        header, dataStart = _readBinaryHeader(f, fileAddress)
+        def readArray(dtype, offset, shape):
+            f.seek(offset)
+            count = int(np.prod(shape))
+            array = np.fromfile(f, dtype=dtype, count=count)
+            if len(array) != count:
+                raise ValueError(fileAddress + " is cut")
+            return array.reshape(shape)
+        return _binaryBuffers(header, dataStart, readArray)
+
+#memory map a .magicbin file, for readers that only look at part of a big
+#model. The arrays of the buffers it gives are views of the file, only valid
+#inside the with block (copy what is kept): the buffers are emptied and the
+#file is closed at its end:
+#
+#   with openBinaryFile("cell.magicbin") as buffers:
+#       areaIndex = buffers['area_index'].copy()
+@contextlib.contextmanager
+def openBinaryFile(fileAddress):
+    with open(fileAddress, 'rb') as f:
+        header, dataStart = _readBinaryHeader(f, fileAddress)
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    buffers = {}
+    try:
+        def readArray(dtype, offset, shape):
+            count = int(np.prod(shape))
+            if offset + count * dtype.itemsize > len(mapped):
+                raise ValueError(fileAddress + " is cut")
+            return np.frombuffer(mapped, dtype=dtype, count=count, offset=offset).reshape(shape)
+        buffers.update(_binaryBuffers(header, dataStart, readArray))
+        yield buffers
+    finally:
+        ### drop the views, so nothing looks at the file once it is closed
+        buffers.clear()
+        try:
+            mapped.close()
+        except BufferError:
+            ### an array still looks at the file, it is unmapped once that array is gone
+            pass
+
+#build the raw export data (the dict that writeFile saves and the import reads)
+#from the mesh buffers of readMeshBuffers (in the add-on)
+def buildRawData(buffers):
+    co = buffers['co'].astype(np.float64).tolist()
+    normal = buffers['normal'].astype(np.float64).tolist()
+    vertices = buffers['vertices'].tolist()
+    loopStart = buffers['loop_start'].tolist()
+    loopTotal = buffers['loop_total'].tolist()
+    areaIndex = buffers['area_index'].tolist()
+
+    Vertices = dict(enumerate(co))
+    Faces = {}
+    for j in range(len(loopStart)):
+        Faces[j] = {'vertices': vertices[loopStart[j]:loopStart[j] + loopTotal[j]],
+                    'normal': normal[j],
+                    'area_index': areaIndex[j]}
+
+    data = {}
+    data['vertices'] = Vertices
+    data['faces'] = Faces
+    data['materials'] = buffers['materials']
+    data['areas'] = buffers['areas']
+    data['xz'] = buffers['xz']
+    data['yz'] = buffers['yz']
+    data['modelname'] = buffers['modelname']
+    data['modeldescription'] = buffers['modeldescription']
+    data['calibration'] = exportCalibration(buffers)
+    return data
+
+#the calibration of the scaffold of the model saved in the raw json and the
+#binary model, None if it has no scaffold (yet)
+def exportCalibration(buffers):
+    try:
+        return calibrate(buffers['xz'], buffers['yz']).toDict()
+    except ValueError:
+        return None
+
+#read the raw export data (from writeFile or the online models) back into
+#the same buffers that readMeshBuffers produces, as flat NumPy arrays
+def readRawData(data):
+    vertices = data['vertices']
+    faces = data['faces']
+    faceList = [faces[str(i)] for i in range(len(faces))]
+
+    co = np.array([vertices[str(i)] for i in range(len(vertices))], dtype=np.float32)
+    loopTotal = np.array([len(face['vertices']) for face in faceList], dtype=np.int32)
+    loopStart = np.zeros(len(faceList), dtype=np.int32)
+    np.cumsum(loopTotal[:-1], out=loopStart[1:])
+
+    buffers = {
+        'co': co.reshape(len(vertices), 3),
+        'normal': np.array([face['normal'] for face in faceList], dtype=np.float32).reshape(len(faceList), 3),
+        'loop_start': loopStart,
+        'loop_total': loopTotal,
+        'vertices': np.array([v for face in faceList for v in face['vertices']], dtype=np.int32),
+        'area_index': np.array([face['area_index'] for face in faceList], dtype=np.int32),
+        'materials': data['materials'],
+        'areas': data['areas'],
+        'xz': data['xz'],
+        'yz': data['yz'],
+        'modelname': data.get('modelname', ''),
+        'modeldescription': data.get('modeldescription', '')
+    }
+    if data.get('calibration'):
+        buffers['calibration'] = data['calibration']
+    return buffers
+
+#read a model file, a .magicbin or a raw export json, into mesh buffers
+def readModelFile(fileAddress):
+    if fileAddress.endswith(BINARY_EXTENSION):
+        return readBinaryFile(fileAddress)
+    with open(fileAddress, encoding='utf8') as json_file:
+        data = json.load(json_file, object_pairs_hook=OrderedDict)
+    if not isinstance(data, dict) or 'vertices' not in data or 'faces' not in data:
+        raise ValueError(fileAddress + " is not a raw model export (no vertices or faces)")
+    return readRawData(data)
@@ -0,0 +1,259 @@
+#Incremental re-export. A full export leaves <name>cache.npz next to the
+#processed file, with a hash of the geometry and scaffold points, the face
+#adjacency, the labels of the faces, the measures of the faces the "areas"
+#section is computed from and where each face record is in the processed file. When the next export of the same name has the same geometry,
+#the transformation and the adjacency are skipped and the processed file is
+#rebuilt from the old one:
+#
+#  - if the same faces are labelled (only labels, contents or colors changed),
+#    the old file is copied and only the start of the records of the faces
+#    whose label changed is written again
+#  - otherwise the records are written again in the new order, with their
+#    verts and normal copied from the old file and nearFaces related again
+#    from the cached adjacency
+#
+#Anything else (new geometry, a missing or modified processed file, a face
+#that wasn't in the old file) makes runExport do a full export
+
+import hashlib
+import json
+import mmap
+import os
+
+import numpy as np
+
+from .processed import processedLabel, processedHeader, faceRecordStart, faceRecordEnd
+from .aggregates import areaSection, selectMeasures
+from .calibration import calibrate
+from .adjacency import relateFaces
+from .reader import faceOrder
+from .spatial import buildFaceGrid, gridLabels
+
+CACHE_SUFFIX = "cache.npz"
+CACHE_VERSION = 2
+#the face measures of aggregates.faceMeasures, kept as measure_<name>
+MEASURES = ('surface', 'centroid', 'lower', 'upper', 'normal')
+COPY_CHUNK = 1 << 22
+
+#hash of everything the verts, normals and nearFaces of the processed file depend on
+def geometryKey(buffers):
+    key = hashlib.sha1()
+    for name in ('co', 'normal', 'loop_start', 'loop_total', 'vertices'):
+        array = np.ascontiguousarray(buffers[name])
+        key.update((name + str(array.dtype) + str(array.shape)).encode())
+        key.update(memoryview(array).cast('B'))
+    key.update(json.dumps([buffers['xz'], buffers['yz']]).encode())
+    return key.hexdigest()
+
+#the original faces in the order of the processed file
+def processedOrder(buffers):
+    return faceOrder(buffers['area_index'], buffers['loop_total'])
+
+#what the records of the faces of each area show: {area_index: [label, content, r, g, b]}
+def areaRecords(buffers):
+    areas = {str(a): buffers['areas'][a] for a in buffers['areas']}
+    records = {}
+    for areaIndex in np.unique(buffers['area_index']).tolist():
+        if areaIndex == 0:
+            continue
+        area = areas[str(areaIndex - 1)]
+        label, content = processedLabel(area['area_label'], area['area_content'])
+        records[areaIndex] = [label, content] + [c * 255 for c in area['area_color'][:3]]
+    return records
+
+#the areaRecords of processed.processedAreaRecords, from the area records of buffers
+def sectionRecords(records):
+    sectionRecords = [None] * max(records, default=0)
+    for areaIndex, (label, content, r, g, b) in records.items():
+        sectionRecords[areaIndex - 1] = (str(areaIndex - 1), {"r": r, "g": g, "b": b}, label, content)
+    return sectionRecords
+
+#the start of a face record, up to its normal
+def recordStart(index, areaIndex, records):
+    if areaIndex == 0:
+        return faceRecordStart(index, None)
+    label, content, r, g, b = records[areaIndex]
+    return faceRecordStart(index, (str(areaIndex - 1), {"r": r, "g": g, "b": b}, label, content))
+
+_encode = json.JSONEncoder().encode
+
+def _fileStamp(fileAddress):
+    stat = os.stat(fileAddress)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+#save the cache of an export. order is the original face of every record,
+#offsets the (start, normal, nearFaces, end) of every record in the processed file
+#and measures the faceMeasures of the records
+def writeExportCache(fileName, key, buffers, order, offsets, faceAdjacency, measures):
+    processedAddress = fileName + "processed.json"
+    temporary = fileName + CACHE_SUFFIX + ".part.npz"
+    np.savez(temporary,
+             version=np.array(CACHE_VERSION),
+             key=np.array(key),
+             stamp=_fileStamp(processedAddress),
+             area_index=np.asarray(buffers['area_index'], dtype=np.int32),
+             records=np.array(json.dumps(areaRecords(buffers))),
+             order=np.asarray(order, dtype=np.int32),
+             offsets=np.asarray(offsets, dtype=np.int64).reshape(-1, 4),
+             face_offsets=np.asarray(faceAdjacency[0], dtype=np.int64),
+             face_faces=np.asarray(faceAdjacency[1], dtype=np.int32),
+             **{'measure_' + name: np.asarray(measures[name], dtype=np.float64) for name in MEASURES})
+    os.replace(temporary, fileName + CACHE_SUFFIX)
+
+#the cache of the last export of fileName if it can be used for this geometry, or None
+def readExportCache(fileName, key):
+    cacheAddress = fileName + CACHE_SUFFIX
+    processedAddress = fileName + "processed.json"
+    if not os.path.exists(cacheAddress) or not os.path.exists(processedAddress):
+        return None
+    try:
+        with np.load(cacheAddress) as data:
+            cache = {name: data[name] for name in data.files}
+    except (OSError, ValueError, KeyError):
+        return None
+    if (int(cache.get('version', -1)) != CACHE_VERSION or str(cache['key']) != key
+            or not np.array_equal(cache['stamp'], _fileStamp(processedAddress))):
+        return None
+    cache['records'] = {int(a): r for a, r in json.loads(str(cache['records'])).items()}
+    cache['measures'] = {name: cache.pop('measure_' + name) for name in MEASURES}
+    return cache
+
+#the record of every original face in the old processed file (-1 for a face it doesn't have)
+def _oldRecords(cache, faceCount):
+    oldRecord = np.full(faceCount, -1, dtype=np.int64)
+    oldRecord[cache['order']] = np.arange(len(cache['order']))
+    return oldRecord
+
+#the face measures of the records of the new processed file of buffers, from
+#the cache, or None if the old file misses one of its faces
+def cachedMeasures(buffers, cache):
+    faceCount = len(buffers['loop_total'])
+    if len(cache['area_index']) != faceCount:
+        return None
+    rows = _oldRecords(cache, faceCount)[processedOrder(buffers)]
+    if np.any(rows < 0):
+        return None
+    return selectMeasures(cache['measures'], rows)
+
+#write the processed file of buffers from the old one and the cache.
+#Returns the offsets of the records in the new file, or None if the cache
+#can't be used (nothing is written then). progress is called like in writeProcessedFile
+def rewriteProcessedFile(fileAddress, buffers, cache, progress=None):
+    measures = cachedMeasures(buffers, cache)
+    if measures is None:
+        return None
+    order = processedOrder(buffers)
+    oldOrder = cache['order']
+    oldRecord = _oldRecords(cache, len(buffers['loop_total']))
+
+    records = areaRecords(buffers)
+    areas = areaSection(measures, np.asarray(buffers['area_index'])[order] - 1, sectionRecords(records))
+    polygons = np.asarray(buffers['polygon'])[order].tolist() if 'polygon' in buffers else None
+    header = processedHeader(buffers['modelname'], buffers['modeldescription'],
+                             calibrate(buffers['xz'], buffers['yz']).toDict(), areas, polygons)
+    temporary = fileAddress + ".part"
+    try:
+        with open(fileAddress, 'rb') as oldFile, open(temporary, 'wb') as outfile:
+            old = mmap.mmap(oldFile.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                outfile.write(header.encode('ascii'))
+                if np.array_equal(order, oldOrder):
+                    offsets = _rewriteLabels(outfile, old, buffers, cache, records, len(header))
+                else:
+                    offsets = _rewriteRecords(outfile, old, buffers, cache, records, order,
+                                              oldRecord, len(header), progress)
+                outfile.write(b'}}')
+            finally:
+                old.close()
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    os.replace(temporary, fileAddress)
+    return offsets
+
+#same faces labelled: copy the old records, writing again only the start of the
+#records of the faces whose area or area record changed
+def _rewriteLabels(outfile, old, buffers, cache, records, headerLength):
+    oldOffsets = cache['offsets']
+    order = cache['order']
+    areaIndex = np.asarray(buffers['area_index'])[order]
+    oldAreaIndex = cache['area_index'][order]
+    changedAreas = [a for a in records if cache['records'].get(a) != records[a]]
+    changed = np.flatnonzero((areaIndex != oldAreaIndex) | np.isin(areaIndex, changedAreas))
+
+    if len(order) == 0:
+        return oldOffsets
+
+    ### the key of the first face is between the header and its record
+    firstKey = len(_encode('face0') + ': ')
+    _copy(outfile, old, int(oldOffsets[0, 0]) - firstKey, int(oldOffsets[0, 0]))
+    ### how much each rewritten start is longer than the old one
+    growth = np.zeros(len(order), dtype=np.int64)
+    position = int(oldOffsets[0, 0])
+    for i in changed.tolist():
+        start, normal = int(oldOffsets[i, 0]), int(oldOffsets[i, 1])
+        _copy(outfile, old, position, start)
+        prefix = recordStart(i, int(areaIndex[i]), records)
+        outfile.write(prefix.encode('ascii'))
+        growth[i] = len(prefix) - (normal - start)
+        position = normal
+    _copy(outfile, old, position, int(oldOffsets[-1, 3]))
+
+    after = np.cumsum(growth)
+    offsets = oldOffsets + (headerLength + firstKey - int(oldOffsets[0, 0]))
+    offsets[:, 0] += after - growth
+    offsets[:, 1:] += after[:, None]
+    return offsets
+
+#copy old[start:end] to outfile a few MB at a time
+def _copy(outfile, old, start, end):
+    for position in range(start, end, COPY_CHUNK):
+        outfile.write(old[position:min(position + COPY_CHUNK, end)])
+
+#new order: every record again, its verts and normal copied from the old file
+def _rewriteRecords(outfile, old, buffers, cache, records, order, oldRecord, headerLength, progress):
+    oldOffsets = cache['offsets']
+    areaIndex = np.asarray(buffers['area_index'])
+    nearOffsets, nearFaces = relateFaces(order, cache['face_offsets'], cache['face_faces'],
+                                         len(areaIndex))
+    nearOffsets = nearOffsets.tolist()
+    nearFaces = nearFaces.tolist()
+    oldOffsets = oldOffsets.tolist()
+    oldRecord = oldRecord.tolist()
+
+    offsets = []
+    position = headerLength
+    separator = ''
+    faceCount = max(len(order), 1)
+    for i, face in enumerate(order.tolist()):
+        start = separator + _encode('face' + str(i)) + ': '
+        prefix = recordStart(i, areaIndex[face], records)
+        _, normal, near, _ = oldOffsets[oldRecord[face]]
+        geometry = old[normal:near]
+        related = nearFaces[nearOffsets[i]:nearOffsets[i + 1]]
+        end = faceRecordEnd(related)
+        outfile.write((start + prefix).encode('ascii') + geometry + end.encode('ascii'))
+
+        position += len(start)
+        offsets.append((position, position + len(prefix), position + len(prefix) + len(geometry),
+                        position + len(prefix) + len(geometry) + len(end)))
+        position = offsets[-1][3]
+        separator = ', '
+        if progress is not None and (i + 1) % 1024 == 0:
+            progress((i + 1) / faceCount)
+    return offsets
+
+#the face grid (spatial.py) of the rewritten processed file, from the grid of the
+#old one: the same triangles in the new order, with the new labels. None if the
+#old grid misses a face
+def reorderFaceGrid(grid, buffers):
+    order = processedOrder(buffers)
+    row = np.full(len(buffers['loop_total']), -1, dtype=np.int64)
+    row[grid.faceIds] = np.arange(len(grid.faceIds))
+    rows = row[order]
+    if np.any(rows < 0):
+        return None
+    records = areaRecords(buffers)
+    labels = gridLabels(records[a][0] if a in records else None for a in range(1, max(records, default=0) + 1))
+    return buildFaceGrid(grid.triangles[rows], order, np.asarray(buffers['area_index'])[order], labels)
@@ -0,0 +1,185 @@
+#Timing and profiling of the export and import stages. A stageTimer times the
+#stages run inside `with timer.stage(name):` blocks (stages inside a stage are
+#named "outer/inner"), keeps counters (faces, vertices, areas, bytes written...)
+#and can write everything as a json report next to the exported model:
+#
+#   timer = stageTimer()
+#   with timer.stage("saving raw json"):
+#       writeFile(fileName, data)
+#   timer.countFile(fileName + ".json")
+#   timer.writeReport(fileName + REPORT_SUFFIX)
+#
+#The profile ("cprofile", "tracemalloc" or both, comma separated) comes from the
+#export options or the MAGIC_PROFILE environment variable. cProfile only sees the
+#thread that called start(), which is the export thread for MAGIC_export
+
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from collections import OrderedDict
+
+PROFILE_ENV = "MAGIC_PROFILE"
+PROFILE_MODES = ("cprofile", "tracemalloc")
+REPORT_SUFFIX = "timings.json"
+PROFILE_SUFFIX = "profile.prof"
+
+#the set of profile modes asked for, the option wins over the environment
+def profileModes(profile=None):
+    if not profile:
+        profile = os.environ.get(PROFILE_ENV, "")
+    modes = set(mode.strip().lower() for mode in profile.split(",") if mode.strip())
+    if "all" in modes:
+        modes = set(PROFILE_MODES)
+    unknown = modes - set(PROFILE_MODES)
+    if unknown:
+        raise ValueError("unknown profile mode " + ", ".join(sorted(unknown)) +
+                         ", use " + " or ".join(PROFILE_MODES))
+    return modes
+
+class stageTimer:
+    def __init__(self, profile=None):
+        self.stages = []
+        self.counters = OrderedDict()
+        self.modes = profileModes(profile)
+        self.profiler = None
+        self.started = None
+        self.finished = None
+        self._stack = []
+        self._peaks = []
+        self._startedTracing = False
+
+    #start the clock and the profilers
+    def start(self):
+        if self.started is not None:
+            return self
+        self.started = time.perf_counter()
+        if "tracemalloc" in self.modes and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._startedTracing = True
+        if "cprofile" in self.modes:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return self
+
+    #stop the clock and the profilers, the timer can't be restarted
+    def stop(self):
+        if self.started is None or self.finished is not None:
+            return self
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self._startedTracing:
+            tracemalloc.stop()
+            self._startedTracing = False
+        self.finished = time.perf_counter()
+        return self
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self.start()
+        self._stack.append(name)
+        record = OrderedDict([('name', "/".join(self._stack)), ('seconds', 0.0)])
+        self.stages.append(record)
+        tracing = tracemalloc.is_tracing() and "tracemalloc" in self.modes
+        if tracing:
+            memoryBefore = self._memoryPeak()
+            self._peaks.append(0)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            if tracing and tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, self._peaks.pop())
+                record['memory_delta'] = current - memoryBefore
+                record['memory_peak'] = peak
+                ### the outer stage peaked at least as high as this one
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+            self._stack.pop()
+
+    #current traced memory, with the peak of the stage we're in saved and reset
+    #so the new stage starts its own (the peak is for the whole run before python 3.9)
+    def _memoryPeak(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], peak)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        return current
+
+    #function decorator, the calls of the function are timed as a stage:
+    #   @timer.timed("related faces")
+    def timed(self, name):
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    #add the size of a written file to the bytes_written counter
+    def countFile(self, fileAddress):
+        if os.path.exists(fileAddress):
+            self.count('bytes_written', os.path.getsize(fileAddress))
+
+    #seconds spent in the stages with that name (0.0 if it didn't run)
+    def seconds(self, name):
+        return sum(record['seconds'] for record in self.stages if record['name'] == name)
+
+    def total(self):
+        if self.started is None:
+            return 0.0
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return end - self.started
+
+    #the outer stages on one line, for the console
+    def summary(self):
+        stages = ", ".join("%s %.3fs" % (record['name'], record['seconds'])
+                           for record in self.stages if "/" not in record['name'])
+        return "%.3fs (%s)" % (self.total(), stages)
+
+    def report(self):
+        result = OrderedDict()
+        result['total'] = self.total()
+        result['stages'] = [dict(record) for record in self.stages]
+        result['counters'] = dict(self.counters)
+        result['profile'] = sorted(self.modes)
+        if self.profiler is not None:
+            result['cprofile_top'] = profileTop(self.profiler)
+        return result
+
+    #write the report as json to fileAddress, and the cProfile stats (for
+    #snakeviz, pstats...) next to it if cProfile was on
+    def writeReport(self, fileAddress):
+        self.stop()
+        result = self.report()
+        if self.profiler is not None:
+            profileAddress = fileAddress[:-len(REPORT_SUFFIX)] if fileAddress.endswith(REPORT_SUFFIX) else fileAddress
+            profileAddress += PROFILE_SUFFIX
+            self.profiler.dump_stats(profileAddress)
+            result['cprofile_stats'] = os.path.basename(profileAddress)
+        with open(fileAddress, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=4)
+        return result
+
+#the functions with the most cumulative time
+def profileTop(profiler, limit=20):
+    stats = pstats.Stats(profiler).stats
+    rows = []
+    for (fileName, line, function), (calls, primitive, own, cumulative, callers) in stats.items():
+        rows.append(OrderedDict([('function', "%s:%d(%s)" % (os.path.basename(fileName), line, function)),
+                                 ('calls', calls),
+                                 ('own_seconds', own),
+                                 ('cumulative_seconds', cumulative)]))
+    rows.sort(key=lambda row: row['cumulative_seconds'], reverse=True)
+    return rows[:limit]
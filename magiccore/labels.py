@@ -0,0 +1,107 @@
+#Bookkeeping of the labelled areas of a model, shared by MAGIC_hotarea.
+#An object labelled with the add-on has a material slot per area: the entry of
+#the area in area_list names its slot with area_index, or has area_index 0 once
+#the area was deleted (slot 0 is the main body). The objects merged with the
+#scaffold (mergeObjects) also have its mainBody, xzFace and yzFace slots, and
+#"Scaffold" entries ahead of the areas of the user
+
+import numpy as np
+
+from .mesh import classifySlots
+
+#areas with the same label and color are the same area, the color is rounded
+#so a color picked again from the panel matches
+def labelKey(label, color):
+    return (label, tuple(round(c, 4) for c in color))
+
+#the position in area_list of the area of every label in use, from the
+#(area_index, labelKey) of the entries of area_list
+def labelRegistry(areaKeys):
+    registry = {}
+    for position in range(len(areaKeys)):
+        areaIndex, key = areaKeys[position]
+        if areaIndex > 0 and key not in registry:
+            registry[key] = position
+    return registry
+
+#the material of slot name (a blender name, "label" or "label.001") is named after label
+def _namedAfter(name, label):
+    if name is None or not name.startswith(label):
+        return False
+    suffix = name[len(label):]
+    return suffix == '' or (suffix[0] == '.' and suffix[1:].isdigit())
+
+#plan the merge of the areas that share a label and a color, and the removal of
+#the slots of deleted areas that no face uses. areaKeys are the (area_index,
+#labelKey) of area_list, slotNames the names of the materials of the slots
+#(None for an empty slot) and materialIndex the material index of every face.
+#The slot of an area is its area_index, a deleted area (area_index 0) had the
+#slot whose material is named after its label and that no other area uses. The
+#main body, the xz/yz scaffold slots and the areas whose slot can't be found
+#(like the "Scaffold" entries mergeObjects adds) are left as they are.
+#Returns (lookup, removedAreas, removedSlots): lookup[old slot] is the new slot
+#of every face and area, removedAreas the positions of the area_list entries to
+#delete and removedSlots the material slots to delete, both increasing.
+#Raises ValueError if an area or a face uses a slot the object doesn't have
+def planCompaction(areaKeys, slotNames, materialIndex):
+    slotCount = len(slotNames)
+    materialIndex = np.asarray(materialIndex, dtype=np.int64)
+    if len(materialIndex) and materialIndex.max() >= slotCount:
+        raise ValueError("a face uses material slot %d but the object has %d material slots" %
+                         (materialIndex.max(), slotCount))
+    used = np.bincount(materialIndex, minlength=slotCount)
+    mainBody, xzFace, yzFace = classifySlots([name or '' for name in slotNames], slotNames, slotCount)
+    protected = mainBody | xzFace | yzFace
+    protected[0] = True
+
+    ### the live areas of every slot
+    claims = {}
+    for position in range(len(areaKeys)):
+        areaIndex, key = areaKeys[position]
+        if areaIndex >= slotCount:
+            raise ValueError("area %d (%s) uses material slot %d but the object has %d material slots" %
+                             (position, key[0], areaIndex, slotCount))
+        if areaIndex > 0:
+            claims.setdefault(areaIndex, []).append(position)
+
+    target = np.arange(slotCount)
+    removedAreas = []
+    removedSlots = set()
+    kept = {}
+    for position in range(len(areaKeys)):
+        areaIndex, key = areaKeys[position]
+        if areaIndex == 0:
+            continue
+        if key not in kept:
+            kept[key] = areaIndex
+        elif kept[key] == areaIndex:
+            ### another entry of the same area
+            removedAreas.append(position)
+        elif not protected[areaIndex] and all(areaKeys[other][1] == key for other in claims[areaIndex]):
+            ### the same label in another slot, its faces go to the first slot
+            removedAreas.append(position)
+            removedSlots.add(areaIndex)
+            target[areaIndex] = kept[key]
+
+    ### deleted areas, their slot goes if nothing is painted with it
+    found = set()
+    for position in range(len(areaKeys)):
+        areaIndex, key = areaKeys[position]
+        if areaIndex != 0:
+            continue
+        slots = [slot for slot in range(1, slotCount)
+                 if not protected[slot] and slot not in claims and slot not in found
+                 and _namedAfter(slotNames[slot], key[0])]
+        if slots:
+            found.add(slots[0])
+            if used[slots[0]] == 0:
+                removedAreas.append(position)
+                removedSlots.add(slots[0])
+                target[slots[0]] = 0
+
+    ### the new index of every kept slot, removed slots take the one of their target
+    isRemoved = np.zeros(slotCount, dtype=bool)
+    isRemoved[sorted(removedSlots)] = True
+    newIndex = np.cumsum(~isRemoved) - 1
+    lookup = newIndex[target]
+    return lookup.astype(np.int32), sorted(removedAreas), sorted(removedSlots)
@@ -0,0 +1,104 @@
+#Mesh buffers, the NumPy arrays of a mesh that every stage of the export shares:
+#co (V,3), normal (F,3), loop_start (F,), loop_total (F,), vertices (the vertex
+#of every loop) and material_index / area_index (F,)
+
+import numpy as np
+
+from .adjacency import _rangeInGroups
+
+#what each material slot is for, resolved once from the slot and material names:
+#returns (mainBody, xzFace, yzFace), boolean arrays indexed by slot. They are
+#at least slotCount long, so a material index without a slot is none of them
+def classifySlots(slotNames, materialNames, slotCount=0):
+    size = max(len(slotNames), len(materialNames), slotCount)
+    mainBody = np.zeros(size, dtype=bool)
+    xzFace = np.zeros(size, dtype=bool)
+    yzFace = np.zeros(size, dtype=bool)
+    for slot in range(len(slotNames)):
+        mainBody[slot] = slotNames[slot].startswith('mainBody')
+    for slot in range(len(materialNames)):
+        mat = materialNames[slot]
+        if mat is not None:
+            xzFace[slot] = mat.startswith("xzFace")
+            yzFace[slot] = mat.startswith("yzFace")
+    return mainBody, xzFace, yzFace
+
+#the coordinates of the verts of the faces in faceMask, face after face
+def facePoints(buffers, faceMask):
+    faces = np.flatnonzero(faceMask)
+    loopStart = buffers['loop_start'][faces]
+    loopTotal = buffers['loop_total'][faces]
+    loops = np.repeat(loopStart - np.cumsum(loopTotal) + loopTotal, loopTotal) + np.arange(loopTotal.sum())
+    return buffers['co'][buffers['vertices'][loops]].astype(np.float64).tolist()
+
+#complete the mesh buffers read from blender with what the export needs:
+#area_index (faces painted with a mainBody material are not labelled), the
+#xz/yz scaffold points, areas, materials and the model info.
+#slotNames and materialNames are the names of the object's material slots and
+#of their materials (None for an empty slot)
+def buildExportBuffers(buffers, slotNames, materialNames, areas, materials, modelName, modelIntro):
+    materialIndex = np.asarray(buffers['material_index'], dtype=np.int64)
+    slotCount = int(materialIndex.max()) + 1 if len(materialIndex) else 0
+    mainBody, xzFace, yzFace = classifySlots(slotNames, materialNames, slotCount)
+
+    ## Faces painted with the mainBody material are not labelled
+    buffers['area_index'] = np.where(mainBody[materialIndex], 0, materialIndex).astype(np.int32)
+
+    ### Find the verts for xyz surfaces to store in the json file
+    xz = facePoints(buffers, xzFace[materialIndex])
+    yz = facePoints(buffers, yzFace[materialIndex])
+
+    ## Storing data
+    buffers['materials'] = materials
+    buffers['areas'] = areas
+    buffers['xz'] = xz
+    buffers['yz'] = yz
+    buffers['modelname'] = modelName
+    buffers['modeldescription'] = modelIntro
+    return buffers
+
+#the fan triangles of the polygons (loopStart, loopTotal): the loops
+#(first, k, k + 1) of every polygon, as a (T,3) array, and the polygon of every
+#triangle. Polygons with less than 3 loops have none
+def fanTriangles(loopStart, loopTotal):
+    loopStart = np.asarray(loopStart, dtype=np.int64)
+    counts = np.maximum(np.asarray(loopTotal, dtype=np.int64) - 2, 0)
+    polygon = np.repeat(np.arange(len(counts), dtype=np.int64), counts)
+    first = loopStart[polygon]
+    second = first + 1 + _rangeInGroups(counts)
+    return np.stack((first, second, second + 1), axis=1), polygon
+
+#split the quads and n-gons of the mesh buffers into triangles, so every face
+#makes it to the processed file with all its verts. The triangles keep the
+#normal, material and area of their polygon, and the new 'polygon' array (T,)
+#gives the polygon of the original mesh each one comes from. Buffers that are
+#only triangles are returned as they are (without 'polygon').
+#N-gons are fan triangulated, quads are split along the diagonal that keeps
+#both triangles facing the same way, so a concave quad stays inside its outline
+def triangulateBuffers(buffers):
+    loopStart = np.asarray(buffers['loop_start'])
+    loopTotal = np.asarray(buffers['loop_total'])
+    if np.all(loopTotal == 3):
+        return buffers
+    corners, polygon = fanTriangles(loopStart, loopTotal)
+    vertices = np.asarray(buffers['vertices'])
+
+    ### the two triangles of a quad are next to each other
+    quads = np.flatnonzero((loopTotal[polygon] == 4) & (corners[:, 1] == loopStart[polygon] + 1))
+    points = np.asarray(buffers['co'], dtype=np.float64)[vertices[corners[quads, 0][:, None] + np.arange(4)]]
+    firstNormal = np.cross(points[:, 1] - points[:, 0], points[:, 2] - points[:, 0])
+    secondNormal = np.cross(points[:, 2] - points[:, 0], points[:, 3] - points[:, 0])
+    flip = quads[np.einsum('kj,kj->k', firstNormal, secondNormal) < 0]
+    start = corners[flip, 0]
+    corners[flip] = np.stack((start, start + 1, start + 3), axis=1)
+    corners[flip + 1] = np.stack((start + 1, start + 2, start + 3), axis=1)
+
+    triangulated = dict(buffers)
+    triangulated['vertices'] = vertices[corners.ravel()]
+    triangulated['loop_start'] = np.arange(0, 3 * len(corners), 3, dtype=loopStart.dtype)
+    triangulated['loop_total'] = np.full(len(corners), 3, dtype=loopTotal.dtype)
+    for name in ('normal', 'material_index', 'area_index'):
+        if name in buffers:
+            triangulated[name] = np.asarray(buffers[name])[polygon]
+    triangulated['polygon'] = polygon
+    return triangulated
@@ -0,0 +1,401 @@
+#Models shared online on sensables.org, and downloads of model files.
+#
+#The models are fetched through one pooled session with timeouts and retries,
+#decompressed and parsed into mesh buffers as the response streams in, and kept
+#decompressed in an on-disk cache (a raw model json per model id, with the ETag
+#of the response next to it). A cached model is revalidated with
+#If-None-Match and used as is when the server says it didn't change, or when
+#the server can't be reached. onlineFetchJob runs the fetch in a worker thread
+#for MAGIC_onlineimport
+
+import codecs
+import hashlib
+import os
+import re
+import threading
+import traceback
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .stream import iterJsonString, rawModelParser, parseRawModel, iterFileText
+
+MODELS_URL = 'https://sensables.org/api/models/'
+CACHE_ENV = "MAGIC_CACHE_DIR"
+#(connect, read) seconds
+TIMEOUT = (5, 60)
+RETRIES = 3
+CHUNK_SIZE = 1 << 16
+#connections kept per host, also the most downloads running at once
+POOL_SIZE = 8
+
+_dataStart = re.compile(br'"data"\s*:\s*\[')
+
+_session = None
+_sessionLock = threading.Lock()
+
+#the session shared by every request, its connections are reused and the
+#requests that fail to connect or get a 5xx answer are retried with a backoff
+def getSession():
+    global _session
+    with _sessionLock:
+        if _session is None:
+            retry = Retry(total=RETRIES, backoff_factor=0.5,
+                          status_forcelist=(500, 502, 503, 504))
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=retry)
+            _session = requests.Session()
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+#the bytes of the model in a models api response sent in chunks: the body is
+#{"Body": {"type": "Buffer", "data": [120, 156, ...]}}, the model is the list of ints.
+#Raises ValueError for a list that isn't made of bytes (ints from 0 to 255)
+def iterBodyBytes(chunks):
+    head = b''
+    carry = None
+    for chunk in chunks:
+        if carry is None:
+            ### before the list, look for "data": [
+            head += chunk
+            match = _dataStart.search(head)
+            if match is None:
+                head = head[-64:]
+                continue
+            chunk = head[match.end():]
+            carry = b''
+            head = None
+        text = carry + chunk
+        end = text.find(b']')
+        if end >= 0:
+            text = text[:end]
+        else:
+            ### the last number may go on in the next chunk
+            cut = text.rfind(b',') + 1
+            text, carry = text[:cut], text[cut:]
+        numbers = text.decode('ascii').strip(' ,\r\n\t')
+        if numbers:
+            values = np.array(numbers.split(','), dtype=np.int64)
+            if values.min() < 0 or values.max() > 255:
+                raise ValueError("the model data of the response has a value out of the 0-255 byte range")
+            yield values.astype(np.uint8).tobytes()
+        if end >= 0:
+            return
+    raise ValueError("the model data of the response is cut")
+
+#the decompressed bytes of zlib or gzip compressed chunks
+def iterDecompressed(chunks):
+    decompressor = zlib.decompressobj(15+32)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
+    if not decompressor.eof:
+        raise ValueError("the compressed model is cut")
+
+#utf-8 text of byte chunks, a character cut between chunks waits for the next one
+def iterText(chunks):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    decoder.decode(b'', final=True)
+
+#the raw model json of a models api response sent in chunks. The model is a
+#zlib/gzip compressed json string of the raw model json, sent as a list of ints
+def iterOnlineModelText(chunks):
+    return iterJsonString(iterText(iterDecompressed(iterBodyBytes(chunks))))
+
+#decode a whole models api response into mesh buffers
+def decodeOnlineModel(content):
+    return parseRawModel(iterOnlineModelText([content]))
+
+###############################################################################################
+####    On-disk cache of the online models                            #########################
+###############################################################################################
+
+#the cache directory: cacheDir, the MAGIC_CACHE_DIR environment variable or
+#~/.cache/magicmaker/models
+def cacheDirectory(cacheDir=None):
+    if cacheDir is None:
+        cacheDir = os.environ.get(CACHE_ENV) or os.path.join(os.path.expanduser("~"), ".cache",
+                                                             "magicmaker", "models")
+    os.makedirs(cacheDir, exist_ok=True)
+    return cacheDir
+
+#the cache files of a model: the raw model json and its ETag
+def cachePaths(modelid, cacheDir=None):
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', str(modelid))
+    if name in ('', '.', '..'):
+        raise ValueError("invalid model id " + repr(modelid))
+    base = os.path.join(cacheDirectory(cacheDir), name)
+    return base + ".json", base + ".etag"
+
+#write through a temporary file, so a crash never leaves half a file behind
+def writeAtomic(fileAddress, text):
+    temporary = fileAddress + ".part"
+    with open(temporary, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temporary, fileAddress)
+
+#the cached (raw model json path, etag) of a model, or (None, None)
+def readCachedModel(modelid, cacheDir=None):
+    modelPath, etagPath = cachePaths(modelid, cacheDir)
+    if not os.path.exists(modelPath):
+        return None, None
+    etag = None
+    if os.path.exists(etagPath):
+        with open(etagPath, encoding='utf-8') as f:
+            etag = f.read().strip() or None
+    return modelPath, etag
+
+def removeCachedModel(modelid, cacheDir=None):
+    for path in cachePaths(modelid, cacheDir):
+        if os.path.exists(path):
+            os.remove(path)
+
+#decode a models api response streamed in chunks into mesh buffers, and write
+#its raw model json to the cache on the way. Nothing but the arrays of the
+#model and one chunk of each step is in memory at once
+def streamOnlineModel(modelid, chunks, etag, cacheDir=None):
+    modelPath, etagPath = cachePaths(modelid, cacheDir)
+    ### the old ETag mustn't validate the new model if we stop in between
+    if os.path.exists(etagPath):
+        os.remove(etagPath)
+    temporary = modelPath + ".part"
+    parser = rawModelParser()
+    try:
+        with open(temporary, 'w', encoding='utf-8') as f:
+            for text in iterOnlineModelText(chunks):
+                f.write(text)
+                parser.feed(text)
+        buffers = parser.close()
+    except Exception:
+        os.remove(temporary)
+        raise
+    os.replace(temporary, modelPath)
+    if etag:
+        writeAtomic(etagPath, etag)
+    return buffers
+
+#fetch the mesh buffers of a model id, from the cache when the server says it
+#didn't change (or can't be reached, an error status raises requests.HTTPError).
+#report(stage), if given, is told what happens
+def fetchOnlineModel(modelid, cacheDir=None, report=None):
+    if report is None:
+        report = lambda stage: None
+    cached, etag = readCachedModel(modelid, cacheDir)
+
+    headers = {}
+    if cached is not None and etag is not None:
+        headers['If-None-Match'] = etag
+    report("downloading")
+    try:
+        req = getSession().get(MODELS_URL + modelid, headers=headers, timeout=TIMEOUT, stream=True)
+        if req.status_code == 304 and cached is not None:
+            req.close()
+            report("cached")
+            return readCachedFile(modelid, cached, cacheDir, report)
+        req.raise_for_status()
+    except (requests.ConnectionError, requests.Timeout):
+        if cached is None:
+            raise
+        ### offline, the cached copy is better than nothing. An answer of the
+        ### server (404, 500...) isn't offline, it goes to the caller
+        report("offline, cached")
+        return parseRawModel(iterFileText(cached))
+
+    with req:
+        received = [0]
+        def chunks():
+            for chunk in req.iter_content(chunk_size=CHUNK_SIZE):
+                received[0] += len(chunk)
+                report("downloading %.1f MB" % (received[0] / 1048576.0))
+                yield chunk
+        buffers = streamOnlineModel(modelid, chunks(), req.headers.get('ETag'), cacheDir)
+    report("downloaded")
+    return buffers
+
+#the buffers of a cached model the server says is up to date, a broken cache
+#file is downloaded again
+def readCachedFile(modelid, cached, cacheDir, report):
+    try:
+        return parseRawModel(iterFileText(cached))
+    except ValueError:
+        removeCachedModel(modelid, cacheDir)
+        return fetchOnlineModel(modelid, cacheDir, report)
+
+###############################################################################################
+####    Downloads of model files into the cache                       #########################
+####    Interrupted downloads resume where they stopped (Range), and  #########################
+####    whole libraries download through a bounded pool of threads    #########################
+###############################################################################################
+
+#the hash of a "sha256:<hex>" (or "<algorithm>:<hex>", or a bare sha256 hex) checksum
+def _checksumHash(checksum):
+    if checksum is None:
+        return None, None
+    algorithm, _, digest = checksum.rpartition(':')
+    return hashlib.new(algorithm or 'sha256'), digest.lower()
+
+#chunks big enough for fast links and small enough to resume often on slow
+#ones: about 64 chunks per file, between 64 KB and 4 MB
+def _chunkSize(length):
+    if not length:
+        return CHUNK_SIZE
+    return int(min(max(length // 64, CHUNK_SIZE), 64 * CHUNK_SIZE))
+
+def _fileHash(fileAddress, checksum):
+    hasher, digest = _checksumHash(checksum)
+    with open(fileAddress, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(block)
+    return hasher, digest
+
+_downloadLocks = {}
+_downloadLocksLock = threading.Lock()
+
+def _downloadLock(fileAddress):
+    with _downloadLocksLock:
+        return _downloadLocks.setdefault(fileAddress, threading.Lock())
+
+#download url into the cache (cacheDir, see cacheDirectory) and return the path
+#of the file. A file already there (with the right checksum, if given) isn't
+#downloaded again, a partial download (.part) is resumed with a Range request,
+#and the file only appears under its name once it is complete and verified.
+#checksum is "sha256:<hex>" (or another hashlib algorithm), report(url, done, total)
+#is told the progress
+def download_file(url, cacheDir=None, checksum=None, report=None):
+    ### the file name, prefixed with a hash of the url so two files of the same name don't collide
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', url.split('?')[0].split('/')[-1]) or "download"
+    local_filename = os.path.join(cacheDirectory(cacheDir),
+                                  hashlib.sha1(url.encode('utf-8')).hexdigest()[:10] + "-" + name)
+    with _downloadLock(local_filename):
+        if os.path.exists(local_filename):
+            if checksum is None:
+                return local_filename
+            hasher, digest = _fileHash(local_filename, checksum)
+            if hasher.hexdigest() == digest:
+                return local_filename
+            os.remove(local_filename)
+
+        for attempt in range(RETRIES + 1):
+            try:
+                _downloadPart(url, local_filename + ".part", checksum, report)
+                break
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError):
+                ### the part file keeps what arrived, the next attempt resumes it
+                if attempt == RETRIES:
+                    raise
+
+        if checksum is not None:
+            hasher, digest = _fileHash(local_filename + ".part", checksum)
+            if hasher.hexdigest() != digest:
+                os.remove(local_filename + ".part")
+                raise ValueError("the checksum of " + url + " doesn't match, the download was removed")
+        os.replace(local_filename + ".part", local_filename)
+    return local_filename
+
+#download url into partName, after the bytes already in it
+def _downloadPart(url, partName, checksum, report):
+    offset = os.path.getsize(partName) if os.path.exists(partName) else 0
+    headers = {'Range': 'bytes=%d-' % offset} if offset > 0 else {}
+    with getSession().get(url, headers=headers, stream=True, timeout=TIMEOUT) as r:
+        if r.status_code == 416 and offset > 0:
+            if _remoteSize(r, url) == offset:
+                ### nothing after offset, the part is complete
+                return
+            ### a stale or oversized part, the file is downloaded again
+            r.close()
+            os.remove(partName)
+            return _downloadPart(url, partName, checksum, report)
+        r.raise_for_status()
+        if r.status_code != 206:
+            ### the server sent the whole file
+            offset = 0
+        length = r.headers.get('Content-Length')
+        total = offset + int(length) if length is not None else None
+        done = offset
+        with open(partName, 'ab' if offset > 0 else 'wb') as f:
+            for chunk in r.iter_content(chunk_size=_chunkSize(total)):
+                if chunk: # filter out keep-alive new chunks
+                    f.write(chunk)
+                    done += len(chunk)
+                    if report is not None:
+                        report(url, done, total)
+        if total is not None and done < total:
+            raise requests.exceptions.ChunkedEncodingError("the download of " + url + " stopped early")
+
+#the size of the file at url from the Content-Range (bytes */N) of a 416 reply r,
+#or from a HEAD request, None if the server doesn't say
+def _remoteSize(r, url):
+    match = re.match(r'bytes \*/(\d+)$', r.headers.get('Content-Range', '').strip())
+    if match:
+        return int(match.group(1))
+    head = getSession().head(url, allow_redirects=True, timeout=TIMEOUT)
+    length = head.headers.get('Content-Length') if head.ok else None
+    return int(length) if length is not None and length.isdigit() else None
+
+#run function(item) for every item through a pool of `workers` threads.
+#Returns ({item: result}, {item: error message}), in the order of items
+def _runPool(function, items, workers):
+    results = OrderedDict()
+    errors = OrderedDict()
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, POOL_SIZE))) as pool:
+        futures = OrderedDict((item, pool.submit(function, item)) for item in items)
+        for item, future in futures.items():
+            try:
+                results[item] = future.result()
+            except Exception as e:
+                errors[item] = str(e)
+    return results, errors
+
+#download many files into the cache at once, checksums maps urls to their checksum
+def download_files(urls, cacheDir=None, checksums=None, workers=4, report=None):
+    checksums = checksums or {}
+    return _runPool(lambda url: download_file(url, cacheDir, checksums.get(url), report),
+                    urls, workers)
+
+#fetch a whole library of online models into the cache at once, so they import
+#instantly (and offline) later
+def fetchOnlineModels(modelids, cacheDir=None, workers=4):
+    return _runPool(lambda modelid: fetchOnlineModel(modelid, cacheDir), modelids, workers)
+
+#an online fetch running fetchOnlineModel in a worker thread, so blender
+#doesn't freeze while the model downloads. The operator polls finished, then
+#reads buffers or error
+class onlineFetchJob:
+    def __init__(self, modelid, cacheDir=None):
+        self.modelid = modelid
+        self.cacheDir = cacheDir
+        self.stage = "starting"
+        self.buffers = None
+        self.error = None
+        self.finished = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def report(self, stage):
+        self.stage = stage
+
+    def _run(self):
+        try:
+            self.buffers = fetchOnlineModel(self.modelid, self.cacheDir, self.report)
+        except Exception as e:
+            traceback.print_exc()
+            self.error = str(e)
+        finally:
+            self.finished = True
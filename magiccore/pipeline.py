@@ -0,0 +1,241 @@
+#Export pipeline, everything after the mesh snapshot. It doesn't touch bpy, so
+#MAGIC_export runs it in a worker thread and the batch exporter in a process pool
+
+import os
+import threading
+import traceback
+
+import numpy as np
+
+from .formats import writeFile, writeFilePickle, writeBinaryFile, buildRawData, BINARY_EXTENSION
+from .instrument import stageTimer, REPORT_SUFFIX
+from .reader import blenderReader, buildBlenderData
+from .mesh import triangulateBuffers
+from .decimate import decimateBuffers, processedParents
+from .processed import writeProcessedFile
+from .aggregates import tableMeasures
+from .calibration import rememberCalibration
+from .spatial import tableFaceGrid, readFaceGrid, GRID_SUFFIX
+from .incremental import (geometryKey, readExportCache, writeExportCache, rewriteProcessedFile,
+                          processedOrder, reorderFaceGrid, cachedMeasures)
+
+class ExportCancelled(Exception):
+    pass
+
+#run the export of a mesh snapshot (the buffers of MAGIC_export) to fileName.
+#options says which side outputs to save ('raw_json', 'binary', 'pickle') and
+#the profile to capture ('profile', see instrument.profileModes), and
+#report(stage, progress) is called before each stage, it raises ExportCancelled
+#to stop the export. The stages are timed with timer (a new stageTimer if not
+#given), whose report is saved as fileName + "timings.json".
+#With 'incremental', the export keeps a cache next to the processed file and
+#only rewrites the faces whose labels changed while the geometry stays the same
+#(see incremental.py). With 'face_grid', the spatial index of the faces is saved
+#as fileName + "grid.npz" (see spatial.py).
+#Quads and n-gons are split into triangles before anything but the raw json and
+#the binary model (which keep the polygons), see mesh.triangulateBuffers.
+#'lods' is a list of face budgets, the model is decimated to each of them and
+#saved as fileName + "lod1processed.json", "lod2processed.json"... (see writeLevels)
+def runExport(fileName, buffers, options, report, timer=None):
+    if timer is None:
+        timer = stageTimer(options.get('profile'))
+    stages = []
+    if options.get('raw_json'):
+        stages.append("saving raw json")
+    if options.get('binary'):
+        stages.append("saving binary model")
+    if options.get('pickle'):
+        stages.append("saving pickle")
+    triangulate = not np.all(np.asarray(buffers['loop_total']) == 3)
+    if triangulate:
+        stages.insert(0, "triangulating polygons")
+    stages.append("transforming and relating faces")
+    stages.append("writing processed file")
+    if options.get('face_grid'):
+        stages.append("building face index")
+    levels = sorted(options.get('lods') or [], reverse=True)
+    for level in range(1, len(levels) + 1):
+        stages.append("saving level of detail %d" % level)
+    if options.get('incremental'):
+        stages.insert(1 if triangulate else 0, "checking export cache")
+    stageProgress = lambda stage, fraction=0.0: report(stage, (stages.index(stage) + fraction) / len(stages))
+
+    timer.start()
+    timer.count('vertices', len(buffers['co']))
+    timer.count('polygons', len(buffers['loop_total']))
+    timer.count('areas', len(buffers['areas']))
+
+    OUTPUTFILEADDRESS = fileName + "processed.json"
+    GRIDFILEADDRESS = fileName + GRID_SUFFIX
+    ### a model read back from an export brings its calibration along
+    if buffers.get('calibration'):
+        rememberCalibration(buffers['calibration'], buffers['xz'], buffers['yz'])
+    try:
+        ### the raw json and the binary model keep the polygons
+        source = buffers
+        if triangulate:
+            stageProgress("triangulating polygons")
+            with timer.stage("triangulating polygons"):
+                buffers = triangulateBuffers(buffers)
+            timer.count('triangles', len(buffers['loop_total']))
+        key = None
+        cache = None
+        grid = None
+        if options.get('incremental'):
+            stageProgress("checking export cache")
+            with timer.stage("checking export cache"):
+                key = geometryKey(buffers)
+                cache = readExportCache(fileName, key)
+                if cache is not None and options.get('face_grid'):
+                    ### the grid of the old export gives the triangles of the faces
+                    grid = readFaceGrid(GRIDFILEADDRESS)
+                    if grid is None or not np.array_equal(grid.faceIds, cache['order']):
+                        cache = None
+
+        if options.get('raw_json'):
+            stageProgress("saving raw json")
+            with timer.stage("saving raw json"):
+                writeFile(fileName, buildRawData(source))
+            timer.countFile(fileName + ".json")
+
+        if options.get('binary'):
+            stageProgress("saving binary model")
+            with timer.stage("saving binary model"):
+                writeBinaryFile(fileName, source)
+            timer.countFile(fileName + BINARY_EXTENSION)
+
+        if cache is not None and not options.get('pickle'):
+            stageProgress("writing processed file")
+            with timer.stage("rewriting processed file"):
+                offsets = rewriteProcessedFile(OUTPUTFILEADDRESS, buffers, cache,
+                                               lambda fraction: stageProgress("writing processed file", fraction))
+            if offsets is not None:
+                timer.count('cached_export')
+                timer.countFile(OUTPUTFILEADDRESS)
+                with timer.stage("saving export cache"):
+                    writeExportCache(fileName, key, buffers, processedOrder(buffers), offsets,
+                                     (cache['face_offsets'], cache['face_faces']),
+                                     cachedMeasures(buffers, cache))
+                if grid is not None:
+                    stageProgress("building face index")
+                    with timer.stage("building face index"):
+                        reorderFaceGrid(grid, buffers).save(GRIDFILEADDRESS)
+                    timer.countFile(GRIDFILEADDRESS)
+                writeLevels(fileName, buffers, levels, stageProgress, timer)
+                return _finishExport(fileName, report, timer)
+
+        if options.get('pickle'):
+            ### the pickle keeps the face lists of the first exporter
+            stageProgress("saving pickle")
+            with timer.stage("saving pickle"):
+                writeFilePickle(fileName, buildBlenderData(buffers))
+            timer.countFile(fileName)
+
+        stageProgress("transforming and relating faces")
+        with timer.stage("transforming and relating faces"):
+            modelData = blenderReader(buffers, timer)
+            with timer.stage("area aggregates"):
+                measures = tableMeasures(modelData.faces)
+
+        stageProgress("writing processed file")
+        offsets = [] if key is not None else None
+        try:
+            with timer.stage("writing processed file"):
+                writeProcessedFile(OUTPUTFILEADDRESS, modelData,
+                                   lambda fraction: stageProgress("writing processed file", fraction),
+                                   offsets, measures)
+        except ExportCancelled:
+            ### don't leave half a processed file behind
+            os.remove(OUTPUTFILEADDRESS)
+            raise
+        timer.countFile(OUTPUTFILEADDRESS)
+
+        if options.get('face_grid'):
+            stageProgress("building face index")
+            with timer.stage("building face index"):
+                tableFaceGrid(modelData.faces).save(GRIDFILEADDRESS)
+            timer.countFile(GRIDFILEADDRESS)
+
+        if key is not None:
+            with timer.stage("saving export cache"):
+                writeExportCache(fileName, key, buffers, modelData.faces.blender_index, offsets,
+                                 modelData.faceAdjacency, measures)
+        ### the levels only need the buffers
+        modelData = None
+        writeLevels(fileName, buffers, levels, stageProgress, timer)
+    finally:
+        timer.stop()
+
+    return _finishExport(fileName, report, timer)
+
+#save the levels of detail of the (triangulated) buffers, one per face budget
+#of levels from the finest to the coarsest, each decimated from the one before
+#(see decimate.py). Level k is saved as fileName + "lod<k>processed.json", a
+#processed file with a "lod" section: its level, how far its vertices moved from
+#the level before at most, and finer_faces, the face of this file every face
+#of the file of the level before went into (-1 for one that collapsed)
+def writeLevels(fileName, buffers, levels, stageProgress, timer):
+    finer = buffers
+    for level, target in enumerate(levels, 1):
+        stage = "saving level of detail %d" % level
+        stageProgress(stage)
+        with timer.stage(stage):
+            coarser = decimateBuffers(finer, targetFaces=target)
+            coarser['lod'] = {'level': level,
+                              'error': coarser['error'],
+                              'finer_faces': processedParents(finer, coarser).tolist()}
+            levelName = fileName + "lod" + str(level)
+            writeProcessedFile(levelName + "processed.json", blenderReader(coarser))
+        timer.count('lod%d_faces' % level, len(coarser['loop_total']))
+        timer.countFile(levelName + "processed.json")
+        finer = coarser
+
+def _finishExport(fileName, report, timer):
+    timer.stop()
+    timer.writeReport(fileName + REPORT_SUFFIX)
+    report("done", 1.0)
+    return timer
+
+#an export running runExport in a worker thread. The operator polls stage,
+#progress and finished from the main thread, and cancel() stops the worker
+#before its next stage (or its next 1024 processed faces)
+class exportJob:
+    def __init__(self, fileName, buffers, options):
+        self.fileName = fileName
+        self.buffers = buffers
+        self.options = options
+        self.stage = "starting"
+        self.progress = 0.0
+        self.error = None
+        self.timer = None
+        self.cancelled = False
+        self.finished = False
+        self._cancelEvent = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelEvent.set()
+
+    def report(self, stage, progress):
+        if self._cancelEvent.is_set():
+            raise ExportCancelled()
+        self.stage = stage
+        self.progress = progress
+
+    def _run(self):
+        try:
+            self.timer = stageTimer(self.options.get('profile'))
+            runExport(self.fileName, self.buffers, self.options, self.report, self.timer)
+        except ExportCancelled:
+            self.cancelled = True
+        except Exception as e:
+            traceback.print_exc()
+            self.error = str(e)
+        finally:
+            ### the snapshot isn't needed anymore
+            self.buffers = None
+            self.finished = True
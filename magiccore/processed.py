@@ -0,0 +1,230 @@
+#The processed Talkit++ file
+
+import json
+
+import numpy as np
+
+from .aggregates import tableMeasures, areaSection
+
+_encode = json.JSONEncoder().encode
+
+#the label and content a face has in the processed file, Talkit++ knows some
+#labels under another name
+def processedLabel(label, content):
+    if label == "Body":
+        label = "m_body"
+
+    if label == "Jet engine":
+        label = "m_jet"
+
+    if label == "Cockpit":
+        label = "m_cockpit"
+
+    if label == "unmarked":
+        label = "nolabel"
+        content = "please activate an element with label"
+    return label, content
+
+#the (area_id, color, label, content) the face records of each area of a
+#faceTable show (None for an area no face uses)
+def processedAreaRecords(areas):
+    areaRecords = []
+    for area in areas:
+        if area is None:
+            areaRecords.append(None)
+            continue
+        label, content = processedLabel(area['label'], area['content'])
+        color = [x * 255 for x in area['color']]
+        areaRecords.append((area['area_id'], {"r": color[0], "g": color[1], "b": color[2]}, label, content))
+    return areaRecords
+
+#faces turned into python values at a time by iterProcessedFaces
+CHUNK_FACES = 4096
+
+#the python values of the faces of a blenderReader, one face at a time: yields
+#(index, area, normal, verts, nearFaces), area being the position of its area
+#in processedAreaRecords (-1 for an unmarked face) and verts its first three verts.
+#The arrays of the face table are turned into python values a chunk of faces at a time
+def _iterFaceValues(modelData):
+    faces = modelData.faces
+    for chunkStart in range(0, len(faces), CHUNK_FACES):
+        chunkEnd = min(chunkStart + CHUNK_FACES, len(faces))
+        areaIds = faces.area_id[chunkStart:chunkEnd].tolist()
+        normals = faces.normal_converted[chunkStart:chunkEnd].tolist()
+        ### the first three verts of every face
+        firstPoints = faces.point_offsets[chunkStart:chunkEnd]
+        verts = faces.verts_converted[(firstPoints[:, None] + np.arange(3)).ravel()].reshape(-1, 3, 3).tolist()
+        relatedOffsets = faces.related_offsets[chunkStart:chunkEnd + 1] - faces.related_offsets[chunkStart]
+        related = faces.related[faces.related_offsets[chunkStart]:faces.related_offsets[chunkEnd]].tolist()
+        relatedOffsets = relatedOffsets.tolist()
+
+        for i in range(chunkEnd - chunkStart):
+            yield (chunkStart + i, areaIds[i], normals[i], verts[i],
+                   related[relatedOffsets[i]:relatedOffsets[i + 1]])
+
+#build the processed Talkit++ face records of a blenderReader one at a time,
+#yields ('faceN', record) in the order they appear in the processed file.
+#The records of an area share its label, content and color
+def iterProcessedFaces(modelData):
+    areaRecords = processedAreaRecords(modelData.faces.areas)
+    unmarkedLabel, unmarkedContent = processedLabel("unmarked", "null")
+
+    for eachFaceIndex, area, normal, verts, nearFaces in _iterFaceValues(modelData):
+        templist = {}
+        if area >= 0:
+            areaId, color, label, content = areaRecords[area]
+            templist['marked'] = True
+            templist['area_id'] = areaId
+            templist['index'] = eachFaceIndex
+            templist['color'] = dict(color)
+        else:
+            label, content = unmarkedLabel, unmarkedContent
+            templist['marked'] = False
+            templist['index'] = eachFaceIndex
+            templist['color'] = "null"
+
+        templist['label'] = label
+        templist['content'] = content
+        templist['normal'] = {"x": normal[0], "y": normal[1], "z": normal[2]}
+        vert1, vert2, vert3 = verts
+        templist['verts'] = dict(vert1={'x': vert1[0], 'y': vert1[1], 'z': vert1[2]},
+                                 vert2={'x': vert2[0], 'y': vert2[1], 'z': vert2[2]},
+                                 vert3={'x': vert3[0], 'y': vert3[1], 'z': vert3[2]})
+        templist['nearFaces'] = {str(count): nearFaces[count] for count in range(len(nearFaces))}
+        yield 'face' + str(eachFaceIndex), templist
+
+#The json of a face record is written from three pieces with the keys in a fixed
+#order, not by encoding the dict of the record: python only keeps the order of
+#dicts from 3.7 (Blender 2.79 has 3.5), and the incremental export has to know
+#where each piece is. The pieces are the start (the label fields, up to the
+#normal), the geometry (normal and verts) and the end (nearFaces)
+
+#the start of the face records of an area record of processedAreaRecords (None
+#for an unmarked face), before and after the index of the face
+def faceStartPieces(areaRecord):
+    if areaRecord is None:
+        label, content = processedLabel("unmarked", "null")
+        return ('{"marked": false, "index": ',
+                ', "color": "null", "label": ' + _encode(label) + ', "content": ' + _encode(content) + ', ')
+    areaId, color, label, content = areaRecord
+    return ('{"marked": true, "area_id": ' + _encode(areaId) + ', "index": ',
+            ', "color": {"r": ' + _encode(color['r']) + ', "g": ' + _encode(color['g']) +
+            ', "b": ' + _encode(color['b']) + '}, "label": ' + _encode(label) +
+            ', "content": ' + _encode(content) + ', ')
+
+#the start of the record of face index, up to its normal
+def faceRecordStart(index, areaRecord):
+    before, after = faceStartPieces(areaRecord)
+    return before + str(index) + after
+
+_GEOMETRY = ('"normal": {"x": %r, "y": %r, "z": %r}, "verts": {' +
+             ', '.join('"vert%d": {"x": %%r, "y": %%r, "z": %%r}' % k for k in (1, 2, 3)) + '}')
+
+#the normal and verts of a face record
+def faceGeometry(normal, verts):
+    values = tuple(normal) + tuple(verts[0]) + tuple(verts[1]) + tuple(verts[2])
+    geometry = _GEOMETRY % values
+    if 'nan' in geometry or 'inf' in geometry:
+        ### json writes NaN and Infinity
+        geometry = _GEOMETRY.replace('%r', '%s') % tuple(_encode(values)[1:-1].split(', '))
+    return geometry
+
+#the '"k": ' keys of nearFaces, as many as the records needed so far
+_NEAR_KEYS = []
+
+#the nearFaces of a face record and the end of the record
+def faceRecordEnd(nearFaces):
+    while len(_NEAR_KEYS) < len(nearFaces):
+        _NEAR_KEYS.append('"%d": ' % len(_NEAR_KEYS))
+    return ', "nearFaces": {' + ', '.join([key + str(face) for key, face in zip(_NEAR_KEYS, nearFaces)]) + '}}'
+
+#the "areas" section of the processed file of a blenderReader (see aggregates.py),
+#measures are the tableMeasures of its faces if they were already computed
+def processedAreas(modelData, measures=None):
+    faces = modelData.faces
+    if measures is None:
+        measures = tableMeasures(faces)
+    return areaSection(measures, faces.area_id, processedAreaRecords(faces.areas))
+
+#the "polygons" section of the processed file of a blenderReader, the polygon of
+#the original mesh of every face, or None if the mesh had only triangles
+def processedPolygons(modelData):
+    polygon = modelData.faces.polygon
+    return polygon.tolist() if polygon is not None else None
+
+#build the whole processed Talkit++ data of a blenderReader in memory
+def buildProcessedData(modelData):
+    ExportData = {
+        'modelName': modelData.generalInfo[0],
+        'modelIntro' : modelData.generalInfo[1],
+        'calibration': modelData.calibration.toDict(),
+        'areas': processedAreas(modelData)
+    }
+    polygons = processedPolygons(modelData)
+    if polygons is not None:
+        ExportData['polygons'] = polygons
+    if modelData.lod is not None:
+        ExportData['lod'] = modelData.lod
+    ExportData['faces'] = dict(iterProcessedFaces(modelData))
+    return ExportData
+
+#the start of the processed file, up to the first face record. calibration is
+#the scaffoldCalibration.toDict() of the model, so the tools reading the file
+#have the transformation to the Tracker coordinates, and areas the aggregates of
+#every area (processedAreas), so they don't have to regroup the faces. polygons
+#(processedPolygons) is only written for a triangulated mesh, and lod for a
+#level of detail (see pipeline.writeLevels). The README lists the sections and
+#how they differ from the files of the first exporter
+def processedHeader(modelName, modelIntro, calibration, areas, polygons=None, lod=None):
+    encode = json.JSONEncoder().encode
+    header = ('{"modelName": ' + encode(modelName) +
+              ', "modelIntro": ' + encode(modelIntro) +
+              ', "calibration": ' + encode(calibration) +
+              ', "areas": ' + encode(areas))
+    if polygons is not None:
+        header += ', "polygons": ' + encode(polygons)
+    if lod is not None:
+        header += ', "lod": ' + encode(lod)
+    return header + ', "faces": {'
+
+#write the processed Talkit++ file face by face, so only one face record is in
+#memory at a time. The bytes are the same json.dump(buildProcessedData(modelData))
+#would write (default separators, same key order) on python 3.7 and later
+#progress, if given, is called with the fraction of faces written every 1024 faces.
+#offsets, if given, is a list that gets the (start, normal, nearFaces, end) offsets
+#of every face record in the file, for the incremental export, and measures the
+#tableMeasures of the faces if they were already computed
+def writeProcessedFile(fileAddress, modelData, progress=None, offsets=None, measures=None):
+    faceCount = max(len(modelData.faces), 1)
+    with open(fileAddress, 'w') as outfile:
+        header = processedHeader(modelData.generalInfo[0], modelData.generalInfo[1],
+                                 modelData.calibration.toDict(), processedAreas(modelData, measures),
+                                 processedPolygons(modelData), modelData.lod)
+        outfile.write(header)
+        position = len(header)
+        separator = ''
+        written = 0
+        areaRecords = processedAreaRecords(modelData.faces.areas) + [None]
+        ### the start of the records of each area, area -1 is the unmarked faces
+        starts = {}
+        for index, area, normal, verts, nearFaces in _iterFaceValues(modelData):
+            if area not in starts:
+                starts[area] = faceStartPieces(areaRecords[area])
+            before, after = starts[area]
+            start = separator + '"face' + str(index) + '": '
+            recordStart = before + str(index) + after
+            geometry = faceGeometry(normal, verts)
+            end = faceRecordEnd(nearFaces)
+            outfile.write(start + recordStart + geometry + end)
+            if offsets is not None:
+                ### the output is ascii, so characters are bytes
+                position += len(start)
+                offsets.append((position, position + len(recordStart),
+                                position + len(recordStart) + len(geometry),
+                                position + len(recordStart) + len(geometry) + len(end)))
+                position = offsets[-1][3]
+            separator = ', '
+            written += 1
+            if progress is not None and written % 1024 == 0:
+                progress(written / faceCount)
+        outfile.write('}}')
@@ -0,0 +1,329 @@
+#blenderReader, turns the exported faces into Tracker coordinates and relates them
+
+import pickle
+import numpy as np
+
+from .adjacency import buildFaceAdjacency, faceMapToLoops, relateFaces
+from .instrument import stageTimer
+from .scaffold import TRACKER_UNIT_SIZE
+from .transform import solve_point, solve_points, solve_normals
+from .calibration import calibrate
+from .mesh import triangulateBuffers
+
+#faceTable object
+#store the faces of a blenderReader as NumPy arrays, face i of the processed
+#file is row i: the marked faces first, then the unmarked triangles.
+#The verts of face i are verts[point_offsets[i]:point_offsets[i+1]] and its
+#related faces related[related_offsets[i]:related_offsets[i+1]]. area_id points
+#into the shared areas table (-1 for an unmarked face), whose records hold the
+#area_id, label, content, gesture and color of the area. polygon is the polygon
+#of the original mesh of every face when the mesh was triangulated
+#(mesh.triangulateBuffers), None otherwise
+class faceTable:
+    def __init__(self, blenderIndex, areaId, pointCount, verts, normal, areas, polygon=None):
+        self.blender_index = np.asarray(blenderIndex, dtype=np.int64)
+        self.polygon = np.asarray(polygon, dtype=np.int64) if polygon is not None else None
+        self.area_id = np.asarray(areaId, dtype=np.int32)
+        self.point_offsets = np.zeros(len(self.blender_index) + 1, dtype=np.int64)
+        np.cumsum(pointCount, out=self.point_offsets[1:])
+        self.verts = np.asarray(verts, dtype=np.float64).reshape(-1, 3)
+        self.normal = np.asarray(normal, dtype=np.float64).reshape(-1, 3)
+        self.areas = areas
+        self.markedCount = int(np.count_nonzero(self.area_id >= 0))
+        self.verts_converted = np.zeros_like(self.verts)
+        self.normal_converted = np.zeros_like(self.normal)
+        self.related_offsets = np.zeros(len(self.blender_index) + 1, dtype=np.int64)
+        self.related = np.zeros(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.blender_index)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("face index out of range")
+        return blenderFace(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield blenderFace(self, index)
+
+    #transform the verts and normals of the faces start..end all at once
+    def convert(self, mtx, start, end):
+        first, last = self.point_offsets[start], self.point_offsets[end]
+        self.verts_converted[first:last] = solve_points(self.verts[first:last], mtx)
+        self.normal_converted[start:end] = solve_normals(self.normal[start:end], mtx)
+
+    #relate the faces from the adjacency of the whole mesh (faceCount faces)
+    def relate(self, faceOffsets, faceFaces, faceCount):
+        self.related_offsets, related = relateFaces(self.blender_index, faceOffsets, faceFaces, faceCount)
+        self.related = related.astype(np.int32)
+
+#blenderFace object
+#a view of one face of a faceTable, with the attributes the face objects of the
+#first exporter had. vertsConverted and normalConverted are views into the
+#arrays that blenderReader transformed in bulk
+class blenderFace:
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @property
+    def area(self):
+        areaId = self.table.area_id[self.index]
+        return self.table.areas[areaId] if areaId >= 0 else None
+
+    @property
+    def marked(self):
+        return bool(self.table.area_id[self.index] >= 0)
+
+    @property
+    def blender_index(self):
+        return str(self.table.blender_index[self.index])
+
+    @property
+    def polygon(self):
+        polygon = self.table.polygon
+        return int(polygon[self.index]) if polygon is not None else int(self.table.blender_index[self.index])
+
+    @property
+    def area_id(self):
+        return self.area['area_id'] if self.marked else None
+
+    @property
+    def label(self):
+        return self.area['label'] if self.marked else "unmarked"
+
+    @property
+    def content(self):
+        return self.area['content'] if self.marked else "null"
+
+    @property
+    def gesture(self):
+        return self.area['gesture'] if self.marked else "null"
+
+    @property
+    def blender_color(self):
+        return [x * 255 for x in self.area['color']] if self.marked else None
+
+    @property
+    def verts(self):
+        offsets = self.table.point_offsets
+        return self.table.verts[offsets[self.index]:offsets[self.index + 1]].tolist()
+
+    @property
+    def normal(self):
+        return self.table.normal[self.index].tolist()
+
+    @property
+    def vertsConverted(self):
+        offsets = self.table.point_offsets
+        return self.table.verts_converted[offsets[self.index]:offsets[self.index + 1]]
+
+    @property
+    def normalConverted(self):
+        return self.table.normal_converted[self.index]
+
+    @property
+    def relatedFaces(self):
+        offsets = self.table.related_offsets
+        return self.table.related[offsets[self.index]:offsets[self.index + 1]].tolist()
+
+#blenderPoint object
+#store information for a point
+class blenderPoint:
+    def __init__(self, coordinates, faceIndex, mtx):
+        self.vert = coordinates[:]
+        self.faceIndex = [faceIndex]
+        self.vertsConverted = solve_point(self.vert, mtx)
+
+    def addFace(self, faceIndex):
+        self.faceIndex.append(faceIndex)
+
+#the faces of the mesh in the order of the processed file: the marked faces,
+#then the unmarked triangles (unmarked faces with more sides, only left in the
+#lists of an old pickle, are left out; mesh buffers are triangulated first)
+def faceOrder(areaIndex, loopTotal):
+    areaIndex = np.asarray(areaIndex)
+    marked = np.flatnonzero(areaIndex != 0)
+    unmarked = np.flatnonzero((areaIndex == 0) & (np.asarray(loopTotal) == 3))
+    return np.concatenate([marked, unmarked])
+
+#build the faceTable of mesh buffers
+def tableFromBuffers(buffers):
+    areaIndex = np.asarray(buffers['area_index'], dtype=np.int64)
+    loopStart = np.asarray(buffers['loop_start'], dtype=np.int64)
+    loopTotal = np.asarray(buffers['loop_total'], dtype=np.int64)
+    order = faceOrder(areaIndex, loopTotal)
+
+    ### one area record per area in use, at the position of the area
+    areas = {str(a): buffers['areas'][a] for a in buffers['areas']}
+    used = np.unique(areaIndex[areaIndex != 0]).tolist()
+    areaTable = [None] * (used[-1] if used else 0)
+    for a in used:
+        area = areas[str(a - 1)]
+        areaTable[a - 1] = {'area_id': str(a - 1),
+                            'label': area['area_label'],
+                            'content': area['area_content'],
+                            'gesture': area['area_gesture'],
+                            'color': area['area_color']}
+
+    counts = loopTotal[order]
+    loops = np.repeat(loopStart[order] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    verts = np.asarray(buffers['co'])[np.asarray(buffers['vertices'])[loops]]
+    normal = np.asarray(buffers['normal'])[order]
+    polygon = np.asarray(buffers['polygon'])[order] if 'polygon' in buffers else None
+    return faceTable(order, areaIndex[order] - 1, counts, verts, normal, areaTable, polygon)
+
+#build the faceTable of the lists of buildBlenderData (or of an old pickle).
+#Marked faces are encoded as [[(blender_index, label, content, gesture, area_id), blender_color, verts, normal]...]
+#and unmarked ones as [[faceVerts, faceNormal, blender_index]...]
+def tableFromBlenderData(blenderData):
+    marked = blenderData[1]
+    unmarked = [face for face in blenderData[2] if len(face[0]) == 3]
+
+    areaTable = []
+    areaIds = {}
+    areaId = []
+    for face in marked:
+        info = face[0]
+        key = (info[4], info[1], info[2], info[3], tuple(face[1]))
+        if key not in areaIds:
+            areaIds[key] = len(areaTable)
+            areaTable.append({'area_id': info[4], 'label': info[1], 'content': info[2],
+                              'gesture': info[3], 'color': list(face[1])})
+        areaId.append(areaIds[key])
+    areaId += [-1] * len(unmarked)
+
+    blenderIndex = [int(face[0][0]) for face in marked] + [int(face[2]) for face in unmarked]
+    counts = [len(face[2]) for face in marked] + [len(face[0]) for face in unmarked]
+    verts = [pt for face in marked for pt in face[2]] + [pt for face in unmarked for pt in face[0]]
+    normal = [face[3] for face in marked] + [face[1] for face in unmarked]
+    return faceTable(blenderIndex, areaId, counts, verts, normal, areaTable)
+
+#read blender pickle file and save the faces as a faceTable
+class blenderReader:
+    #initialize the reader with the pickle file address, the [blenderData, faceLoops]
+    #list built by buildBlenderData, or directly with the mesh buffers. The stages
+    #are timed with timer (a stageTimer, a new one if not given)
+    def __init__(self, source, timer=None):
+        self.timer = timer if timer is not None else stageTimer()
+        with self.timer.stage("load"):
+            if isinstance(source, str):
+                file = open(source, "rb")
+                data = pickle.load(file)
+                file.close()
+            else:
+                data = source
+        if isinstance(data, dict):
+            ### quads and n-gons are split into triangles, see mesh.triangulateBuffers
+            data = triangulateBuffers(data)
+            self.vertsXZ = data['xz'][:]
+            self.vertsYZ = data['yz'][:]
+            self.generalInfo = [data['modelname'], data['modeldescription']]
+            #the level of detail section of a decimated model (see pipeline)
+            self.lod = data.get('lod')
+            faceLoops = data
+        else:
+            #blenderData is encoded as [(xy,yz),(marked face),(unmarked face), (name, introduction)]
+            blenderData = data[0]
+            self.vertsXZ = blenderData[0][0][:]
+            self.vertsYZ = blenderData[0][1][:]
+            self.generalInfo = blenderData[3]
+            self.lod = None
+            #new pickles store the face vertex arrays, old ones a faceMap and a pointMap
+            faceLoops = data[1]
+            if len(data) == 3:
+                faceLoops = faceMapToLoops(faceLoops)
+        #self.unitSize = 14.0/30.0
+        self.unitSize = TRACKER_UNIT_SIZE
+        with self.timer.stage("transformation matrix"):
+            self.transMtx = self.initialTrans() #no need to check this one
+        with self.timer.stage("face table"):
+            self.faces = tableFromBuffers(data) if isinstance(data, dict) else tableFromBlenderData(blenderData)
+        ### the lists aren't needed once the table is built
+        data = blenderData = None
+        self.allFaces = self.faces
+        with self.timer.stage("marked faces"):
+            self.faces.convert(self.transMtx, 0, self.faces.markedCount)
+        with self.timer.stage("unmarked faces"):
+            self.faces.convert(self.transMtx, self.faces.markedCount, len(self.faces))
+        self.timer.count('faces', len(self.faces))
+        self.timer.count('marked_faces', self.faces.markedCount)
+        with self.timer.stage("related faces"):
+            self.findrelatedFaces(faceLoops)
+
+    def initialTrans(self):
+        #identify four key points from the data, once per scaffold (see calibration.py)
+        self.calibration = calibrate(self.vertsXZ, self.vertsYZ, self.unitSize)
+        self.A, self.B, self.C, self.D = (self.calibration.A, self.calibration.B,
+                                          self.calibration.C, self.calibration.D)
+
+        #the real coordinates of these points
+        self.ptA, self.ptB, self.ptC, self.ptD = (self.calibration.ptA, self.calibration.ptB,
+                                                  self.calibration.ptC, self.calibration.ptD)
+        return self.calibration.matrix
+
+    @property
+    def markedFaces(self):
+        return [self.faces[i] for i in range(self.faces.markedCount)]
+
+    @property
+    def unmarkedFaces(self):
+        return [self.faces[i] for i in range(self.faces.markedCount, len(self.faces))]
+
+    def findrelatedFaces(self, faceLoops):
+       faceOffsets, faceFaces = buildFaceAdjacency(faceLoops['vertices'],
+                                                   faceLoops['loop_start'],
+                                                   faceLoops['loop_total'])[2:]
+       #kept for the incremental export, which relates the faces again when only labels change
+       self.faceAdjacency = (faceOffsets, faceFaces)
+       #faces left out of the table are left out of the related faces
+       self.faces.relate(faceOffsets, faceFaces, len(faceLoops['loop_total']))
+
+#build the [blenderData, faceLoops] list read by blenderReader
+#straight from the mesh buffers, so the export doesn't need to go through
+#the raw json or the pickle
+def buildBlenderData(buffers):
+    blenderData = []
+    marked = []
+    unmarked = []
+
+    co = buffers['co'].astype(np.float64).tolist()
+    normal = buffers['normal'].astype(np.float64).tolist()
+    vertices = buffers['vertices'].tolist()
+    loopStart = buffers['loop_start'].tolist()
+    loopTotal = buffers['loop_total'].tolist()
+    areaIndex = buffers['area_index'].tolist()
+    areas = {str(a): buffers['areas'][a] for a in buffers['areas']}
+
+    blenderData.append([buffers['xz'], buffers['yz']])
+
+    for j in range(len(loopStart)):
+        f = str(j)
+        faceVertices = vertices[loopStart[j]:loopStart[j] + loopTotal[j]]
+        currentvertices = [co[v] for v in faceVertices]
+
+        if areaIndex[j] == 0:
+            unmarked.append([currentvertices, normal[j], f])
+        else:
+            areaindex = areaIndex[j] - 1
+            area = areas[str(areaindex)]
+            generalinfo = [f,
+                           area['area_label'],
+                           area['area_content'],
+                           area['area_gesture'],
+                           str(areaindex)]
+            marked.append([generalinfo, area['area_color'], currentvertices, normal[j]])
+
+    blenderData.append(marked)
+    blenderData.append(unmarked)
+    blenderData.append([buffers['modelname'], buffers['modeldescription']])
+
+    faceLoops = {'vertices': buffers['vertices'],
+                 'loop_start': buffers['loop_start'],
+                 'loop_total': buffers['loop_total']}
+    return [blenderData, faceLoops]
@@ -0,0 +1,109 @@
+#Geometry of the tracker scaffold added by makeScaffold, and where its xz/yz
+#reference faces are
+
+#82 vertices of the scaffold
+SCAFFOLD_VERTICES = \
+    [
+        (-29.99028968811035, -6.8105974197387695, -9.081909229280427e-05),
+        (-29.99028968811035, -6.8105974197387695, 8.446209907531738),
+        (-29.99028968811035, 10.22175121307373, 8.446209907531738),
+        (-29.99028968811035, 10.22175121307373, -9.081909229280427e-05),
+        (-19.942604064941406, -6.8105974197387695, 8.446209907531738),
+        (-19.942604064941406, 10.22175121307373, 8.446209907531738),
+        (-19.942604064941406, -6.8105974197387695, -9.081909229280427e-05),
+        (-19.942604064941406, 10.22175121307373, -9.081909229280427e-05),
+        (-25.95956802368164, 35.02724838256836, 4.396630764007568),
+        (-27.95969009399414, 35.02724838256836, 2.3965096473693848),
+        (-27.95969009399414, 35.02724838256836, 4.396630764007568),
+        (-21.946422576904297, 35.02724838256836, 2.3965096473693848),
+        (-23.894927978515625, 35.02724838256836, 4.396630764007568),
+        (-21.946422576904297, 35.02724838256836, 4.396630764007568),
+        (-25.95956802368164, 35.02724838256836, 6.396751880645752),
+        (-23.894927978515625, 35.02724838256836, 6.396751880645752),
+        (-29.99028968811035, 35.02724838256836, 8.446209907531738),
+        (-29.99028968811035, 35.02724838256836, 6.396751880645752),
+        (-24.948001861572266, 35.02724838256836, 8.446209907531738),
+        (-19.90571403503418, 35.02724838256836, 8.446209907531738),
+        (-19.90571403503418, 35.02724838256836, 6.396751880645752),
+        (-29.99028968811035, 15.067978858947754, 8.446209907531738),
+        (-29.99028968811035, 10.078160285949707, 8.446209907531738),
+        (-24.948001861572266, 10.078160285949707, 8.446209907531738),
+        (-29.99028968811035, 20.057796478271484, 8.446209907531738),
+        (-29.99028968811035, 25.04761505126953, 8.446209907531738),
+        (-29.99028968811035, 30.037431716918945, 8.446209907531738),
+        (-19.90571403503418, 15.067978858947754, 8.446209907531738),
+        (-19.90571403503418, 20.057796478271484, 8.446209907531738),
+        (-19.90571403503418, 25.04761505126953, 8.446209907531738),
+        (-19.90571403503418, 30.037431716918945, 8.446209907531738),
+        (-19.90571403503418, 10.078160285949707, 8.446209907531738),
+        (-19.90571403503418, 15.067978858947754, 6.396751880645752),
+        (-19.90571403503418, 10.078160285949707, 6.396751880645752),
+        (-23.894927978515625, 10.078160285949707, 6.396751880645752),
+        (-23.894927978515625, 15.067978858947754, 6.396751880645752),
+        (-19.90571403503418, 20.057796478271484, 6.396751880645752),
+        (-23.894927978515625, 20.057796478271484, 6.396751880645752),
+        (-19.90571403503418, 30.037431716918945, 6.396751880645752),
+        (-19.90571403503418, 25.04761505126953, 6.396751880645752),
+        (-23.894927978515625, 25.04761505126953, 6.396751880645752),
+        (-23.894927978515625, 30.037431716918945, 6.396751880645752),
+        (-29.99028968811035, 15.067978858947754, 6.396751880645752),
+        (-29.99028968811035, 10.078160285949707, 6.396751880645752),
+        (-29.99028968811035, 20.057796478271484, 6.396751880645752),
+        (-29.99028968811035, 30.037431716918945, 6.396751880645752),
+        (-29.99028968811035, 25.04761505126953, 6.396751880645752),
+        (-25.95956802368164, 15.067978858947754, 6.396751880645752),
+        (-25.95956802368164, 10.078160285949707, 6.396751880645752),
+        (-25.95956802368164, 20.057796478271484, 6.396751880645752),
+        (-25.95956802368164, 30.037431716918945, 6.396751880645752),
+        (-25.95956802368164, 25.04761505126953, 6.396751880645752),
+        (-25.95956802368164, 15.067978858947754, 4.396630764007568),
+        (-25.95956802368164, 10.078160285949707, 4.396630764007568),
+        (-25.95956802368164, 20.057796478271484, 4.396630764007568),
+        (-25.95956802368164, 30.037431716918945, 4.396630764007568),
+        (-25.95956802368164, 25.04761505126953, 4.396630764007568),
+        (-27.95969009399414, 15.067978858947754, 4.396630764007568),
+        (-27.95969009399414, 10.078160285949707, 4.396630764007568),
+        (-27.95969009399414, 20.057796478271484, 4.396630764007568),
+        (-27.95969009399414, 30.037431716918945, 4.396630764007568),
+        (-27.95969009399414, 25.04761505126953, 4.396630764007568),
+        (-27.95969009399414, 15.067978858947754, 2.3965096473693848),
+        (-27.95969009399414, 10.078160285949707, 2.3965096473693848),
+        (-27.95969009399414, 20.057796478271484, 2.3965096473693848),
+        (-27.95969009399414, 30.037431716918945, 2.3965096473693848),
+        (-27.95969009399414, 25.04761505126953, 2.3965096473693848),
+        (-21.946422576904297, 15.067978858947754, 2.3965096473693848),
+        (-21.946422576904297, 10.078160285949707, 2.3965096473693848),
+        (-21.946422576904297, 20.057796478271484, 2.3965096473693848),
+        (-21.946422576904297, 30.037431716918945, 2.3965096473693848),
+        (-21.946422576904297, 25.04761505126953, 2.3965096473693848),
+        (-21.946422576904297, 15.067978858947754, 4.396630764007568),
+        (-21.946422576904297, 10.078160285949707, 4.396630764007568),
+        (-21.946422576904297, 20.057796478271484, 4.396630764007568),
+        (-21.946422576904297, 30.037431716918945, 4.396630764007568),
+        (-21.946422576904297, 25.04761505126953, 4.396630764007568),
+        (-23.894927978515625, 15.067978858947754, 4.396630764007568),
+        (-23.894927978515625, 10.078160285949707, 4.396630764007568),
+        (-23.894927978515625, 20.057796478271484, 4.396630764007568),
+        (-23.894927978515625, 30.037431716918945, 4.396630764007568),
+        (-23.894927978515625, 25.04761505126953, 4.396630764007568)
+    ]
+
+#156 triangular faces, each one made with 3 of the vertices
+SCAFFOLD_FACES = \
+    [[23,48,43],[0, 1, 2], [0, 2, 3], [1, 4, 5], [1, 5, 2], [4,6,7], [4,7,5], [6,0,3], [6,3,7], [1,0,6], [6,4,1], [2,7,3], [7,2,5], [8,9,10], [11,9,8], [11,8,12], [13,11,12], [12,8,14], [12,14,15], [18,14,16], [19,20,15], [15,18,19], [18,15,14], [21,22,23], [24,21,23], [24,18,25], [26,18,16], [18,26,25], [24,23,18], [27,28,23], [18,23,28], [18,28,29], [30,18,29], [18,30,19], [31,27,23], [32,33,34], [32,34,35], [36,32,35], [36,35,37], [38,39,40], [38,40,41], [20,38,41], [20,41,15], [39,36,37], [39,37,40], [42,43,22], [21,44,42],[42,22,21], [44,21,24], [45,46,25], [45,25,26], [17,45,26], [46,44,24], [46,24,25], [27,31,33], [27,33,32], [28,27,32], [28,32,36], [30,29,39], [30,39,38], [19,30,38], [19,38,20], [29,28,36], [29,36,39], [47,48,43], [47,43,42], [49,47,42], [49,42,44], [50,51,46], [50,46,45], [14,50,45], [14,45,17], [51,49,44], [51,44,46], [52,53,48], [52,48,47], [54,52,47], [54,47,49], [55,56,51], [55,51,50], [8,55,50], [8,50,14], [56,54,49], [56,49,51], [57,58,53], [57,53,52], [59,57,52], [59,52,54], [60,61,56], [60,56,55], [10,60,55], [10,55,8], [61,59,54], [61,54,56], [62,63,58], [62,58,57], [64,62,57], [64,57,59], [65,66,61], [65,61,60], [9,65,60], [9,60,10], [66,64,59], [66,59,61], [67,68,63], [67,63,62], [69,67,62], [69,62,64], [70,71,66], [70,66,65], [11,70,65], [11,65,9], [71,69,64], [71,64,66], [72,73,68], [72,68,67], [74,72,67], [74,67,69], [75,76,71], [75,71,70], [13,75,70], [13,70,11], [76,74,69], [76,69,71], [77,78,73], [77,73,72], [79,77,72], [79,72,74], [80,81,76], [80,76,75], [12,80,75], [12,75,13], [81,74,76], [35,34,78], [35,78,77], [37,35,77], [37,77,79], [41,40,81], [81,74,79],[41,81,80], [15,41,80], [15,80,12], [40,37,79], [40,79,81], [58,63,53], [63,68,78], [63,78,53], [43,23,22], [48,53,78], [48,78,34], [73,78,68], [31,23,34], [34,23,48], [34,33,31],[16,14,17],[16,26,17]]
+
+#faces painted with the xzFace and the yzFace materials, they give the
+#reference points of the transformation to the Tracker coordinates
+SCAFFOLD_XZ_FACE = 154
+SCAFFOLD_YZ_FACE = 155
+
+#real coordinates (in the Tracker coordinates) of the four reference points of
+#the scaffold: A is only in the xz face, D only in the yz face, and B and C are
+#in both (B is the one closer to A)
+TRACKER_UNIT_SIZE = 14.0 / 30.0
+TRACKER_POINTS = {
+    'A': [-5.04229+4.03073, 0, -8.4463+2.04945],
+    'B': [-5.04229, 0, -8.4463+2.04945],
+    'C': [-5.04229, 0, -8.4463],
+    'D': [-5.04229, 4.98983, -8.4463]
+}
@@ -0,0 +1,269 @@
+#Spatial index of the faces of the processed file, so a point in Tracker
+#coordinates (a fingertip) finds its face without going through every face.
+#The export saves it as <name>grid.npz next to the processed file: a uniform
+#grid of cubic cells over the triangles of the faces (the vert1, vert2, vert3 of
+#the processed file), every cell listing the faces whose bounding box touches it.
+#
+#   grid = readFaceGrid("cellgrid.npz")
+#   face, label, distance = grid.nearest((0.5, 1.2, -3.0))
+#
+#face is the index of the face in the processed file ("face" + str(face)), label
+#its label (the processed one, "nolabel" for an unmarked face)
+
+import json
+import os
+
+import numpy as np
+
+from .processed import processedLabel
+
+GRID_SUFFIX = "grid.npz"
+GRID_VERSION = 1
+#faces per cell the grid is sized for
+FACES_PER_CELL = 2.0
+#points measured at once by nearestMany
+QUERY_BLOCK = 1024
+
+#cross products along the last axis
+def _cross(u, v):
+    return np.stack((u[..., 1] * v[..., 2] - u[..., 2] * v[..., 1],
+                     u[..., 2] * v[..., 0] - u[..., 0] * v[..., 2],
+                     u[..., 0] * v[..., 1] - u[..., 1] * v[..., 0]), axis=-1)
+
+#distance from point to each of the (K,3,3) triangles corners: the distance to
+#the plane of the triangle if the point is over it, to the closest edge otherwise
+def triangleDistance(point, corners):
+    ### edge i goes from corner i to corner i + 1
+    edges = np.roll(corners, -1, axis=1) - corners
+    toPoint = point - corners
+    lengths = np.einsum('kij,kij->ki', edges, edges)
+    along = np.einsum('kij,kij->ki', toPoint, edges) / np.maximum(lengths, 1e-300)
+    offsets = toPoint - edges * np.clip(along, 0.0, 1.0)[..., None]
+    edgeDistance = np.einsum('kij,kij->ki', offsets, offsets).min(axis=1)
+
+    normal = _cross(edges[:, 0], edges[:, 1])
+    normalLength = np.einsum('kj,kj->k', normal, normal)
+    ### over the triangle if the point is on the inner side of the three edges
+    inner = _cross(normal[:, None, :], edges)
+    inside = (np.einsum('kij,kij->ki', toPoint, inner) >= 0).all(axis=1) & (normalLength > 0)
+    planeDistance = np.einsum('kj,kj->k', toPoint[:, 0], normal) ** 2 / np.maximum(normalLength, 1e-300)
+    return np.sqrt(np.where(inside, planeDistance, edgeDistance))
+
+#distance from point to each of the triangles a, b, c ((K,3) arrays each)
+def pointTriangleDistance(point, a, b, c):
+    return triangleDistance(np.asarray(point, dtype=np.float64), np.stack((a, b, c), axis=1))
+
+class faceGrid:
+    def __init__(self, origin, cellSize, dims, cellOffsets, cellFaces, nearCells, triangles, faceIds, faceLabel, labels):
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.cellSize = float(cellSize)
+        self.dims = np.asarray(dims, dtype=np.int64)
+        #faces of cell (x, y, z) are cellFaces[cellOffsets[k]:cellOffsets[k+1]], k = (x * dims[1] + y) * dims[2] + z
+        self.cellOffsets = cellOffsets
+        self.cellFaces = cellFaces
+        #a close cell with faces of every cell (itself if it has faces)
+        self.nearCells = nearCells
+        #(F,3,3) corners of the faces, in the order of the processed file
+        self.triangles = triangles
+        #and their bounding boxes
+        self.faceLower = triangles.min(axis=1)
+        self.faceUpper = triangles.max(axis=1)
+        #and the first cell of every box, the one buildFaceGrid puts the face in first
+        self.faceFirst = np.clip(np.floor((self.faceLower - self.origin) / self.cellSize).astype(np.int64),
+                                 0, self.dims - 1)
+        #the face of the exported mesh of every face of the processed file
+        self.faceIds = faceIds
+        #labels[faceLabel[f]] is the label of face f, faceLabel is the area_index of the face
+        self.faceLabel = faceLabel
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.triangles)
+
+    def save(self, fileAddress):
+        temporary = fileAddress + ".part.npz"
+        np.savez(temporary,
+                 version=np.array(GRID_VERSION),
+                 origin=self.origin,
+                 cell_size=np.array(self.cellSize),
+                 dims=self.dims,
+                 cell_offsets=self.cellOffsets,
+                 cell_faces=self.cellFaces,
+                 near_cells=self.nearCells,
+                 triangles=self.triangles,
+                 face_ids=self.faceIds,
+                 face_label=self.faceLabel,
+                 labels=np.array(json.dumps(self.labels)))
+        os.replace(temporary, fileAddress)
+
+    def cellOf(self, point):
+        cell = np.floor((np.asarray(point, dtype=np.float64) - self.origin) / self.cellSize).astype(np.int64)
+        return np.clip(cell, 0, self.dims - 1)
+
+    #the faces of the cells keys, returns (which, faces): the face and the
+    #position in keys of its cell for every face of every cell, in the order of keys
+    def _cellFaces(self, keys):
+        starts = self.cellOffsets[keys]
+        counts = self.cellOffsets[keys + 1] - starts
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(int(counts.sum()))
+        return np.repeat(np.arange(len(keys)), counts), self.cellFaces[positions]
+
+    #the nearest faces of a block of (N,3) points, measured all at once:
+    #  - the corners of the faces of a close cell of every point give how far its
+    #    nearest face can be
+    #  - the faces of the cells that close to the point whose bounding box is that
+    #    close too are its candidates, the farthest corner of the closest box brings
+    #    that bound down when the point is far from the faces
+    #  - the closest candidate (the lowest face on a tie) is its nearest face
+    #Returns (faces, distances) arrays
+    def _nearestBlock(self, points):
+        cells = np.clip(np.floor((points - self.origin) / self.cellSize).astype(np.int64), 0, self.dims - 1)
+        owners, faces = self._cellFaces(self.nearCells[(cells[:, 0] * self.dims[1] + cells[:, 1]) * self.dims[2] + cells[:, 2]])
+        corners = self.triangles[faces] - points[owners][:, None, :]
+        ### every close cell has faces, so every point has a group (the same below)
+        reach = np.sqrt(np.minimum.reduceat(np.einsum('kij,kij->ki', corners, corners).min(axis=1),
+                                            np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])))
+        reach *= 1 + 1e-9
+
+        ### the cells within reach of every point
+        low = np.clip(np.floor((points - reach[:, None] - self.origin) / self.cellSize).astype(np.int64),
+                      0, self.dims - 1)
+        high = np.clip(np.floor((points + reach[:, None] - self.origin) / self.cellSize).astype(np.int64),
+                       0, self.dims - 1)
+        span = high - low + 1
+        counts = span.prod(axis=1)
+        owners = np.repeat(np.arange(len(points)), counts)
+        step = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        spanY = span[owners, 1]
+        spanZ = span[owners, 2]
+        x = low[owners, 0] + step // (spanY * spanZ)
+        y = low[owners, 1] + (step // spanZ) % spanY
+        z = low[owners, 2] + step % spanZ
+        which, faces = self._cellFaces((x * self.dims[1] + y) * self.dims[2] + z)
+        owners = owners[which]
+
+        ### a face in several of those cells is only taken from the first of them
+        first = np.maximum(self.faceFirst[faces], low[owners])
+        once = (x[which] == first[:, 0]) & (y[which] == first[:, 1]) & (z[which] == first[:, 2])
+        owners = owners[once]
+        faces = faces[once]
+        at = points[owners]
+        lower = self.faceLower[faces] - at
+        upper = at - self.faceUpper[faces]
+        gap = np.maximum(lower, 0) + np.maximum(upper, 0)
+        gap = np.einsum('kj,kj->k', gap, gap)
+        far = np.maximum(-lower, -upper)
+        far = np.einsum('kj,kj->k', far, far)
+        groups = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+        bound = np.minimum(reach ** 2, np.minimum.reduceat(far, groups) * (1 + 1e-9) ** 2)
+        close = gap <= bound[owners]
+        owners = owners[close]
+        faces = faces[close]
+        distance = triangleDistance(points[owners][:, None, :], self.triangles[faces])
+
+        order = np.lexsort((faces, distance, owners))
+        nearest = order[np.r_[True, owners[order][1:] != owners[order][:-1]]]
+        return faces[nearest], distance[nearest]
+
+    #the nearest face to point. Returns (face, label, distance), (-1, None, inf) for an empty grid
+    def nearest(self, point):
+        faces, labels, distances = self.nearestMany(point)
+        return faces[0], labels[0], distances[0]
+
+    #nearest for each of the (N,3) points, returns (faces, labels, distances) lists.
+    #The points are measured QUERY_BLOCK at a time, which is much faster per point
+    #than one nearest after another
+    def nearestMany(self, points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if len(self.triangles) == 0:
+            return [-1] * len(points), [None] * len(points), [float('inf')] * len(points)
+        faces = []
+        distances = []
+        for start in range(0, len(points), QUERY_BLOCK):
+            blockFaces, blockDistances = self._nearestBlock(points[start:start + QUERY_BLOCK])
+            faces.extend(blockFaces.tolist())
+            distances.extend(blockDistances.tolist())
+        return faces, [self.labels[label] for label in self.faceLabel[faces].tolist()], distances
+
+#build the grid of the (F,3,3) triangles. faceIds, faceLabel and labels are kept
+#for the queries (see faceGrid)
+def buildFaceGrid(triangles, faceIds, faceLabel, labels):
+    triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+    faceCount = len(triangles)
+    if faceCount == 0:
+        return faceGrid(np.zeros(3), 1.0, np.ones(3, dtype=np.int64), np.zeros(2, dtype=np.int64),
+                        np.zeros(0, dtype=np.int32), np.zeros(1, dtype=np.int32), triangles, np.asarray(faceIds, dtype=np.int64),
+                        np.asarray(faceLabel, dtype=np.int32), labels)
+    lower = triangles.min(axis=(0, 1))
+    upper = triangles.max(axis=(0, 1))
+    extent = upper - lower
+    ### cubic cells, a flat model still gets one layer of them
+    extent = np.maximum(extent, max(float(extent.max()), 1e-9) * 1e-3)
+    cellSize = (np.prod(extent) * FACES_PER_CELL / faceCount) ** (1.0 / 3.0)
+    dims = np.maximum(np.ceil(extent / cellSize).astype(np.int64), 1)
+
+    ### every face goes in the cells its bounding box touches
+    first = np.clip(np.floor((triangles.min(axis=1) - lower) / cellSize).astype(np.int64), 0, dims - 1)
+    last = np.clip(np.floor((triangles.max(axis=1) - lower) / cellSize).astype(np.int64), 0, dims - 1)
+    span = last - first + 1
+    counts = span.prod(axis=1)
+    face = np.repeat(np.arange(faceCount, dtype=np.int64), counts)
+    step = np.arange(int(counts.sum()), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+    spanY = span[face, 1]
+    spanZ = span[face, 2]
+    x = first[face, 0] + step // (spanY * spanZ)
+    y = first[face, 1] + (step // spanZ) % spanY
+    z = first[face, 2] + step % spanZ
+    keys = (x * dims[1] + y) * dims[2] + z
+    order = np.argsort(keys, kind='stable')
+    cellCounts = np.bincount(keys, minlength=int(dims.prod()))
+    cellOffsets = np.zeros(int(dims.prod()) + 1, dtype=np.int64)
+    np.cumsum(cellCounts, out=cellOffsets[1:])
+    return faceGrid(lower, cellSize, dims, cellOffsets, face[order].astype(np.int32),
+                    nearCells(cellCounts.reshape(tuple(dims)) > 0), triangles,
+                    np.asarray(faceIds, dtype=np.int64), np.asarray(faceLabel, dtype=np.int32), labels)
+
+#a close cell with faces of every cell of the grid (the cell itself if it has
+#faces), found by spreading the cells with faces one cell at a time
+def nearCells(occupied):
+    near = np.where(occupied, np.arange(occupied.size).reshape(occupied.shape), -1)
+    while (near < 0).any():
+        for axis in range(3):
+            for forward in (True, False):
+                source = [slice(None)] * 3
+                target = [slice(None)] * 3
+                source[axis] = slice(None, -1) if forward else slice(1, None)
+                target[axis] = slice(1, None) if forward else slice(None, -1)
+                into = near[tuple(target)]
+                spread = near[tuple(source)]
+                empty = (into < 0) & (spread >= 0)
+                into[empty] = spread[empty]
+    return near.ravel().astype(np.int32)
+
+#the labels of a grid: labels[area_index] is the processed label of the area,
+#labels[0] the one of the unmarked faces. areaLabels is the processed label of
+#the area at each position (None for an area no face uses)
+def gridLabels(areaLabels):
+    return [processedLabel("unmarked", "null")[0]] + list(areaLabels)
+
+#build the grid of the faces of a blenderReader
+def tableFaceGrid(faces):
+    firstPoints = faces.point_offsets[:-1]
+    triangles = faces.verts_converted[(firstPoints[:, None] + np.arange(3)).ravel()].reshape(-1, 3, 3)
+    labels = gridLabels(processedLabel(area['label'], area['content'])[0] if area is not None else None
+                        for area in faces.areas)
+    return buildFaceGrid(triangles, faces.blender_index, faces.area_id + 1, labels)
+
+#read a grid saved by faceGrid.save, None if there is none or it can't be read
+def readFaceGrid(fileAddress):
+    if not os.path.exists(fileAddress):
+        return None
+    try:
+        with np.load(fileAddress) as data:
+            if int(data['version']) != GRID_VERSION:
+                return None
+            return faceGrid(data['origin'], float(data['cell_size']), data['dims'],
+                            data['cell_offsets'], data['cell_faces'], data['near_cells'], data['triangles'],
+                            data['face_ids'], data['face_label'], json.loads(str(data['labels'])))
+    except (OSError, ValueError, KeyError):
+        return None
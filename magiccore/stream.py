@@ -0,0 +1,266 @@
+#Incremental decoding of raw model json, for models too big to hold several
+#copies of in memory. The text goes through rawModelParser in chunks of any
+#size: the vertices and faces are appended to typed arrays one at a time (the
+#json of a single vertex or face is all that is ever parsed at once), the small
+#sections (areas, materials, xz, yz...) are kept as they are, and close()
+#returns the same mesh buffers as formats.readRawData.
+#iterJsonString undoes the json string encoding the online models are wrapped in
+
+import json
+import re
+from array import array
+
+import numpy as np
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'\s*')
+#a quote after an even number of backslashes, the end of a json string
+_stringEnd = re.compile(r'(?:^|[^\\])(?:\\\\)*"')
+
+#the length of the start of text made of complete escape sequences, an escape
+#cut by the end of the chunk waits for the next one
+def _completeEscapes(text):
+    i = text.rfind('\\', max(0, len(text) - 6))
+    if i < 0:
+        return len(text)
+    j = i
+    while j > 0 and text[j - 1] == '\\':
+        j -= 1
+    if (i - j) % 2 == 1:
+        ### text[i] is escaped by the backslash before it
+        return len(text)
+    need = 6 if i + 1 < len(text) and text[i + 1] == 'u' else 2
+    return i if i + need > len(text) else len(text)
+
+#decode the json string content of text[:cut], the first half of a surrogate
+#pair is left for the next chunk. Returns (decoded text, cut)
+def _decodeString(text, cut):
+    piece = json.loads('"' + text[:cut] + '"', strict=False)
+    if piece and '\ud800' <= piece[-1] <= '\udbff':
+        return piece[:-1], cut - 6
+    return piece, cut
+
+#the decoded text of a json string literal (quotes included) sent in chunks,
+#itself in chunks. Text after the closing quote is ignored. A payload that is
+#not a string (it starts with something else than a quote) is passed through as is
+def iterJsonString(chunks):
+    carry = ''
+    started = False
+    raw = False
+    for chunk in chunks:
+        text = carry + chunk
+        if raw:
+            yield text
+            carry = ''
+            continue
+        if not started:
+            start = _whitespace.match(text).end()
+            if start == len(text):
+                carry = text
+                continue
+            if text[start] != '"':
+                raw = True
+                yield text[start:]
+                carry = ''
+                continue
+            started = True
+            text = text[start + 1:]
+
+        end = _stringEnd.search(text)
+        if end is not None:
+            yield json.loads('"' + text[:end.end() - 1] + '"', strict=False)
+            return
+        piece, cut = _decodeString(text, _completeEscapes(text))
+        if piece:
+            yield piece
+        carry = text[cut:]
+    if started and not raw:
+        raise ValueError("the json string of the model is cut")
+
+class rawModelParser:
+    def __init__(self):
+        self.text = ''
+        self.pos = 0
+        self.closed = False
+        self.done = False
+        self.sections = {}
+        self.seen = set()
+
+        self.vertexIndex = array('q')
+        self.co = array('f')
+        self.faceIndex = array('q')
+        self.loopTotal = array('i')
+        self.vertices = array('i')
+        self.normal = array('f')
+        self.areaIndex = array('i')
+
+        self._steps = self._parse()
+        next(self._steps)
+
+    def feed(self, text):
+        if self.done:
+            if text.strip():
+                raise ValueError("text after the end of the model")
+            return
+        self.text = self.text[self.pos:] + text
+        self.pos = 0
+        self._resume()
+
+    #the mesh buffers of the model, once all the text was fed
+    def close(self):
+        self.closed = True
+        if not self.done:
+            self._resume()
+        if not self.done:
+            raise ValueError("the model json is cut")
+        return self._buffers()
+
+    def _resume(self):
+        try:
+            self._steps.send(None)
+        except StopIteration:
+            self.done = True
+
+    ### the parse runs as a generator that yields whenever it needs more text
+
+    def _skip(self):
+        while True:
+            self.pos = _whitespace.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return
+            if self.closed:
+                raise ValueError("the model json is cut")
+            yield
+
+    def _expect(self, chars):
+        yield from self._skip()
+        char = self.text[self.pos]
+        if char not in chars:
+            raise ValueError("unexpected %r at %r in the model json" % (char, self.text[self.pos:self.pos + 40]))
+        self.pos += 1
+        return char
+
+    #the next json value, decoded once the text holds all of it
+    def _value(self):
+        yield from self._skip()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+                ### a number at the end of the text may go on in the next chunk
+                if end < len(self.text) or self.closed:
+                    self.pos = end
+                    return value
+            except ValueError as e:
+                if self.closed:
+                    raise ValueError("the model json is cut or broken: " + str(e))
+            yield
+
+    #the "key": value pairs of an object, value is decoded with item(key)
+    def _object(self, item):
+        yield from self._expect('{')
+        yield from self._skip()
+        if self.text[self.pos] == '}':
+            self.pos += 1
+            return
+        while True:
+            key = yield from self._value()
+            yield from self._expect(':')
+            yield from item(key)
+            if (yield from self._expect(',}')) == '}':
+                return
+
+    def _parse(self):
+        yield
+        def section(key):
+            self.seen.add(key)
+            if key == 'vertices':
+                yield from self._object(self._vertex)
+            elif key == 'faces':
+                yield from self._object(self._face)
+            else:
+                self.sections[key] = yield from self._value()
+        yield from self._object(section)
+
+    def _vertex(self, key):
+        value = yield from self._value()
+        self.vertexIndex.append(int(key))
+        self.co.extend(value)
+
+    def _face(self, key):
+        value = yield from self._value()
+        self.faceIndex.append(int(key))
+        self.loopTotal.append(len(value['vertices']))
+        self.vertices.extend(value['vertices'])
+        self.normal.extend(value['normal'])
+        self.areaIndex.append(value['area_index'])
+
+    def _buffers(self):
+        if 'vertices' not in self.seen or 'faces' not in self.seen:
+            raise ValueError("not a raw model export (no vertices or faces)")
+        co = np.frombuffer(self.co, dtype=np.float32).reshape(-1, 3)
+        normal = np.frombuffer(self.normal, dtype=np.float32).reshape(-1, 3)
+        loopTotal = np.frombuffer(self.loopTotal, dtype=np.int32)
+        vertices = np.frombuffer(self.vertices, dtype=np.int32)
+        areaIndex = np.frombuffer(self.areaIndex, dtype=np.int32)
+
+        ### the keys are the indices, in any order
+        vertexOrder = _order(np.frombuffer(self.vertexIndex, dtype=np.int64))
+        if vertexOrder is not None:
+            co = co[vertexOrder]
+        faceOrder = _order(np.frombuffer(self.faceIndex, dtype=np.int64))
+        loopStart = np.zeros(len(loopTotal), dtype=np.int32)
+        np.cumsum(loopTotal[:-1], out=loopStart[1:])
+        if faceOrder is not None:
+            ### the loops of the faces, face after face in the new order
+            loops = np.repeat(loopStart[faceOrder] - np.cumsum(loopTotal[faceOrder]) + loopTotal[faceOrder],
+                              loopTotal[faceOrder]) + np.arange(len(vertices))
+            vertices = vertices[loops]
+            loopTotal = loopTotal[faceOrder]
+            normal = normal[faceOrder]
+            areaIndex = areaIndex[faceOrder]
+            np.cumsum(loopTotal[:-1], out=loopStart[1:])
+
+        buffers = {
+            'co': co,
+            'normal': normal,
+            'loop_start': loopStart,
+            'loop_total': loopTotal,
+            'vertices': vertices,
+            'area_index': areaIndex,
+            'materials': self.sections.get('materials', {}),
+            'areas': self.sections.get('areas', {}),
+            'xz': self.sections.get('xz', []),
+            'yz': self.sections.get('yz', []),
+            'modelname': self.sections.get('modelname', ''),
+            'modeldescription': self.sections.get('modeldescription', '')
+        }
+        if self.sections.get('calibration'):
+            buffers['calibration'] = self.sections['calibration']
+        return buffers
+
+#the permutation that sorts the keys of a section, None if they are already
+#0, 1, 2... Raises ValueError if they aren't the indices of the section
+def _order(keys):
+    expected = np.arange(len(keys))
+    if np.array_equal(keys, expected):
+        return None
+    order = np.argsort(keys, kind='mergesort')
+    if not np.array_equal(keys[order], expected):
+        raise ValueError("the vertices or faces of the model are not numbered 0 to n-1")
+    return order
+
+#parse raw model json sent in text chunks into mesh buffers
+def parseRawModel(chunks):
+    parser = rawModelParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+#the text of a file, chunk by chunk
+def iterFileText(fileAddress, chunkSize=1 << 20):
+    with open(fileAddress, encoding='utf-8') as f:
+        while True:
+            chunk = f.read(chunkSize)
+            if not chunk:
+                return
+            yield chunk
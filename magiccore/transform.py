@@ -0,0 +1,61 @@
+#Transformation from the Blender coordinates to the Tracker coordinates
+
+import numpy as np
+
+#get transformation matrix from the Blender coordinates to the Tracker coordinates.
+#mtx * x = y is solved as x^T * mtx^T = y^T, without inverting x
+def solve_affine( p1, p2, p3, p4, s1, s2, s3, s4 ):
+    x = np.ones((4, 4))
+    y = np.ones((4, 4))
+    x[0:3, :] = np.transpose([p1, p2, p3, p4])
+    y[0:3, :] = np.transpose([s1, s2, s3, s4])
+    mtx = np.linalg.solve(x.T, y.T).T
+    # return function that takes input x and transforms it
+    # the 4th row of an affine transformation is exactly 0 0 0 1
+    mtx[3, :] = [0, 0, 0, 1]
+    return np.matrix(mtx)
+
+#enter a point X in Blender coordinates, and transformation matrix to get its Tracker coordinates
+def solve_point(x, trans):
+    result= (trans*np.vstack((np.matrix(x).reshape(3,1),1)))[0:3,:].tolist()
+    return [result[0][0],result[1][0],result[2][0]]
+
+#enter a normal X in Blender coordinates, and transformation matrix to get its Tracker coordinates
+def solve_normal(x, trans):
+    result= (trans*np.vstack((np.matrix(x).reshape(3,1),0)))[0:3,:].tolist()
+    return [result[0][0],result[1][0],result[2][0]]
+
+#enter an (N,3) array of points in Blender coordinates, and transformation matrix
+#to get all of their Tracker coordinates in a single (N,4) homogeneous operation.
+#einsum keeps the same summation order as solve_point, so the numbers don't change
+def solve_points(points, trans):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    homogeneous = np.ones((len(points), 4))
+    homogeneous[:, :3] = points
+    return np.einsum('ij,nj->ni', np.asarray(trans), homogeneous)[:, :3]
+
+#enter an (N,3) array of normals in Blender coordinates, and transformation matrix
+#to get all of their Tracker coordinates, same as solve_points with w = 0
+def solve_normals(normals, trans):
+    normals = np.asarray(normals, dtype=np.float64).reshape(-1, 3)
+    homogeneous = np.zeros((len(normals), 4))
+    homogeneous[:, :3] = normals
+    return np.einsum('ij,nj->ni', np.asarray(trans), homogeneous)[:, :3]
+
+#for initialize the transformation matrix
+#calculate the euclidean distance between pt1 and pt2
+def calDistance(pt1,pt2):
+    return float(np.linalg.norm(np.subtract(pt1, pt2, dtype=np.float64)))
+
+#for initialize the transformation matrix
+#scale a list with a value (scale)
+def calScaledList(scale,list):
+    return  [x * scale for x in list]
+
+def faceptsCompare(faceA,faceB):
+    for ptA in faceA:
+        for ptB in faceB:
+            if ptA == ptB:
+                return True
+
+    return False
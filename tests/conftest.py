@@ -0,0 +1,80 @@
+#Shared fixtures of the tests. They run under plain python with NumPy and
+#pytest, from the root of the repository:
+#
+#   python -m pytest -q
+#
+#tests/data/cellbaseline.json.gz holds what the first exporter (before the
+#NumPy rewrite) produced for demo/cell.json, named "cell" with the intro
+#"intro": the label fields of every face and the whole record of every 97th face
+
+import copy
+import gzip
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import magiccore
+import fixtures
+
+BASELINE = os.path.join(HERE, "data", "cellbaseline.json.gz")
+
+def pytest_configure(config):
+    ### the solvers of the first exporter use np.matrix
+    config.addinivalue_line("filterwarnings", "ignore:the matrix subclass:PendingDeprecationWarning")
+
+@pytest.fixture(scope="session")
+def cellBuffers():
+    buffers = magiccore.readModelFile(fixtures.CELL)
+    buffers['modelname'] = "cell"
+    buffers['modeldescription'] = "intro"
+    return buffers
+
+#a copy of the buffers of demo/cell.json a test can change
+@pytest.fixture
+def cell(cellBuffers):
+    return copy.deepcopy(cellBuffers)
+
+@pytest.fixture(scope="session")
+def baseline():
+    with gzip.open(BASELINE, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+GEOMETRY = ('verts', 'normal', 'nearFaces')
+
+def _point(record):
+    return [record[axis] for axis in 'xyz']
+
+#the differences between the face records of a processed file and the
+#baseline: the same faces in the same order with the same labels, and the same
+#geometry and nearFaces (in any order) for the sampled faces
+def compareBaseline(faces, baseline):
+    errors = []
+    if list(faces) != list(baseline['labels']):
+        return ["the faces are not face0 to face" + str(len(baseline['labels']) - 1)]
+    for key, want in baseline['labels'].items():
+        got = {field: value for field, value in faces[key].items() if field not in GEOMETRY}
+        if got != want:
+            errors.append(key + " labels differ: " + repr(got) + " != " + repr(want))
+    for key, want in baseline['samples'].items():
+        got = faces[key]
+        if not np.allclose([_point(got['verts'][c]) for c in ('vert1', 'vert2', 'vert3')],
+                           [_point(want['verts'][c]) for c in ('vert1', 'vert2', 'vert3')], rtol=0, atol=1e-9):
+            errors.append(key + " verts differ")
+        if not np.allclose(_point(got['normal']), _point(want['normal']), rtol=0, atol=1e-9):
+            errors.append(key + " normal differs")
+        if fixtures.nearFaces(got) != fixtures.nearFaces(want):
+            errors.append(key + " nearFaces differ")
+    return errors
+
+#compareBaseline against the baseline of demo/cell.json
+@pytest.fixture
+def baselineErrors(baseline):
+    return lambda faces: compareBaseline(faces, baseline)
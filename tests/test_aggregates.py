@@ -0,0 +1,62 @@
+#The "areas" section of the processed file against the same aggregates summed
+#up face record by face record
+
+import numpy as np
+import pytest
+
+import magiccore
+from magiccore.aggregates import faceMeasures, areaAggregates
+
+def _point(record):
+    return [record[axis] for axis in 'xyz']
+
+@pytest.fixture(scope="module")
+def processed(cellBuffers):
+    return magiccore.buildProcessedData(magiccore.blenderReader(cellBuffers))
+
+def test_areas_section(processed):
+    groups = {}
+    for key, record in processed['faces'].items():
+        if record['marked']:
+            groups.setdefault(record['area_id'], []).append(record)
+    assert sorted(processed['areas']) == sorted(groups)
+
+    for areaId, records in groups.items():
+        area = processed['areas'][areaId]
+        assert area['faces'] == [record['index'] for record in records]
+        assert (area['label'], area['content'], area['color']) == \
+            (records[0]['label'], records[0]['content'], records[0]['color'])
+        verts = np.array([[_point(record['verts'][c]) for c in ('vert1', 'vert2', 'vert3')] for record in records])
+        surfaces = 0.5 * np.linalg.norm(np.cross(verts[:, 1] - verts[:, 0], verts[:, 2] - verts[:, 0]), axis=1)
+        normal = (np.array([_point(record['normal']) for record in records]) * surfaces[:, None]).sum(axis=0)
+        assert np.allclose(_point(area['bounds']['min']), verts.min(axis=(0, 1)), rtol=0, atol=1e-9)
+        assert np.allclose(_point(area['bounds']['max']), verts.max(axis=(0, 1)), rtol=0, atol=1e-9)
+        assert area['surface_area'] == pytest.approx(surfaces.sum(), rel=1e-9)
+        assert np.allclose(_point(area['centroid']), (verts.mean(axis=1) * surfaces[:, None]).sum(axis=0) / surfaces.sum(),
+                           rtol=0, atol=1e-9)
+        assert np.allclose(_point(area['normal']), normal / np.linalg.norm(normal), rtol=0, atol=1e-9)
+
+def test_face_measures():
+    ### a unit square, split in two triangles from its first vert, and a face without surface
+    points = [[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0], [0, 0, 0], [1, 0, 0], [2, 0, 0]]
+    measures = faceMeasures(points, [0, 4, 7], [[0, 0, 1], [0, 0, 1]])
+    assert measures['surface'].tolist() == [1.0, 0.0]
+    assert np.allclose(measures['centroid'], [[0.5, 0.5, 0], [1, 0, 0]])
+    assert measures['lower'].tolist() == [[0, 0, 0], [0, 0, 0]]
+    assert measures['upper'].tolist() == [[1, 1, 0], [2, 0, 0]]
+
+def test_area_without_surface():
+    points = [[0, 0, 0], [1, 0, 0], [2, 0, 0], [0, 0, 0], [0, 0, 0], [0, 0, 4]]
+    measures = faceMeasures(points, [0, 3, 6], [[0, 0, 1], [0, 1, 0]])
+    aggregates = areaAggregates(measures, [2, 2])
+    ### the faces weigh the same
+    assert aggregates['positions'].tolist() == [2]
+    assert aggregates['surface'].tolist() == [0.0]
+    assert np.allclose(aggregates['centroid'], [[0.5, 0, 2.0 / 3.0]])
+    assert np.allclose(aggregates['normal'], [[0, np.sqrt(0.5), np.sqrt(0.5)]])
+
+def test_no_marked_faces():
+    measures = faceMeasures([[0, 0, 0], [1, 0, 0], [0, 1, 0]], [0, 3], [[0, 0, 1]])
+    aggregates = areaAggregates(measures, [-1])
+    assert len(aggregates['positions']) == 0 and aggregates['faces'] == []
+    assert faceMeasures(np.zeros((0, 3)), [0], np.zeros((0, 3)))['surface'].shape == (0,)
@@ -0,0 +1,54 @@
+#The batch exporter on copies of demo/cell.json
+
+import json
+import os
+import shutil
+
+import magiccore
+from magiccore.batch import main, findModels
+import fixtures
+
+def copyCell(directory, name="cell.json"):
+    path = str(directory.join(name))
+    shutil.copyfile(fixtures.CELL, path)
+    return path
+
+def test_converts_a_directory(tmpdir):
+    models = tmpdir.mkdir("models")
+    copyCell(models, "a.json")
+    copyCell(models, "b.json")
+    output = tmpdir.join("out")
+    report = str(tmpdir.join("report.json"))
+    assert main([str(models), "-o", str(output), "-j", "2", "--raw-json", "--report", report]) == 0
+
+    for name in ("a", "b"):
+        assert output.join(name + "processed.json").check()
+        assert output.join(name + ".json").check()
+    with open(report) as f:
+        results = json.load(f)
+    assert [result['status'] for result in results.values()] == ['ok', 'ok']
+    ### the processed files aren't models of the next run
+    assert findModels([str(output)]) == [str(output.join("a.json")), str(output.join("b.json"))]
+
+def test_raw_json_never_writes_over_the_model(tmpdir, capsys):
+    model = copyCell(tmpdir)
+    with open(model, 'rb') as f:
+        before = f.read()
+    assert main([model, "-j", "1", "--raw-json"]) == 1
+    assert "--raw-json would write over the model" in capsys.readouterr().out
+    with open(model, 'rb') as f:
+        assert f.read() == before
+    assert not tmpdir.join("cellprocessed.json").check()
+
+    ### -o pointing at the directory of the model is refused too
+    assert main([model, "-j", "1", "--raw-json", "-o", str(tmpdir)]) == 1
+    with open(model, 'rb') as f:
+        assert f.read() == before
+
+def test_binary_model_keeps_its_file(tmpdir):
+    fileName = str(tmpdir.join("cell"))
+    magiccore.writeBinaryFile(fileName, magiccore.readModelFile(fixtures.CELL))
+    assert main([fileName + magiccore.BINARY_EXTENSION, "-j", "1", "--binary"]) == 1
+    assert main([fileName + magiccore.BINARY_EXTENSION, "-j", "1", "--raw-json"]) == 0
+    assert os.path.exists(fileName + "processed.json")
+    assert os.path.exists(fileName + ".json")
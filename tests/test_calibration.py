@@ -0,0 +1,84 @@
+#The calibration of the scaffold: matching the reference points with a
+#tolerance, computing it once, and reusing the one saved in an export
+
+import numpy as np
+import pytest
+
+from magiccore import calibration
+from magiccore.calibration import (calibrate, matchScaffoldPoints, rememberCalibration,
+                                   scaffoldCalibration)
+from magiccore.pipeline import runExport
+from magiccore.transform import solve_points
+
+@pytest.fixture(autouse=True)
+def noCalibrations(monkeypatch):
+    monkeypatch.setattr(calibration, '_calibrations', {})
+
+@pytest.fixture
+def scaffold(cellBuffers):
+    return cellBuffers['xz'], cellBuffers['yz']
+
+def test_reference_points_go_to_the_tracker(scaffold):
+    result = calibrate(*scaffold)
+    points = solve_points([result.A, result.B, result.C, result.D], result.matrix)
+    assert np.allclose(points, [result.ptA, result.ptB, result.ptC, result.ptD], rtol=0, atol=1e-9)
+    assert np.allclose(result.matrix[3], [0, 0, 0, 1])
+
+def test_points_match_with_a_tolerance(scaffold):
+    xz, yz = scaffold
+    A, B, C, D = matchScaffoldPoints(xz, yz)
+    ### a float conversion and another order of the verts
+    moved = (np.asarray(yz, dtype=np.float64) * (1 + 1e-9))[::-1]
+    assert np.allclose(matchScaffoldPoints(xz[::-1], moved), (A, B, C, D), rtol=0, atol=1e-6)
+    assert np.linalg.norm(np.subtract(B, A)) <= np.linalg.norm(np.subtract(C, A))
+
+def test_deformed_scaffold(scaffold):
+    xz, yz = scaffold
+    with pytest.raises(ValueError):
+        matchScaffoldPoints([], yz)
+    deformed = np.asarray(yz, dtype=np.float64) + 0.5
+    with pytest.raises(ValueError):
+        matchScaffoldPoints(xz, deformed)
+
+def test_calibrated_once(scaffold):
+    assert calibrate(*scaffold) is calibrate(*scaffold)
+    assert calibrate(*scaffold, unitSize=1.0) is not calibrate(*scaffold)
+
+def test_saved_calibration(scaffold):
+    saved = scaffoldCalibration(*matchScaffoldPoints(*scaffold)).toDict()
+    read = scaffoldCalibration.fromDict(saved)
+    assert read.toDict() == saved
+    remembered = rememberCalibration(saved, *scaffold)
+    assert np.array_equal(remembered.matrix, read.matrix)
+    assert calibrate(*scaffold) is remembered
+
+def test_edited_calibration_is_ignored(scaffold):
+    saved = scaffoldCalibration(*matchScaffoldPoints(*scaffold)).toDict()
+    edited = dict(saved, points=dict(saved['points'], A=[0.0, 0.0, 0.0]))
+    assert rememberCalibration(edited, *scaffold) is None
+    assert rememberCalibration(dict(saved, matrix=[[1.0]]), *scaffold) is None
+    assert rememberCalibration({'matrix': saved['matrix']}, *scaffold) is None
+    assert rememberCalibration(None, *scaffold) is None
+    ### nothing was remembered, the calibration is computed
+    assert not calibration._calibrations
+
+def test_edited_matrix_is_recomputed(tmpdir, cell, scaffold):
+    expected = scaffoldCalibration(*matchScaffoldPoints(*scaffold))
+    saved = expected.toDict()
+    moved = np.array(saved['matrix'])
+    moved[0, 3] += 100.0
+    assert rememberCalibration(dict(saved, matrix=moved.tolist()), *scaffold) is None
+    assert rememberCalibration(dict(saved, matrix=(np.array(saved['matrix']) * 2).tolist()), *scaffold) is None
+    assert not calibration._calibrations
+    assert np.array_equal(calibrate(*scaffold).matrix, expected.matrix)
+
+    ### an imported model with an edited matrix exports where a clean one does
+    calibration._calibrations.clear()
+    cell['calibration'] = dict(saved, matrix=moved.tolist())
+    runExport(str(tmpdir.join("edited")), cell, {}, lambda stage, progress: None)
+    del cell['calibration']
+    runExport(str(tmpdir.join("clean")), cell, {}, lambda stage, progress: None)
+    with open(str(tmpdir.join("editedprocessed.json")), 'rb') as edited:
+        with open(str(tmpdir.join("cleanprocessed.json")), 'rb') as clean:
+            assert edited.read() == clean.read()
+    assert np.array_equal(calibrate(*scaffold).matrix, expected.matrix)
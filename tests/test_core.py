@@ -0,0 +1,34 @@
+#The bpy-free conversion on the demo models: the processed faces against the
+#first exporter, the per-point solve and the vertex-sharing nearFaces, and the
+#.magicbin round trip
+
+import numpy as np
+
+import magiccore
+import fixtures
+
+def test_cell_matches_reference_checks():
+    assert fixtures.checkCell() == []
+
+def test_plane_exports_back_to_itself():
+    assert fixtures.checkPlane() == []
+
+def test_cell_faces_match_baseline(cellBuffers, baselineErrors):
+    processed = fixtures.convert(cellBuffers)[1]
+    assert processed['modelName'] == "cell"
+    assert processed['modelIntro'] == "intro"
+    assert baselineErrors(processed['faces']) == []
+
+def test_binary_round_trip(tmpdir, cellBuffers):
+    fileName = str(tmpdir.join("cell"))
+    magiccore.writeBinaryFile(fileName, cellBuffers)
+    buffers = magiccore.readBinaryFile(fileName + magiccore.BINARY_EXTENSION)
+
+    for name in ('co', 'normal', 'loop_start', 'loop_total', 'vertices', 'area_index'):
+        assert np.array_equal(buffers[name], np.asarray(cellBuffers[name], dtype=buffers[name].dtype)), name
+    for key in ('modelname', 'modeldescription', 'xz', 'yz'):
+        assert buffers[key] == cellBuffers[key]
+    assert buffers['areas'] == {str(k): area for k, area in cellBuffers['areas'].items()}
+
+    ### and it converts to the same processed faces
+    assert fixtures.convert(buffers)[1] == fixtures.convert(cellBuffers)[1]
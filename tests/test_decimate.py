@@ -0,0 +1,73 @@
+#The decimation keeps the areas and the scaffold of the model, maps every face
+#to the face it went into, and chains the levels of detail
+
+import numpy as np
+import pytest
+
+import magiccore
+from magiccore.decimate import (decimateBuffers, levelsOfDetail, parseLevels, processedParents,
+                                scaffoldFaces)
+
+@pytest.fixture(scope="module")
+def decimated(cellBuffers):
+    return decimateBuffers(cellBuffers, targetFaces=2000)
+
+def test_face_budget(cellBuffers, decimated):
+    assert 0 < len(decimated['loop_total']) <= 2000
+    assert (decimated['loop_total'] == 3).all()
+    assert len(decimated['vertices']) == 3 * len(decimated['loop_total'])
+    assert decimated['vertices'].max() < len(decimated['co'])
+    assert decimated['error'] > 0
+
+def test_faces_keep_their_area(cellBuffers, decimated):
+    parent = decimated['parent']
+    assert len(parent) == len(cellBuffers['loop_total'])
+    kept = parent >= 0
+    assert parent.max() < len(decimated['loop_total'])
+    assert np.array_equal(decimated['area_index'][parent[kept]], cellBuffers['area_index'][kept])
+    ### every area still has faces
+    assert set(decimated['area_index'].tolist()) == set(cellBuffers['area_index'].tolist())
+
+def test_scaffold_is_kept(cellBuffers, decimated):
+    original = magiccore.blenderReader(cellBuffers)
+    reader = magiccore.blenderReader(decimated)
+    assert np.allclose(reader.transMtx, original.transMtx, rtol=0, atol=1e-9)
+
+def test_error_bound(cellBuffers):
+    coarse = decimateBuffers(cellBuffers, maxError=0.5)
+    assert coarse['error'] <= 0.5
+    assert len(coarse['loop_total']) < len(cellBuffers['loop_total'])
+    with pytest.raises(ValueError):
+        decimateBuffers(cellBuffers)
+
+def test_levels_of_detail(cellBuffers):
+    levels = levelsOfDetail(cellBuffers, [500, 2000])
+    counts = [len(level['loop_total']) for level in levels]
+    assert counts[0] <= 2000 and counts[1] <= 500 and counts[1] < counts[0]
+    ### each level maps the faces of the one before
+    assert len(levels[0]['parent']) == len(cellBuffers['loop_total'])
+    assert len(levels[1]['parent']) == counts[0]
+    parents = processedParents(levels[0], levels[1])
+    assert len(parents) == counts[0]
+    assert parents.min() >= -1 and parents.max() < counts[1]
+
+def test_scaffold_faces(cellBuffers, decimated):
+    ### the xz and yz faces at the end of the demo cell, unchanged by the decimation
+    assert np.flatnonzero(scaffoldFaces(cellBuffers)).tolist() == [len(cellBuffers['loop_total']) - 2,
+                                                                 len(cellBuffers['loop_total']) - 1]
+    kept = scaffoldFaces(decimated)
+    assert np.count_nonzero(kept) == 2
+    points = decimated['co'][decimated['vertices'].reshape(-1, 3)[kept]].reshape(-1, 3)
+    assert sorted(map(tuple, points.tolist())) == sorted(map(tuple, cellBuffers['xz'] + cellBuffers['yz']))
+    buffers = {'co': np.array([[0, 0, 0], [1, 0, 0], [0, 0, 1], [5, 5, 5]], dtype=np.float32),
+               'vertices': np.array([0, 1, 2, 0, 1, 3]), 'loop_start': np.array([0, 3]),
+               'loop_total': np.array([3, 3]), 'xz': [[0, 0, 0], [1, 0, 0], [0, 0, 1]], 'yz': []}
+    assert scaffoldFaces(buffers).tolist() == [True, False]
+
+def test_parse_levels():
+    assert parseLevels("20000, 5000") == [20000, 5000]
+    assert parseLevels(" 300  100,") == [300, 100]
+    assert parseLevels("") == []
+    for text in ("0", "-5", "1e3", "many"):
+        with pytest.raises(ValueError):
+            parseLevels(text)
@@ -0,0 +1,68 @@
+#The .magicbin reader: the same buffers whether the arrays are read or memory
+#mapped, and the file isn't left open (or mapped) behind the reader
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+import magiccore
+
+ARRAYS = ('co', 'normal', 'loop_start', 'loop_total', 'vertices', 'area_index')
+
+#the files this process has open or mapped (linux only)
+def openedFiles():
+    files = set()
+    for fd in os.listdir('/proc/self/fd'):
+        try:
+            files.add(os.readlink(os.path.join('/proc/self/fd', fd)))
+        except OSError:
+            pass
+    with open('/proc/self/maps') as f:
+        for line in f:
+            fields = line.split(None, 5)
+            if len(fields) == 6:
+                files.add(fields[5].strip())
+    return files
+
+linuxOnly = pytest.mark.skipif(not sys.platform.startswith('linux'), reason="reads /proc/self")
+
+@pytest.fixture
+def binaryFile(tmpdir, cellBuffers):
+    fileName = str(tmpdir.join("cell"))
+    magiccore.writeBinaryFile(fileName, cellBuffers)
+    return os.path.realpath(fileName + magiccore.BINARY_EXTENSION)
+
+def test_mapped_buffers_equal_read_buffers(binaryFile):
+    read = magiccore.readBinaryFile(binaryFile)
+    with magiccore.openBinaryFile(binaryFile) as mapped:
+        for name in ARRAYS:
+            assert np.array_equal(mapped[name], read[name]), name
+        for key in ('modelname', 'modeldescription', 'areas', 'materials', 'xz', 'yz', 'calibration'):
+            assert mapped[key] == read[key], key
+
+@linuxOnly
+def test_read_closes_the_file(binaryFile):
+    buffers = magiccore.readBinaryFile(binaryFile)
+    assert binaryFile not in openedFiles()
+    ### and the export can write it again while the buffers are in use
+    magiccore.writeBinaryFile(binaryFile[:-len(magiccore.BINARY_EXTENSION)], buffers)
+    assert np.array_equal(magiccore.readBinaryFile(binaryFile)['co'], buffers['co'])
+
+@linuxOnly
+def test_open_unmaps_the_file_at_the_end(binaryFile):
+    with magiccore.openBinaryFile(binaryFile) as buffers:
+        assert binaryFile in openedFiles()
+        areaIndex = buffers['area_index'].copy()
+    assert binaryFile not in openedFiles()
+    assert len(areaIndex) == len(magiccore.readBinaryFile(binaryFile)['area_index'])
+
+def test_cut_file_is_refused(binaryFile):
+    with open(binaryFile, 'rb+') as f:
+        f.truncate(os.path.getsize(binaryFile) - 4096)
+    with pytest.raises(ValueError):
+        magiccore.readBinaryFile(binaryFile)
+    with pytest.raises(ValueError):
+        with magiccore.openBinaryFile(binaryFile):
+            pass
@@ -0,0 +1,69 @@
+#The incremental export gives the same bytes as a full export: the cache
+#rewrites the labels, or the records, of the faces that changed, and is
+#dropped when the geometry changes
+
+import copy
+
+import numpy as np
+import pytest
+
+from magiccore.pipeline import runExport
+
+def export(fileName, buffers, incremental):
+    timer = runExport(fileName, copy.deepcopy(buffers), {'incremental': incremental}, lambda stage, progress: None)
+    with open(fileName + "processed.json", 'rb') as f:
+        return f.read(), timer.counters.get('cached_export', 0)
+
+#export buffers with the cache of the previous export, and without cache
+def compare(tmpdir, buffers):
+    incremental, cached = export(str(tmpdir.join("inc")), buffers, True)
+    full = export(str(tmpdir.join("full")), buffers, False)[0]
+    return incremental == full, cached
+
+@pytest.fixture
+def cached(tmpdir, cell):
+    ### the first export fills the cache
+    assert compare(tmpdir, cell) == (True, 0)
+    assert compare(tmpdir, cell) == (True, 1)
+    return cell
+
+def test_label_only_edits(tmpdir, cached):
+    areas = cached['areas']
+    first = sorted(areas)[0]
+    areas[first]['area_label'] = 'Body'
+    areas[first]['area_content'] = 'changed content "quoted"'
+    areas[first]['area_color'] = [0.1, 0.2, 0.3, 1.0]
+    cached['modelname'] = 'cell renamed é'
+    assert compare(tmpdir, cached) == (True, 1)
+
+    ### faces moved from one area to another
+    areaIndex = cached['area_index']
+    marked = np.flatnonzero(areaIndex != 0)
+    areaIndex[marked[:5]] = np.unique(areaIndex[marked])[-1]
+    assert compare(tmpdir, cached) == (True, 1)
+
+    ### marked and unmarked faces, so the order of the faces changes
+    triangles = np.flatnonzero((areaIndex == 0) & (cached['loop_total'] == 3))
+    areaIndex[triangles[:50]] = areaIndex[marked[0]]
+    areaIndex[marked[:20]] = 0
+    assert compare(tmpdir, cached) == (True, 1)
+
+def test_reordered_areas(tmpdir, cached):
+    areas = cached['areas']
+    keys = sorted(areas, key=int)
+    assert len(keys) >= 2
+    ### the first two areas swap places, their faces follow them
+    first, second = areas[keys[0]], areas[keys[1]]
+    first['area_index'], second['area_index'] = second['area_index'], first['area_index']
+    areas[keys[0]], areas[keys[1]] = second, first
+    areaIndex = cached['area_index']
+    a, b = int(keys[0]) + 1, int(keys[1]) + 1
+    cached['area_index'] = np.where(areaIndex == a, b, np.where(areaIndex == b, a, areaIndex)).astype(areaIndex.dtype)
+    assert compare(tmpdir, cached) == (True, 1)
+
+def test_new_geometry_drops_the_cache(tmpdir, cached):
+    cached['co'] = cached['co'].copy()
+    cached['co'][0, 0] += 0.01
+    assert compare(tmpdir, cached) == (True, 0)
+    ### and the next export uses the new cache
+    assert compare(tmpdir, cached) == (True, 1)
@@ -0,0 +1,85 @@
+#The stageTimer: nested stages, counters, the profile modes and the json report
+
+import json
+import os
+import tracemalloc
+
+import pytest
+
+from magiccore.instrument import stageTimer, profileModes, PROFILE_ENV
+
+def test_stages_and_counters(tmpdir):
+    timer = stageTimer()
+    with timer.stage("export") as record:
+        with timer.stage("faces"):
+            pass
+        assert record['name'] == "export"
+    with timer.stage("faces"):
+        pass
+    timer.count('faces', 3)
+    timer.count('faces')
+    fileName = str(tmpdir.join("model.json"))
+    with open(fileName, 'w') as f:
+        f.write("12345")
+    timer.countFile(fileName)
+    timer.countFile(str(tmpdir.join("missing.json")))
+
+    assert [record['name'] for record in timer.stages] == ["export", "export/faces", "faces"]
+    assert timer.seconds("export") >= timer.seconds("export/faces")
+    assert timer.seconds("missing") == 0.0
+    assert timer.counters == {'faces': 4, 'bytes_written': 5}
+    summary = timer.summary()
+    assert "export " in summary and "faces " in summary and "export/faces" not in summary
+
+def test_timed():
+    timer = stageTimer()
+
+    @timer.timed("double")
+    def double(x):
+        return 2 * x
+
+    assert double(4) == 8 and double(1) == 2
+    assert [record['name'] for record in timer.stages] == ["double", "double"]
+
+def test_stage_is_timed_on_error():
+    timer = stageTimer()
+    with pytest.raises(KeyError):
+        with timer.stage("failing"):
+            raise KeyError("x")
+    with timer.stage("next"):
+        pass
+    ### the failed stage is closed, the next one isn't nested in it
+    assert [record['name'] for record in timer.stages] == ["failing", "next"]
+
+def test_profile_modes(monkeypatch):
+    monkeypatch.delenv(PROFILE_ENV, raising=False)
+    assert profileModes() == set()
+    assert profileModes("cProfile, ") == {"cprofile"}
+    assert profileModes("all") == {"cprofile", "tracemalloc"}
+    monkeypatch.setenv(PROFILE_ENV, "tracemalloc")
+    assert profileModes() == {"tracemalloc"}
+    ### the option wins over the environment
+    assert profileModes("cprofile") == {"cprofile"}
+    with pytest.raises(ValueError):
+        profileModes("perf")
+
+def test_report(tmpdir):
+    timer = stageTimer("all")
+    with timer.stage("outer"):
+        with timer.stage("inner"):
+            data = [list(range(100)) for _ in range(100)]
+    del data
+    fileName = str(tmpdir.join("celltimings.json"))
+    result = timer.writeReport(fileName)
+    assert not tracemalloc.is_tracing()
+
+    with open(fileName) as f:
+        saved = json.load(f)
+    assert saved == json.loads(json.dumps(result))
+    assert saved['profile'] == ["cprofile", "tracemalloc"]
+    assert saved['total'] >= saved['stages'][0]['seconds']
+    outer, inner = saved['stages']
+    assert outer['memory_peak'] >= inner['memory_peak'] > 0
+    assert saved['cprofile_stats'] == "cellprofile.prof"
+    assert os.path.exists(str(tmpdir.join("cellprofile.prof")))
+    assert saved['cprofile_top']
@@ -0,0 +1,68 @@
+#Label bookkeeping: the registry of the labels in use and the compaction plan,
+#on objects labelled from scratch and on objects merged with the scaffold
+
+import numpy as np
+import pytest
+
+from magiccore import labelKey, labelRegistry, planCompaction
+
+RED = (1.0, 0.0, 0.0, 1.0)
+GREEN = (0.0, 1.0, 0.0, 1.0)
+BLACK = (0.0, 0.0, 0.0, 0.0)
+
+def test_label_key_rounds_the_color():
+    assert labelKey("Heart", (0.123456, 0.5, 0.5, 1.0)) == labelKey("Heart", (0.12346, 0.5, 0.5, 1.0))
+    assert labelKey("Heart", RED) != labelKey("Heart", GREEN)
+
+def test_registry_skips_deleted_areas():
+    keys = [(0, labelKey("Heart", RED)), (2, labelKey("Heart", RED)), (3, labelKey("Lung", GREEN))]
+    assert labelRegistry(keys) == {labelKey("Heart", RED): 1, labelKey("Lung", GREEN): 2}
+
+#apply a compaction plan to the slots, areas and faces, like MAGIC_hotarea.compact
+def compact(areas, slotNames, materialIndex):
+    keys = [(areaIndex, labelKey(label, color)) for areaIndex, label, color in areas]
+    lookup, removedAreas, removedSlots = planCompaction(keys, slotNames, materialIndex)
+    areas = [area for position, area in enumerate(areas) if position not in removedAreas]
+    areas = [(int(lookup[areaIndex]) if areaIndex > 0 else 0, label, color) for areaIndex, label, color in areas]
+    slotNames = [name for slot, name in enumerate(slotNames) if slot not in removedSlots]
+    return areas, slotNames, lookup[np.asarray(materialIndex)].tolist()
+
+def test_merges_duplicates_and_drops_deleted_slots():
+    slotNames = ["mainbody", "Heart", "Lung", "Heart.001", "Liver"]
+    areas = [(1, "Heart", RED), (2, "Lung", GREEN), (3, "Heart", RED), (0, "Liver", GREEN)]
+    faces = [0, 1, 2, 3, 3, 0]
+    assert compact(areas, slotNames, faces) == (
+        [(1, "Heart", RED), (2, "Lung", GREEN)],
+        ["mainbody", "Heart", "Lung"],
+        [0, 1, 2, 1, 1, 0])
+
+def test_scaffold_areas_ahead_of_the_user_areas():
+    ### mergeObjects adds the scaffold slots and entries before the first label
+    slotNames = ["mainBody", "xzFace", "yzFace", "Heart", "Lung", "Heart.001", "Stomach"]
+    areas = [(0, "Scaffold", BLACK), (1, "Scaffold", BLACK), (2, "Scaffold", BLACK),
+             (3, "Heart", RED), (4, "Lung", GREEN), (5, "Heart", RED), (0, "Stomach", RED)]
+    faces = [0, 1, 2, 3, 4, 5, 5, 0]
+    assert compact(areas, slotNames, faces) == (
+        [(0, "Scaffold", BLACK), (1, "Scaffold", BLACK), (2, "Scaffold", BLACK),
+         (3, "Heart", RED), (4, "Lung", GREEN)],
+        ["mainBody", "xzFace", "yzFace", "Heart", "Lung"],
+        [0, 1, 2, 3, 4, 3, 3, 0])
+
+def test_slot_of_a_deleted_area_with_faces_is_kept():
+    slotNames = ["mainbody", "Heart", "Lung"]
+    areas = [(0, "Heart", RED), (2, "Lung", GREEN)]
+    assert compact(areas, slotNames, [1, 2]) == (areas, slotNames, [1, 2])
+
+def test_areas_without_a_slot_are_left_alone():
+    ### the layout of demo/cell.json: entries of an older scaffold, and slots of no area
+    slotNames = ["mainbody.014", "Mitochondrion.014", "Nucleolus.014", "mainBody.028", "xzFace.014",
+                 "yzFace.014", "mainBody.029", "xzFace", "yzFace", "South america", "South america.001"]
+    areas = [(1, "Mitochondrion", GREEN), (2, "Nucleolus", RED)] + [(0, "nothing", BLACK)] * 4
+    faces = [0, 1, 2, 4, 5]
+    assert compact(areas, slotNames, faces) == (areas, slotNames, faces)
+
+def test_slots_the_object_doesnt_have():
+    with pytest.raises(ValueError):
+        planCompaction([(4, labelKey("Heart", RED))], ["mainbody", "Heart"], [0, 1])
+    with pytest.raises(ValueError):
+        planCompaction([(1, labelKey("Heart", RED))], ["mainbody", "Heart"], [0, 2])
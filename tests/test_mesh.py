@@ -0,0 +1,108 @@
+#The mesh buffers the export builds from what it reads in Blender: the slots
+#of the materials, the areas of the faces and the scaffold points, and the
+#triangles the quads and n-gons are split into
+
+import numpy as np
+import pytest
+
+import magiccore
+from magiccore import buildExportBuffers, classifySlots, fanTriangles, triangulateBuffers
+
+#a quad and four triangles: a labelled face, a face painted with mainBody, the
+#xz quad and the yz triangle of the scaffold, and a face without a slot
+def meshBuffers():
+    co = np.array([[0, 0, 0], [1, 0, 0], [1, 0, 1], [0, 0, 1], [0, 1, 0], [0, 1, 1], [2, 2, 2]], dtype=np.float32)
+    return {'co': co,
+            'normal': np.zeros((5, 3), dtype=np.float32),
+            'loop_start': np.array([0, 3, 6, 10, 13], dtype=np.int32),
+            'loop_total': np.array([3, 3, 4, 3, 3], dtype=np.int32),
+            'vertices': np.array([0, 1, 6, 1, 2, 6, 0, 1, 2, 3, 0, 3, 5, 4, 5, 6], dtype=np.int32),
+            'material_index': np.array([1, 0, 2, 3, 5], dtype=np.int16)}
+
+SLOT_NAMES = ["mainBody", "Area.001", "xzFace", "yzFace.001"]
+MATERIAL_NAMES = ["mainBody", "Area.001", "xzFace", "yzFace.001"]
+
+def test_classify_slots():
+    mainBody, xzFace, yzFace = classifySlots(SLOT_NAMES, MATERIAL_NAMES, 6)
+    assert mainBody.tolist() == [True, False, False, False, False, False]
+    assert xzFace.tolist() == [False, False, True, False, False, False]
+    assert yzFace.tolist() == [False, False, False, True, False, False]
+    ### an empty slot, and the material of a slot decides xz and yz
+    mainBody, xzFace, yzFace = classifySlots(["mainBody.002", "empty", "slot"], ["Area", None, "xzFace.003"])
+    assert mainBody.tolist() == [True, False, False]
+    assert xzFace.tolist() == [False, False, True] and not yzFace.any()
+
+def test_export_buffers():
+    areas = {'0': {'area_label': "Body"}}
+    buffers = buildExportBuffers(meshBuffers(), SLOT_NAMES, MATERIAL_NAMES, areas, ["Area.001"], "model", "intro")
+    ### the mainBody face is not labelled, the other slots are areas
+    assert buffers['area_index'].tolist() == [1, 0, 2, 3, 5]
+    assert buffers['area_index'].dtype == np.int32
+    assert buffers['xz'] == [[0, 0, 0], [1, 0, 0], [1, 0, 1], [0, 0, 1]]
+    assert buffers['yz'] == [[0, 0, 0], [0, 0, 1], [0, 1, 1]]
+    assert (buffers['areas'], buffers['materials']) == (areas, ["Area.001"])
+    assert (buffers['modelname'], buffers['modeldescription']) == ("model", "intro")
+
+def test_export_buffers_without_faces():
+    buffers = meshBuffers()
+    for name in ('normal', 'loop_start', 'loop_total', 'material_index'):
+        buffers[name] = buffers[name][:0]
+    buffers['vertices'] = buffers['vertices'][:0]
+    buffers = buildExportBuffers(buffers, [], [], {}, [], "empty", "")
+    assert len(buffers['area_index']) == 0
+    assert buffers['xz'] == [] and buffers['yz'] == []
+
+def test_fan_triangles():
+    corners, polygon = fanTriangles([0, 3, 7, 12], [3, 4, 5, 2])
+    assert corners.tolist() == [[0, 1, 2], [3, 4, 5], [3, 5, 6], [7, 8, 9], [7, 9, 10], [7, 10, 11]]
+    ### a polygon of less than 3 loops has no triangle
+    assert polygon.tolist() == [0, 1, 1, 2, 2, 2]
+
+def triangleSurface(buffers):
+    points = buffers['co'][buffers['vertices']].reshape(-1, 3, 3).astype(np.float64)
+    return 0.5 * np.linalg.norm(np.cross(points[:, 1] - points[:, 0], points[:, 2] - points[:, 0]), axis=1)
+
+#a concave dart quad (surface 4 whichever vert it starts from) and a convex pentagon (surface 8)
+def polygonBuffers(start):
+    dart = np.array([[0, 0, 0], [4, 2, 0], [0, 1, 0], [-4, 2, 0]], dtype=np.float32)
+    pentagon = np.array([[10, 0, 0], [12, 0, 0], [13, 2, 0], [11, 3, 0], [9, 2, 0]], dtype=np.float32)
+    return {'co': np.vstack((np.roll(dart, -start, axis=0), pentagon)),
+            'normal': np.array([[0, 0, 1], [0, 0, 1]], dtype=np.float32),
+            'loop_start': np.array([0, 4], dtype=np.int32),
+            'loop_total': np.array([4, 5], dtype=np.int32),
+            'vertices': np.arange(9, dtype=np.int32),
+            'area_index': np.array([2, 0], dtype=np.int32)}
+
+def test_triangulate_polygons():
+    for start in range(4):
+        triangulated = triangulateBuffers(polygonBuffers(start))
+        assert triangulated['polygon'].tolist() == [0, 0, 1, 1, 1]
+        assert triangulated['area_index'].tolist() == [2, 2, 0, 0, 0]
+        assert triangulated['loop_start'].tolist() == [0, 3, 6, 9, 12]
+        assert (triangulated['loop_total'] == 3).all()
+        ### the two triangles of the dart stay inside it, whichever vert it starts from
+        surface = triangleSurface(triangulated)
+        assert surface[:2].sum() == pytest.approx(4.0)
+        assert surface[2:].sum() == pytest.approx(8.0)
+        normals = np.cross(*np.diff(triangulated['co'][triangulated['vertices']].reshape(-1, 3, 3), axis=1).transpose(1, 0, 2))
+        assert (normals[:, 2] > 0).all()
+
+def test_triangles_are_left_as_they_are(cellBuffers):
+    assert triangulateBuffers(cellBuffers) is cellBuffers
+
+def test_triangulated_export(cell):
+    ### two triangles of a face of the demo cell merged into a quad
+    cell['loop_total'] = cell['loop_total'].copy()
+    cell['loop_start'] = cell['loop_start'].copy()
+    first = int(np.flatnonzero(cell['area_index'] != 0)[0])
+    start = cell['loop_start'][first]
+    cell['vertices'] = np.insert(cell['vertices'], start + 3, cell['co'].shape[0])
+    cell['co'] = np.vstack((cell['co'], cell['co'][cell['vertices'][start:start + 3]].mean(axis=0) + 0.01))
+    cell['loop_total'][first] = 4
+    cell['loop_start'][first + 1:] += 1
+    processed = magiccore.buildProcessedData(magiccore.blenderReader(cell))
+    polygons = processed['polygons']
+    assert len(polygons) == len(processed['faces']) == len(cell['loop_total']) + 1
+    assert polygons.count(first) == 2
+    twins = [key for key, record in processed['faces'].items() if polygons[record['index']] == first]
+    assert processed['faces'][twins[0]]['label'] == processed['faces'][twins[1]]['label']
@@ -0,0 +1,261 @@
+#Online models and downloads against a models api and a file server on
+#localhost (http.server): streamed downloads, ETag revalidation, the offline
+#fallback, error statuses, resumed downloads and checksums
+
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+import numpy as np
+import pytest
+import requests
+
+import magiccore
+from magiccore import online
+from synthetic import makeSyntheticModel
+
+ARRAYS = ('co', 'normal', 'loop_start', 'loop_total', 'vertices', 'area_index')
+DATA = bytes(bytearray(range(256))) * 4096 + b'end'
+
+def modelsBody(buffers):
+    raw = json.dumps(magiccore.buildRawData(buffers))
+    payload = zlib.compress(json.dumps(raw).encode('utf-8'))
+    return json.dumps({'Body': {'type': 'Buffer', 'data': list(payload)}}).encode('ascii')
+
+class handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        state = self.server.state
+        state['requests'].append((self.path, dict(self.headers)))
+        if self.path.startswith('/api/models/'):
+            self.models(state)
+        else:
+            self.files(state)
+
+    def answer(self, status, body=b'', headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def models(self, state):
+        if state['status'] != 200:
+            self.answer(state['status'], b'{"error": "no such model"}')
+        elif self.headers.get('If-None-Match') == state['etag']:
+            self.answer(304)
+        else:
+            self.answer(200, state['body'], [('ETag', state['etag'])])
+
+    def files(self, state):
+        match = re.match(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        start = int(match.group(1)) if match else 0
+        if start >= len(DATA):
+            ### a part as long as the file or longer
+            headers = [('Content-Range', 'bytes */%d' % len(DATA))] if state['range'] else []
+            self.answer(416, b'', headers)
+            return
+        body = DATA[start:]
+        self.send_response(206 if match else 200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if state['cut'] > 0:
+            ### the connection drops a third of the way
+            state['cut'] -= 1
+            self.wfile.write(body[:len(body) // 3])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.server.state['requests'].append(('HEAD ' + self.path, dict(self.headers)))
+        self.send_response(200 if self.server.state['head'] else 501)
+        self.send_header('Content-Length', str(len(DATA)))
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+class threadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, clientAddress):
+        ### the connections dropped on purpose (cut, offline)
+        pass
+
+@pytest.fixture(scope="module")
+def model():
+    buffers = makeSyntheticModel(400, seed=3)
+    buffers['modelname'] = "synthetic"
+    buffers['modeldescription'] = "a bumpy surface"
+    return buffers, modelsBody(buffers)
+
+@pytest.fixture
+def server(monkeypatch, model):
+    server = threadingServer(('127.0.0.1', 0), handler)
+    server.state = {'requests': [], 'status': 200, 'etag': '"v1"', 'body': model[1], 'cut': 0,
+                    'range': True, 'head': True}
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%d' % server.server_address[1]
+    monkeypatch.setattr(online, 'MODELS_URL', url + '/api/models/')
+    ### a session of the test, with a single quick retry
+    monkeypatch.setattr(online, 'RETRIES', 1)
+    monkeypatch.setattr(online, '_session', None)
+    server.url = url
+    yield server
+    server.shutdown()
+    server.server_close()
+    online.getSession().close()
+
+#stop the server, and the connections the session keeps to it
+def goOffline(server):
+    server.shutdown()
+    server.server_close()
+    online.getSession().close()
+
+def assertSameModel(buffers, expected):
+    for name in ARRAYS:
+        assert np.array_equal(buffers[name], np.asarray(expected[name], dtype=buffers[name].dtype)), name
+    assert buffers['modelname'] == expected['modelname']
+
+def fetch(cacheDir):
+    stages = []
+    buffers = online.fetchOnlineModel("m1", str(cacheDir), stages.append)
+    return buffers, stages
+
+def test_streamed_download(tmpdir, server, model):
+    buffers, stages = fetch(tmpdir)
+    assertSameModel(buffers, model[0])
+    assert stages[0] == "downloading" and stages[-1] == "downloaded"
+    assert any(stage.endswith(" MB") for stage in stages)
+    ### decompressed into the cache, with its ETag
+    modelPath, etag = online.readCachedModel("m1", str(tmpdir))
+    assert etag == '"v1"'
+    assertSameModel(magiccore.readModelFile(modelPath), model[0])
+
+def test_not_modified_uses_the_cache(tmpdir, server, model):
+    fetch(tmpdir)
+    buffers, stages = fetch(tmpdir)
+    assert server.state['requests'][-1][1].get('If-None-Match') == '"v1"'
+    assert stages == ["downloading", "cached"]
+    assertSameModel(buffers, model[0])
+
+def test_changed_model_is_downloaded_again(tmpdir, server, model):
+    fetch(tmpdir)
+    server.state['etag'] = '"v2"'
+    buffers, stages = fetch(tmpdir)
+    assert stages[-1] == "downloaded"
+    assert online.readCachedModel("m1", str(tmpdir))[1] == '"v2"'
+
+def test_offline_falls_back_to_the_cache(tmpdir, server, model):
+    fetch(tmpdir)
+    goOffline(server)
+    buffers, stages = fetch(tmpdir)
+    assert stages[-1] == "offline, cached"
+    assertSameModel(buffers, model[0])
+
+def test_offline_without_cache_raises(tmpdir, server):
+    goOffline(server)
+    with pytest.raises(requests.ConnectionError):
+        fetch(tmpdir)
+
+def test_error_status_is_not_offline(tmpdir, server):
+    fetch(tmpdir)
+    server.state['status'] = 404
+    with pytest.raises(requests.HTTPError) as error:
+        fetch(tmpdir)
+    assert error.value.response.status_code == 404
+    server.state['status'] = 410
+    with pytest.raises(requests.HTTPError):
+        fetch(tmpdir)
+
+def test_download(tmpdir, server):
+    path = online.download_file(server.url + '/files/model.zip', str(tmpdir))
+    with open(path, 'rb') as f:
+        assert f.read() == DATA
+    assert os.path.basename(path).endswith("-model.zip")
+    ### already there, not downloaded again
+    count = len(server.state['requests'])
+    assert online.download_file(server.url + '/files/model.zip', str(tmpdir)) == path
+    assert len(server.state['requests']) == count
+
+def test_download_resumes_with_range(tmpdir, server):
+    url = server.url + '/files/model.zip'
+    ### what an interrupted download left behind
+    path = online.download_file(url, str(tmpdir.mkdir("first")))
+    partName = str(tmpdir.join(os.path.basename(path))) + ".part"
+    with open(partName, 'wb') as f:
+        f.write(DATA[:1000])
+    path = online.download_file(url, str(tmpdir))
+    assert server.state['requests'][-1][1].get('Range') == 'bytes=1000-'
+    with open(path, 'rb') as f:
+        assert f.read() == DATA
+    assert not os.path.exists(partName)
+
+def test_cut_download_is_resumed(tmpdir, server):
+    server.state['cut'] = 1
+    path = online.download_file(server.url + '/files/model.zip', str(tmpdir))
+    with open(path, 'rb') as f:
+        assert f.read() == DATA
+    ranges = [headers.get('Range') for _, headers in server.state['requests']]
+    assert ranges[0] is None and ranges[-1] is not None and ranges[-1].startswith('bytes=')
+
+def test_checksum(tmpdir, server):
+    url = server.url + '/files/model.zip'
+    digest = hashlib.sha256(DATA).hexdigest()
+    with pytest.raises(ValueError):
+        online.download_file(url, str(tmpdir), checksum="sha256:" + "0" * 64)
+    assert os.listdir(str(tmpdir)) == []
+    path = online.download_file(url, str(tmpdir), checksum="sha256:" + digest)
+    with open(path, 'rb') as f:
+        assert f.read() == DATA
+
+def leavePart(tmpdir, url, data):
+    path = online.download_file(url, str(tmpdir.mkdir("first")))
+    partName = str(tmpdir.join(os.path.basename(path))) + ".part"
+    with open(partName, 'wb') as f:
+        f.write(data)
+    return partName
+
+#the size of the file comes from the Content-Range of the 416, from a HEAD
+#request, or from nowhere
+SIZES = ({'range': True}, {'range': False}, {'range': False, 'head': False})
+
+def test_complete_part_is_kept(tmpdir, server):
+    url = server.url + '/files/model.zip'
+    for k, size in enumerate(SIZES[:2]):
+        server.state.update(size)
+        directory = tmpdir.mkdir(str(k))
+        leavePart(directory, url, DATA)
+        count = len(server.state['requests'])
+        path = online.download_file(url, str(directory))
+        with open(path, 'rb') as f:
+            assert f.read() == DATA
+        ### nothing was downloaded again, a HEAD request is not a download
+        assert all(path != '/files/model.zip' or headers.get('Range')
+                   for path, headers in server.state['requests'][count:])
+
+def test_wrong_size_part_is_downloaded_again(tmpdir, server):
+    url = server.url + '/files/model.zip'
+    for k, size in enumerate(SIZES):
+        server.state.update(size)
+        for data in (DATA + b'stale bytes', DATA):
+            if data == DATA and size.get('head') is not False:
+                continue
+            directory = tmpdir.mkdir(str(k) + str(len(data)))
+            partName = leavePart(directory, url, data)
+            path = online.download_file(url, str(directory))
+            with open(path, 'rb') as f:
+                assert f.read() == DATA
+            assert not os.path.exists(partName)
+            assert server.state['requests'][-1][1].get('Range') is None
@@ -0,0 +1,72 @@
+#The processed file written face by face: its sections, and its face records
+#pinned against the first exporter
+
+import json
+from collections import OrderedDict
+
+import magiccore
+from magiccore.processed import iterProcessedFaces, faceGeometry
+
+def writeCell(tmpdir, buffers):
+    reader = magiccore.blenderReader(magiccore.buildBlenderData(buffers))
+    fileAddress = str(tmpdir.join("cellprocessed.json"))
+    magiccore.writeProcessedFile(fileAddress, reader)
+    with open(fileAddress) as f:
+        text = f.read()
+    return reader, text
+
+def test_faces_section_matches_baseline(tmpdir, cellBuffers, baseline, baselineErrors):
+    processed = json.loads(writeCell(tmpdir, cellBuffers)[1], object_pairs_hook=OrderedDict)
+    assert list(processed) == ['modelName', 'modelIntro', 'calibration', 'areas', 'faces']
+    assert (processed['modelName'], processed['modelIntro']) == (baseline['modelName'], baseline['modelIntro'])
+    assert baselineErrors(processed['faces']) == []
+
+    ### the same fields in the same order, and nearFaces in increasing order
+    for key, want in baseline['samples'].items():
+        assert list(processed['faces'][key]) == list(want)
+    for record in processed['faces'].values():
+        nearFaces = list(record['nearFaces'].values())
+        assert nearFaces == sorted(nearFaces)
+        assert list(record['nearFaces']) == [str(k) for k in range(len(nearFaces))]
+
+def test_streamed_file_is_the_json_of_the_processed_data(tmpdir, cellBuffers):
+    reader, text = writeCell(tmpdir, cellBuffers)
+    assert text == json.dumps(magiccore.buildProcessedData(reader))
+
+def test_offsets_point_at_the_face_records(tmpdir, cellBuffers):
+    reader = magiccore.blenderReader(magiccore.buildBlenderData(cellBuffers))
+    fileAddress = str(tmpdir.join("cellprocessed.json"))
+    offsets = []
+    magiccore.writeProcessedFile(fileAddress, reader, offsets=offsets)
+    with open(fileAddress) as f:
+        text = f.read()
+    faces = json.loads(text)['faces']
+    assert len(offsets) == len(faces)
+    for i in (0, len(offsets) // 2, len(offsets) - 1):
+        start, normal, nearFaces, end = offsets[i]
+        assert json.loads(text[start:end]) == faces['face' + str(i)]
+        assert text[normal:].startswith('"normal": ')
+        assert text[nearFaces:].startswith(', "nearFaces": ')
+
+#the records are written with their keys in a fixed order, not the order of the
+#dicts (python 3.5 doesn't keep it)
+def test_face_records_are_written_in_a_fixed_order(tmpdir, cellBuffers):
+    reader, text = writeCell(tmpdir, cellBuffers)
+    faces = json.loads(text, object_pairs_hook=OrderedDict)['faces']
+    for key, record in iterProcessedFaces(reader):
+        written = faces[key]
+        assert list(written) == [name for name in ('marked', 'area_id', 'index', 'color', 'label', 'content',
+                                                   'normal', 'verts', 'nearFaces') if name in record]
+        assert list(written['verts']) == ['vert1', 'vert2', 'vert3']
+        assert all(list(point) == ['x', 'y', 'z'] for point in [written['normal']] + list(written['verts'].values()))
+        if record['marked']:
+            assert list(written['color']) == ['r', 'g', 'b']
+        assert list(written['nearFaces']) == [str(k) for k in range(len(record['nearFaces']))]
+
+def test_geometry_that_is_not_finite():
+    geometry = faceGeometry([float('nan'), 0.0, 1.5], [[float('inf'), 0.0, 0.0], [0.0, 0.0, 0.0], [1.0, 2.0, 3.0]])
+    assert geometry == json.dumps(OrderedDict([
+        ('normal', OrderedDict([('x', float('nan')), ('y', 0.0), ('z', 1.5)])),
+        ('verts', OrderedDict([('vert1', OrderedDict([('x', float('inf')), ('y', 0.0), ('z', 0.0)])),
+                               ('vert2', OrderedDict([('x', 0.0), ('y', 0.0), ('z', 0.0)])),
+                               ('vert3', OrderedDict([('x', 1.0), ('y', 2.0), ('z', 3.0)]))]))]))[1:-1]
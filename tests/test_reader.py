@@ -0,0 +1,76 @@
+#The faceTable of a blenderReader and its blenderFace views, read from the mesh
+#buffers or from the lists of buildBlenderData
+
+import numpy as np
+import pytest
+
+import magiccore
+from magiccore.transform import solve_point, solve_normal
+
+@pytest.fixture(scope="module")
+def reader(cellBuffers):
+    return magiccore.blenderReader(cellBuffers)
+
+def test_marked_faces_first(reader, cellBuffers):
+    faces = reader.faces
+    areaIndex = np.asarray(cellBuffers['area_index'])
+    assert faces.markedCount == np.count_nonzero(areaIndex)
+    assert (faces.area_id[:faces.markedCount] >= 0).all() and (faces.area_id[faces.markedCount:] < 0).all()
+    ### in the order of the mesh inside each group
+    marked = faces.blender_index[:faces.markedCount]
+    assert np.array_equal(marked, np.flatnonzero(areaIndex))
+    assert np.array_equal(faces.area_id[:faces.markedCount], areaIndex[marked] - 1)
+    assert len(reader.markedFaces) + len(reader.unmarkedFaces) == len(faces)
+
+def test_face_views(reader, cellBuffers):
+    faces = reader.faces
+    for index in (0, faces.markedCount - 1, faces.markedCount, len(faces) - 1):
+        face = faces[index]
+        blenderIndex = int(face.blender_index)
+        start = cellBuffers['loop_start'][blenderIndex]
+        loops = cellBuffers['vertices'][start:start + cellBuffers['loop_total'][blenderIndex]]
+        assert np.allclose(face.verts, cellBuffers['co'][loops])
+        assert np.allclose(face.normal, cellBuffers['normal'][blenderIndex])
+        ### transformed the way the first exporter did it, one point at a time
+        assert np.allclose(face.vertsConverted, [solve_point(vert, reader.transMtx) for vert in face.verts],
+                           rtol=0, atol=1e-9)
+        assert np.allclose(face.normalConverted, solve_normal(face.normal, reader.transMtx), rtol=0, atol=1e-9)
+        assert face.polygon == blenderIndex
+        if face.marked:
+            area = cellBuffers['areas'][face.area_id]
+            assert (face.label, face.content, face.gesture) == (area['area_label'], area['area_content'],
+                                                                area['area_gesture'])
+            assert face.blender_color == [x * 255 for x in area['area_color']]
+        else:
+            assert (face.area, face.area_id, face.label, face.content, face.blender_color) == \
+                (None, None, "unmarked", "null", None)
+
+def test_indexing(reader):
+    faces = reader.faces
+    assert faces[-1].index == len(faces) - 1
+    with pytest.raises(IndexError):
+        faces[len(faces)]
+    assert sum(1 for _ in faces) == len(faces)
+
+def test_related_faces_share_a_vertex(reader, cellBuffers):
+    faces = reader.faces
+    row = {int(index): i for i, index in enumerate(faces.blender_index)}
+    def vertexSet(face):
+        start = cellBuffers['loop_start'][face]
+        return set(cellBuffers['vertices'][start:start + cellBuffers['loop_total'][face]].tolist())
+    for index in range(0, len(faces), 211):
+        face = faces[index]
+        related = face.relatedFaces
+        ### the face is related to itself, as in the first exporter
+        blenderIndex = int(face.blender_index)
+        expected = sorted(row[other] for other in row if vertexSet(other) & vertexSet(blenderIndex))
+        assert related == expected
+
+def test_tables_of_buffers_and_lists_agree(reader, cellBuffers):
+    listed = magiccore.blenderReader(magiccore.buildBlenderData(cellBuffers)).faces
+    faces = reader.faces
+    assert np.array_equal(listed.blender_index, faces.blender_index)
+    assert np.allclose(listed.verts_converted, faces.verts_converted, rtol=0, atol=1e-9)
+    assert np.array_equal(listed.related_offsets, faces.related_offsets)
+    assert np.array_equal(listed.related, faces.related)
+    assert [face.label for face in listed] == [face.label for face in faces]
@@ -0,0 +1,65 @@
+#The face grid finds the same face as going through every face, for points
+#close to the surface and anywhere around the model, one at a time or all at once
+
+import numpy as np
+import pytest
+
+import magiccore
+from magiccore.spatial import buildFaceGrid, tableFaceGrid, readFaceGrid, triangleDistance
+from bench_grid import queryPoints
+from synthetic import makeSyntheticModel
+
+def bruteNearest(grid, points):
+    distance = np.array([triangleDistance(point, grid.triangles) for point in points])
+    faces = distance.argmin(axis=1)
+    return faces, distance[np.arange(len(points)), faces]
+
+def checkGrid(grid, count):
+    for kind, points in queryPoints(grid.triangles, count).items():
+        faces, labels, distances = grid.nearestMany(points)
+        bruteFaces, bruteDistances = bruteNearest(grid, points)
+        assert np.allclose(distances, bruteDistances, rtol=0, atol=1e-12), kind
+        ### another face only on a tie
+        other = np.flatnonzero(np.asarray(faces) != bruteFaces)
+        assert np.allclose(triangleDistance(points[other][:, None, :], grid.triangles[np.asarray(faces)[other]]),
+                           bruteDistances[other], rtol=0, atol=1e-12), kind
+        assert labels == [grid.labels[grid.faceLabel[face]] for face in faces]
+        ### one point at a time gives the same answers
+        for i in range(0, len(points), 37):
+            assert grid.nearest(points[i]) == (faces[i], labels[i], distances[i])
+
+def test_cell(cell):
+    checkGrid(tableFaceGrid(magiccore.blenderReader(cell).faces), 300)
+
+def test_synthetic():
+    grid = tableFaceGrid(magiccore.blenderReader(makeSyntheticModel(20000, seed=2)).faces)
+    checkGrid(grid, 200)
+
+def test_query_blocks(monkeypatch, cell):
+    grid = tableFaceGrid(magiccore.blenderReader(cell).faces)
+    points = queryPoints(grid.triangles, 100)['box']
+    whole = grid.nearestMany(points)
+    monkeypatch.setattr(magiccore.spatial, 'QUERY_BLOCK', 7)
+    assert grid.nearestMany(points) == whole
+
+def test_save_and_read(tmpdir, cell):
+    grid = tableFaceGrid(magiccore.blenderReader(cell).faces)
+    fileName = str(tmpdir.join("cellgrid.npz"))
+    grid.save(fileName)
+    read = readFaceGrid(fileName)
+    points = queryPoints(grid.triangles, 50)['surface']
+    assert read.nearestMany(points) == grid.nearestMany(points)
+    assert np.array_equal(read.faceIds, grid.faceIds) and read.labels == grid.labels
+    assert readFaceGrid(str(tmpdir.join("missing.npz"))) is None
+
+def test_empty_grid():
+    grid = buildFaceGrid(np.zeros((0, 3, 3)), [], [], ["nolabel"])
+    assert len(grid) == 0
+    assert grid.nearest((1.0, 2.0, 3.0)) == (-1, None, float('inf'))
+    assert grid.nearestMany(np.zeros((2, 3))) == ([-1, -1], [None, None], [float('inf')] * 2)
+
+def test_single_face():
+    grid = buildFaceGrid([[[0, 0, 0], [1, 0, 0], [0, 1, 0]]], [4], [1], ["nolabel", "m_body"])
+    face, label, distance = grid.nearest((0.25, 0.25, 2.0))
+    assert (face, label) == (0, "m_body") and distance == pytest.approx(2.0)
+    assert grid.nearest((2.0, 0.0, 0.0))[2] == pytest.approx(1.0)
@@ -0,0 +1,95 @@
+#Incremental decoding of the online models: the byte list of the models api,
+#the json string wrapping and the raw model parser, fed in chunks of any size
+
+import json
+import random
+import zlib
+
+import numpy as np
+import pytest
+
+import magiccore
+from magiccore.online import iterBodyBytes, decodeOnlineModel
+from magiccore.stream import iterJsonString, parseRawModel
+import fixtures
+from synthetic import makeSyntheticModel
+
+ARRAYS = ('co', 'normal', 'loop_start', 'loop_total', 'vertices', 'area_index')
+
+#text or bytes in chunks of random sizes up to size
+def chunked(data, size, seed=0):
+    rng = random.Random(seed)
+    start = 0
+    while start < len(data):
+        end = start + rng.randint(1, size)
+        yield data[start:end]
+        start = end
+
+def assertSameBuffers(buffers, expected, skip=()):
+    for name in ARRAYS:
+        assert buffers[name].dtype == expected[name].dtype, name
+        assert np.array_equal(buffers[name], expected[name]), name
+    for key in ('areas', 'materials', 'xz', 'yz', 'modelname', 'modeldescription'):
+        if key not in skip:
+            assert json.dumps(buffers[key], sort_keys=True) == json.dumps(expected[key], sort_keys=True), key
+
+@pytest.fixture(scope="module")
+def cellText():
+    with open(fixtures.CELL, encoding='utf-8') as f:
+        return f.read()
+
+def body(values):
+    return json.dumps({'Body': {'type': 'Buffer', 'data': values}}).encode('ascii')
+
+@pytest.mark.parametrize("size", [1, 3, 64, 1 << 16])
+def test_body_bytes_in_chunks(size):
+    payload = bytes(bytearray(random.Random(1).randrange(256) for _ in range(5000)))
+    assert b''.join(iterBodyBytes(chunked(body(list(payload)), size))) == payload
+
+@pytest.mark.parametrize("values", [[1, 256, 3], [1, -1, 3], [300] * 10])
+def test_body_bytes_out_of_range(values):
+    with pytest.raises(ValueError):
+        b''.join(iterBodyBytes(chunked(body(values), 7)))
+
+def test_body_bytes_not_ints():
+    with pytest.raises(ValueError):
+        b''.join(iterBodyBytes([b'{"Body": {"data": [1, 2.5, 3]}}']))
+    with pytest.raises(ValueError):
+        b''.join(iterBodyBytes([b'{"Body": {"data": [1, 2, 3']))
+
+@pytest.fixture(scope="module")
+def smallText():
+    buffers = makeSyntheticModel(60, seed=4)
+    buffers['modelname'] = 'café \U0001F600 "quoted" \\ end'
+    buffers['modeldescription'] = "small"
+    return json.dumps(magiccore.buildRawData(buffers))
+
+@pytest.mark.parametrize("size", [1, 3, 13])
+def test_raw_model_in_small_chunks(smallText, size):
+    assertSameBuffers(parseRawModel(chunked(smallText, size)), magiccore.readRawData(json.loads(smallText)))
+
+@pytest.mark.parametrize("size", [1000, 1 << 20])
+def test_raw_model_in_chunks(cellText, size):
+    assertSameBuffers(parseRawModel(chunked(cellText, size)), magiccore.readModelFile(fixtures.CELL))
+
+@pytest.mark.parametrize("size", [1, 3, 13, 4096])
+def test_json_string_in_chunks(smallText, size):
+    data = json.loads(smallText)
+    ### faces and vertices in any order
+    for section in ('faces', 'vertices'):
+        items = list(data[section].items())
+        random.Random(2).shuffle(items)
+        data[section] = dict(items)
+    encoded = json.dumps(json.dumps(data, separators=(',', ':')))
+    buffers = parseRawModel(iterJsonString(chunked(encoded, size, seed=size)))
+    assertSameBuffers(buffers, magiccore.readRawData(json.loads(smallText)))
+    assert buffers['modelname'] == 'café \U0001F600 "quoted" \\ end'
+
+def test_online_model(cellText):
+    payload = zlib.compress(json.dumps(cellText).encode('utf-8'))
+    assertSameBuffers(decodeOnlineModel(body(list(payload))), magiccore.readModelFile(fixtures.CELL))
+
+def test_broken_raw_model(cellText):
+    for text in (cellText[:-100], '{"a": 1}'):
+        with pytest.raises(ValueError):
+            parseRawModel(chunked(text, 50))